@@ -20,7 +20,8 @@ import pandas as pd
 import lightgbm as lgb
 from azureml.core import Run
 from sklearn.model_selection import train_test_split
-from fclib.feature_engineering.feature_utils import week_of_month, df_from_cartesian_product, combine_features
+from fclib.feature_engineering.feature_utils import week_of_month, df_from_cartesian_product, grouped_lag_features
+from fclib.feature_engineering.cache import FeatureCache
 
 
 FIRST_WEEK = 40
@@ -100,14 +101,13 @@ def create_features(pred_round, train_dir, lags, window_size, used_columns):
     )
     data_filled["year"] = data_filled["week_start"].apply(lambda x: x.year)
     data_filled["month"] = data_filled["week_start"].apply(lambda x: x.month)
-    data_filled["week_of_month"] = data_filled["week_start"].apply(lambda x: week_of_month(x))
+    data_filled["week_of_month"] = week_of_month(data_filled["week_start"])
     data_filled["day"] = data_filled["week_start"].apply(lambda x: x.day)
     data_filled.drop("week_start", axis=1, inplace=True)
 
     # Create other features (lagged features, moving averages, etc.)
-    features = data_filled.groupby(["store", "brand"]).apply(
-        lambda x: combine_features(x, ["move"], lags, window_size, used_columns)
-    )
+    lag_fea = grouped_lag_features(data_filled, ["store", "brand"], "week", ["move"], lags, window_size)
+    features = pd.concat([data_filled[used_columns], lag_fea], axis=1)
 
     # Drop rows with NaN values
     features.dropna(inplace=True)
@@ -144,6 +144,13 @@ if __name__ == "__main__":
     parser.add_argument(
         "--window-size", type=int, dest="window_size", default=10, help="window size of moving average of unit sales"
     )
+    parser.add_argument(
+        "--feature-cache",
+        type=str,
+        dest="feature_cache",
+        default=None,
+        help="directory of a feature cache shared by the trials",
+    )
     args = parser.parse_args()
     args.feature_fraction = round(args.feature_fraction, 2)
     args.bagging_fraction = round(args.bagging_fraction, 2)
@@ -241,14 +248,28 @@ if __name__ == "__main__":
     )
     data_filled["year"] = data_filled["week_start"].apply(lambda x: x.year)
     data_filled["month"] = data_filled["week_start"].apply(lambda x: x.month)
-    data_filled["week_of_month"] = data_filled["week_start"].apply(lambda x: week_of_month(x))
+    data_filled["week_of_month"] = week_of_month(data_filled["week_start"])
     data_filled["day"] = data_filled["week_start"].apply(lambda x: x.day)
     data_filled.drop("week_start", axis=1, inplace=True)
 
     # Create other features (lagged features, moving averages, etc.)
-    features = data_filled.groupby(["store", "brand"]).apply(
-        lambda x: combine_features(x, ["move"], lags, args.window_size, used_columns)
-    )
+    def lag_features(df):
+        return grouped_lag_features(df, ["store", "brand"], "week", ["move"], lags, args.window_size)
+
+    if args.feature_cache is not None:
+        cache = FeatureCache(args.feature_cache)
+        spec = {"lags": lags.tolist(), "window_size": args.window_size}
+        lag_fea = cache.compute_by_block(
+            data_filled[["store", "brand", "week", "move"]],
+            "week",
+            spec,
+            lag_features,
+            block_size=13,
+            history=args.max_lag + args.window_size + 2,
+        )
+    else:
+        lag_fea = lag_features(data_filled)
+    features = pd.concat([data_filled[used_columns], lag_fea], axis=1)
     train_fea = features[features.week <= TRAIN_END_WEEK_LIST[r]].reset_index(drop=True)
 
     # Drop rows with NaN values
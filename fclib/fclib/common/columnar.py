@@ -0,0 +1,162 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains functions for storing dataframes as directories of per-column .npy
+files, which can be read back quickly, column by column and memory-mapped.
+
+A directory contains a manifest.json that records the column names, the kind of each
+column and the index, and one file per column named by its position, e.g. col_0.npy.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+MANIFEST_FILE = "manifest.json"
+
+
+def save_columnar(df, path):
+    """Save a dataframe as a directory of per-column .npy files.
+
+    Numeric, boolean and timezone-naive datetime columns are stored as they are, string
+    columns as fixed-width unicode arrays with a mask of their missing values (None or NaN,
+    which are loaded as NaN), and categorical columns as codes with the categories in the
+    manifest. A RangeIndex is recorded in the manifest, other indexes are stored like columns.
+
+    Args:
+        df (pd.DataFrame): Dataframe to save
+        path (str): Path of the output directory, which is created if it does not exist
+
+    Returns:
+        int: Total number of bytes written
+
+    Raises:
+        ValueError: if a column is timezone-aware, or has the object type but values other than
+            strings and missing values
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = {"n_rows": len(df), "columns": [], "index": []}
+    n_bytes = 0
+
+    for i, name in enumerate(df.columns):
+        entry, n = _save_array(df[name], os.path.join(path, "col_{}.npy".format(i)))
+        entry["name"] = name
+        manifest["columns"].append(entry)
+        n_bytes += n
+
+    if isinstance(df.index, pd.RangeIndex):
+        manifest["range_index"] = _range_params(df.index)
+    else:
+        for i in range(df.index.nlevels):
+            level = pd.Series(df.index.get_level_values(i))
+            entry, n = _save_array(level, os.path.join(path, "index_{}.npy".format(i)))
+            entry["name"] = df.index.names[i]
+            manifest["index"].append(entry)
+            n_bytes += n
+
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+    return n_bytes + os.path.getsize(os.path.join(path, MANIFEST_FILE))
+
+
+def load_columnar(path, columns=None, mmap_mode=None, rows=None):
+    """Load a dataframe saved with save_columnar.
+
+    Args:
+        path (str): Path of the directory
+        columns (list[str]): Names of the columns to load. Default value None loads all the columns.
+        mmap_mode (str): Memory-map mode of np.load, e.g. "r" to read the columns lazily
+            from disk instead of loading them into memory
+        rows (slice): Range of rows to load. With a memory-map mode, only the pages of these
+            rows are read from disk. Default value None loads all the rows.
+
+    Returns:
+        pd.DataFrame: The loaded dataframe
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    entries = manifest["columns"]
+    if columns is not None:
+        by_name = {entry["name"]: (i, entry) for i, entry in enumerate(entries)}
+        missing = [c for c in columns if c not in by_name]
+        if missing:
+            raise KeyError("Columns {} are not stored in {}".format(missing, path))
+        selected = [by_name[c] for c in columns]
+    else:
+        selected = list(enumerate(entries))
+
+    data = {}
+    for i, entry in selected:
+        data[entry["name"]] = _load_array(entry, os.path.join(path, "col_{}.npy".format(i)), mmap_mode, rows)
+
+    if "range_index" in manifest:
+        index = pd.RangeIndex(*manifest["range_index"])
+        if rows is not None:
+            index = index[rows]
+    else:
+        levels = [
+            _load_array(entry, os.path.join(path, "index_{}.npy".format(i)), mmap_mode, rows)
+            for i, entry in enumerate(manifest["index"])
+        ]
+        names = [entry["name"] for entry in manifest["index"]]
+        if len(levels) == 1:
+            index = pd.Index(levels[0], name=names[0])
+        else:
+            index = pd.MultiIndex.from_arrays(levels, names=names)
+
+    return pd.DataFrame(data, index=index, columns=[entry["name"] for _, entry in selected])
+
+
+def _range_params(index):
+    """Start, stop and step of a RangeIndex, which older versions of pandas expose as _start, ..."""
+    return [int(getattr(index, name if hasattr(index, name) else "_" + name)) for name in ["start", "stop", "step"]]
+
+
+def _save_array(series, file_name):
+    """Save the values of a Series to an .npy file and return its manifest entry and size."""
+    if pd.api.types.is_categorical_dtype(series):
+        entry = {"kind": "category", "categories": series.cat.categories.tolist(), "ordered": bool(series.cat.ordered)}
+        values = series.cat.codes.values
+    elif pd.api.types.is_datetime64tz_dtype(series):
+        raise ValueError("Timezone-aware column {} is not supported".format(series.name))
+    elif series.dtype == object:
+        if pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+            raise ValueError("Object column {} has values other than strings".format(series.name))
+        entry = {"kind": "string"}
+        missing = series.isnull().values
+        values = np.where(missing, "", series.values).astype(str)
+        if missing.any():
+            entry["missing"] = True
+            np.save(_missing_file(file_name), missing, allow_pickle=False)
+    else:
+        entry = {"kind": "array"}
+        values = series.values
+    np.save(file_name, values, allow_pickle=False)
+    n_bytes = os.path.getsize(file_name)
+    if entry.get("missing"):
+        n_bytes += os.path.getsize(_missing_file(file_name))
+    return entry, n_bytes
+
+
+def _load_array(entry, file_name, mmap_mode, rows=None):
+    """Load an array saved with _save_array."""
+    values = np.load(file_name, mmap_mode=mmap_mode, allow_pickle=False)
+    if rows is not None:
+        values = values[rows]
+    if entry["kind"] == "category":
+        return pd.Categorical.from_codes(values, entry["categories"], ordered=entry["ordered"])
+    elif entry["kind"] == "string":
+        values = values.astype(object)
+        if entry.get("missing"):
+            missing = np.load(_missing_file(file_name), mmap_mode=mmap_mode, allow_pickle=False)
+            values[missing if rows is None else missing[rows]] = np.nan
+        return values
+    return values
+
+
+def _missing_file(file_name):
+    """Name of the .npy file of the mask of missing values of a string column."""
+    return os.path.splitext(file_name)[0] + "_missing.npy"
@@ -0,0 +1,141 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains a dense in-memory representation of many time series that share a time
+axis, which is an alternative to long-format dataframes where every consumer filters the
+rows of each time series with boolean masks.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class TimeSeriesPanel:
+    """Dense panel of time series with a (series x time x feature) array.
+
+    The values of all the series are stored in one contiguous array, where missing time
+    steps of a series are NaN. Looking up a series by its key is a hash lookup, and slicing
+    the time axis returns a panel that is a view of the same array.
+
+    Example:
+        panel = TimeSeriesPanel.from_long(df, ["store", "brand"], "week", ["move", "price"])
+        move = panel.series((2, 1))[:, panel.feature_position("move")]
+        train = panel.time_slice(40, 135)
+        df_train = train.to_long()
+
+    Args:
+        values (np.array): Array of shape (# of series, # of time steps, # of features)
+        series_index (pd.Index): Keys of the series, a MultiIndex for several key columns, whose
+            names are the key column names
+        time_index (pd.Index): Time steps, whose name is the time column name
+        feature_names (list[str]): Names of the features
+    """
+
+    def __init__(self, values, series_index, time_index, feature_names):
+        if values.shape != (len(series_index), len(time_index), len(feature_names)):
+            raise ValueError("Shape of the values does not match the series, time and feature indexes.")
+        self.values = values
+        self.series_index = series_index
+        self.time_index = time_index
+        self.feature_names = list(feature_names)
+
+    @classmethod
+    def from_long(cls, df, series_cols, time_col, value_cols=None, dtype=np.float64, sort=True):
+        """Create a panel from a dataframe in long format, e.g. from specify_data_schema.
+
+        Args:
+            df (pd.DataFrame): Time series data with one row for each series and time step
+            series_cols (list[str]): Names of the columns that identify each time series
+            time_col (str): Name of the time column
+            value_cols (list[str]): Names of the feature columns, which must be numeric. Default
+                value None uses all the numeric columns other than series_cols and time_col.
+            dtype (type): Data type of the values
+            sort (bool): Whether to order the series by their keys or by first appearance
+
+        Returns:
+            TimeSeriesPanel: The panel, whose time steps are the sorted distinct values of time_col
+
+        Raises:
+            ValueError: if some value column is not numeric, or if df contains more than one row
+                for some series and time step
+        """
+        series_cols = list(series_cols)
+        if value_cols is None:
+            value_cols = [
+                c
+                for c in df.columns
+                if c not in series_cols and c != time_col and pd.api.types.is_numeric_dtype(df[c])
+            ]
+        non_numeric = [c for c in value_cols if not pd.api.types.is_numeric_dtype(df[c])]
+        if non_numeric:
+            raise ValueError("Value column {} is not numeric.".format(non_numeric[0]))
+        keys = pd.MultiIndex.from_arrays([df[c].values for c in series_cols], names=series_cols)
+        series_codes, series_index = keys.factorize(sort=sort)
+        levels = [series_index.get_level_values(i) for i in range(len(series_cols))]
+        if len(series_cols) == 1:
+            series_index = pd.Index(levels[0], name=series_cols[0])
+        else:
+            series_index = pd.MultiIndex.from_arrays(levels, names=series_cols)
+        time_codes, time_index = pd.factorize(df[time_col].values, sort=True)
+        time_index = pd.Index(time_index, name=time_col)
+
+        position = series_codes.astype(np.int64) * len(time_index) + time_codes
+        if len(np.unique(position)) != len(position):
+            raise ValueError("Input dataframe contains more than one row for some series and time steps.")
+        values = np.full((len(series_index) * len(time_index), len(value_cols)), np.nan, dtype=dtype)
+        for j, c in enumerate(value_cols):
+            values[position, j] = df[c].values
+        values = values.reshape(len(series_index), len(time_index), len(value_cols))
+        return cls(values, series_index, time_index, value_cols)
+
+    def to_long(self, dropna=True):
+        """Convert the panel to a dataframe in long format, ordered by series and time.
+
+        Args:
+            dropna (bool): Whether to drop the time steps where all the features are missing
+
+        Returns:
+            pd.DataFrame: Dataframe with the series key columns, the time column and the features
+        """
+        n_series, n_times, n_features = self.values.shape
+        values = self.values.reshape(n_series * n_times, n_features)
+        rows = np.arange(n_series * n_times)
+        if dropna:
+            rows = rows[~np.isnan(values).all(axis=1)]
+        series, times = np.divmod(rows, n_times)
+
+        df = pd.DataFrame()
+        for i, name in enumerate(self.series_index.names):
+            df[name] = self.series_index.get_level_values(i).values[series]
+        df[self.time_index.name] = self.time_index.values[times]
+        for j, name in enumerate(self.feature_names):
+            df[name] = values[rows, j]
+        return df
+
+    @property
+    def shape(self):
+        """(# of series, # of time steps, # of features)"""
+        return self.values.shape
+
+    def series_position(self, key):
+        """Position of the series with the given key, e.g. (store, brand)."""
+        return self.series_index.get_loc(key)
+
+    def feature_position(self, name):
+        """Position of the feature with the given name."""
+        return self.feature_names.index(name)
+
+    def series(self, key):
+        """Values of the series with the given key, a (time x feature) view of the panel."""
+        return self.values[self.series_position(key)]
+
+    def feature(self, name):
+        """Values of the feature with the given name, a (series x time) view of the panel."""
+        return self.values[:, :, self.feature_position(name)]
+
+    def time_slice(self, start=None, stop=None):
+        """Panel of the time steps between start and stop, both included, which is a view of
+        this panel."""
+        times = self.time_index.slice_indexer(start, stop)
+        return TimeSeriesPanel(self.values[:, times], self.series_index, self.time_index[times], self.feature_names)
@@ -9,6 +9,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 
+from fclib.common.panel import TimeSeriesPanel
+
 
 def plot_predictions_with_history(
     predictions,
@@ -31,11 +33,13 @@ def plot_predictions_with_history(
     """Plot prediction results with historical values
 
     Args:
-        predictions (pd.DataFrame): Prediction results with a time step column (e.g., week_index), a 
-            forecasted value column (e.g., forecasted sales of each store-brand), and two columns that 
-            identify each individual time series (e.g., store_id and brand_id) 
-        history (pd.Dataframe): A dataframe containing historical values of the prediction target, a 
-            time step column, and two columns that specify each time series
+        predictions (pd.DataFrame or TimeSeriesPanel): Prediction results with a time step column (e.g.,
+            week_index), a forecasted value column (e.g., forecasted sales of each store-brand), and two
+            columns that identify each individual time series (e.g., store_id and brand_id), or a panel
+            of (grain1, grain2) series with the forecasted value feature
+        history (pd.Dataframe or TimeSeriesPanel): A dataframe containing historical values of the
+            prediction target, a time step column, and two columns that specify each time series, or a
+            panel of (grain1, grain2) series with the target feature
         grain1_unique_vals (list): Unique values of the 1st column indicating the granularity of
             the time series data (e.g, store_list)
         grain2_unique_vals (list): Unique values of the 2nd column indicating the granularity of
@@ -60,7 +64,10 @@ def plot_predictions_with_history(
 
     grain_combinations = list(itertools.product(grain1_unique_vals, grain2_unique_vals))
     sample_grain_combinations = random.sample(grain_combinations, num_samples)
-    max_timestep = max(predictions[time_col_name].unique())
+    if isinstance(predictions, TimeSeriesPanel):
+        max_timestep = predictions.time_index.max()
+    else:
+        max_timestep = max(predictions[time_col_name].unique())
 
     fig, axes = plt.subplots(nrows=math.ceil(num_samples / 2), ncols=2, figsize=(15, 5 * math.ceil(num_samples / 2)))
     if axes.ndim == 1:
@@ -72,21 +79,18 @@ def plot_predictions_with_history(
         for col in row:
             if sample_id < len(sample_grain_combinations):
                 [grain1_id, grain2_id] = sample_grain_combinations[sample_id]
-                history_sub = history.loc[
-                    (history[grain1_name] == grain1_id)
-                    & (history[grain2_name] == grain2_id)
-                    & (history[time_col_name] <= max_timestep)
-                    & (history[time_col_name] >= min_timestep)
-                ]
-                predictions_sub = predictions.loc[
-                    (predictions[grain1_name] == grain1_id)
-                    & (predictions[grain2_name] == grain2_id)
-                    & (predictions[time_col_name] >= min_timestep)
-                ]
-                col.plot(history_sub[time_col_name], history_sub[target_col_name], marker="o")
+                history_time, history_value = _series_values(
+                    history, grain1_name, grain2_name, grain1_id, grain2_id, time_col_name, target_col_name
+                )
+                in_range = (history_time <= max_timestep) & (history_time >= min_timestep)
+                predictions_time, predictions_value = _series_values(
+                    predictions, grain1_name, grain2_name, grain1_id, grain2_id, time_col_name, target_col_name
+                )
+                in_prediction_range = predictions_time >= min_timestep
+                col.plot(history_time[in_range], history_value[in_range], marker="o")
                 col.plot(
-                    predictions_sub[time_col_name],
-                    predictions_sub[target_col_name],
+                    predictions_time[in_prediction_range],
+                    predictions_value[in_prediction_range],
                     linestyle="--",
                     marker="^",
                     color="red",
@@ -102,3 +106,15 @@ def plot_predictions_with_history(
             else:
                 col.axis("off")
     plt.tight_layout()
+
+
+def _series_values(data, grain1_name, grain2_name, grain1_id, grain2_id, time_col_name, target_col_name):
+    """Time steps and target values of the (grain1_id, grain2_id) time series of a dataframe or a panel."""
+    if isinstance(data, TimeSeriesPanel):
+        if (grain1_id, grain2_id) not in data.series_index:
+            return np.array([]), np.array([])
+        values = data.series((grain1_id, grain2_id))[:, data.feature_position(target_col_name)]
+        observed = ~np.isnan(values)
+        return data.time_index.values[observed], values[observed]
+    rows = (data[grain1_name] == grain1_id) & (data[grain2_name] == grain2_id)
+    return data.loc[rows, time_col_name].values, data.loc[rows, target_col_name].values
@@ -0,0 +1,201 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains a planner that chooses compact data types for the columns of
+retail datasets, so that they can be read with read_csv dtype arguments instead of
+the default int64, float64 and object columns.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Compact data types of the columns of the Orange Juice yx.csv file. Stores (2-137), brands
+# (1-11) and flags fit in 8 bits, weeks get 16 bits so that week arithmetic does not
+# overflow, and measures use float32.
+OJ_DTYPES = {
+    "store": np.uint8,
+    "brand": np.uint8,
+    "week": np.int16,
+    "logmove": np.float32,
+    "constant": np.uint8,
+    "price1": np.float32,
+    "price2": np.float32,
+    "price3": np.float32,
+    "price4": np.float32,
+    "price5": np.float32,
+    "price6": np.float32,
+    "price7": np.float32,
+    "price8": np.float32,
+    "price9": np.float32,
+    "price10": np.float32,
+    "price11": np.float32,
+    "deal": np.uint8,
+    "feat": np.float32,
+    "profit": np.float32,
+}
+
+# Integer types tried by the planner, from the smallest
+UNSIGNED_TYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+SIGNED_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def plan_dtypes(
+    df, id_cols=None, feature_cols=None, categorical_ids=False, downcast_features=False, max_categories=0.5
+):
+    """Plan compact data types for the columns of a dataframe.
+
+    Integer columns get the smallest integer type that holds their range, float measure
+    columns become float32 and string columns with few distinct values become categorical.
+
+    Args:
+        df (pd.DataFrame): Input dataframe
+        id_cols (list[str]): Identifier columns, e.g. ["store", "brand"]. They are made
+            categorical if categorical_ids is True, and otherwise get the smallest integer
+            type like other integer columns.
+        feature_cols (list[str]): Derived feature columns, whose float values are only
+            downcast to float32 if downcast_features is True
+        categorical_ids (bool): Whether to make identifier columns categorical
+        downcast_features (bool): Whether to downcast float feature columns to float32
+        max_categories (float): Largest ratio of distinct values to rows of a string column
+            that is made categorical
+
+    Returns:
+        dict: Data type of every column whose type changes, which can be passed to astype
+            or to the dtype argument of read_csv
+        pd.DataFrame: Memory report with the current and planned data type and bytes of each column
+    """
+    id_cols, feature_cols = set(id_cols or []), set(feature_cols or [])
+    stats = {c: _column_stats(df[c], c in id_cols and categorical_ids) for c in df.columns}
+    return _plan_from_stats(stats, len(df), id_cols, feature_cols, categorical_ids, downcast_features, max_categories)
+
+
+def plan_csv_dtypes(
+    path,
+    id_cols=None,
+    feature_cols=None,
+    categorical_ids=False,
+    downcast_features=False,
+    max_categories=0.5,
+    chunksize=100000,
+    **kwargs
+):
+    """Plan compact data types for the columns of a csv file, see plan_dtypes.
+
+    The file is scanned in chunks of rows, so that the memory used for planning is bounded
+    by chunksize, and the plan holds for all the values in the file.
+
+    Args:
+        path (str): Path of the csv file
+        chunksize (int): Number of rows read at once
+        kwargs: Other arguments of read_csv, e.g. usecols
+
+    Returns:
+        dict: Data types that can be passed to the dtype argument of read_csv
+        pd.DataFrame: Memory report, where current bytes are those of a read_csv with default types
+    """
+    id_cols, feature_cols = set(id_cols or []), set(feature_cols or [])
+    stats, n_rows = {}, 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, **kwargs):
+        n_rows += len(chunk)
+        for c in chunk.columns:
+            chunk_stats = _column_stats(chunk[c], c in id_cols and categorical_ids)
+            stats[c] = _merge_stats(stats[c], chunk_stats) if c in stats else chunk_stats
+    return _plan_from_stats(stats, n_rows, id_cols, feature_cols, categorical_ids, downcast_features, max_categories)
+
+
+def read_csv_compact(path, dtype=None, **kwargs):
+    """Read a csv file with compact data types.
+
+    Args:
+        path (str): Path of the csv file
+        dtype (dict): Planned data types. Default value None plans them with plan_csv_dtypes,
+            which reads the file twice; pass a plan computed once, or OJ_DTYPES, to avoid that.
+        kwargs: Other arguments of read_csv
+
+    Returns:
+        pd.DataFrame: The data
+    """
+    if dtype is None:
+        dtype, _ = plan_csv_dtypes(path, **kwargs)
+    return pd.read_csv(path, dtype=dtype, **kwargs)
+
+
+def _column_stats(series, keep_unique):
+    """Summary of a column needed to plan its data type."""
+    stats = {"dtype": series.dtype, "bytes": int(series.memory_usage(index=False, deep=True))}
+    if series.dtype.kind in "iu":
+        values = series.values
+        stats["min"], stats["max"] = (values.min(), values.max()) if len(values) else (0, 0)
+    if keep_unique or series.dtype == object:
+        stats["unique"] = set(series.dropna().unique())
+    return stats
+
+
+def _merge_stats(a, b):
+    """Summary of the union of two chunks of a column."""
+    if a["dtype"] == b["dtype"]:
+        merged = {"dtype": a["dtype"]}
+    elif object in (a["dtype"], b["dtype"]):
+        # Like read_csv, a column with strings in any chunk is read as strings
+        merged = {"dtype": np.dtype(object)}
+    else:
+        merged = {"dtype": np.promote_types(a["dtype"], b["dtype"])}
+    if "min" in a and "min" in b and merged["dtype"].kind in "iu":
+        merged["min"], merged["max"] = min(a["min"], b["min"]), max(a["max"], b["max"])
+    if "unique" in a or "unique" in b:
+        merged["unique"] = a.get("unique", set()) | b.get("unique", set())
+    merged["bytes"] = a["bytes"] + b["bytes"]
+    return merged
+
+
+def _plan_from_stats(stats, n_rows, id_cols, feature_cols, categorical_ids, downcast_features, max_categories):
+    """Data type plan and memory report from the summaries of all the columns."""
+    plan, report = {}, []
+    for c, s in stats.items():
+        dtype = s["dtype"]
+        planned, planned_bytes = dtype, s["bytes"]
+        is_categorical = (c in id_cols and categorical_ids) or (
+            dtype == object and len(s["unique"]) <= max_categories * n_rows
+        )
+        if is_categorical:
+            planned = pd.api.types.CategoricalDtype(_sorted(s["unique"]))
+            categories = pd.Series(list(s["unique"]), dtype=object if dtype == object else dtype)
+            planned_bytes = n_rows * _code_size(len(s["unique"])) + int(categories.memory_usage(index=False, deep=True))
+        elif dtype.kind in "iu":
+            planned = _smallest_int(s["min"], s["max"])
+        elif dtype.kind == "f" and dtype.itemsize > 4 and (c not in feature_cols or downcast_features):
+            planned = np.dtype(np.float32)
+        if planned is not dtype and not is_categorical:
+            planned_bytes = n_rows * planned.itemsize
+
+        if str(planned) != str(dtype):
+            plan[c] = planned
+        report.append([str(dtype), str(planned), s["bytes"], planned_bytes])
+
+    report = pd.DataFrame(
+        report, index=list(stats), columns=["current_dtype", "planned_dtype", "current_bytes", "planned_bytes"]
+    )
+    return plan, report
+
+
+def _sorted(values):
+    """Sorted list of values, or a list in arbitrary order if they cannot be compared."""
+    try:
+        return sorted(values)
+    except TypeError:
+        return list(values)
+
+
+def _smallest_int(min_value, max_value):
+    """Smallest integer type that holds all the values between min_value and max_value."""
+    for dtype in UNSIGNED_TYPES if min_value >= 0 else SIGNED_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _code_size(n_categories):
+    """Bytes per row of the codes of a categorical column, which pandas stores as signed integers."""
+    return np.min_scalar_type(-max(n_categories, 1)).itemsize
@@ -3,42 +3,81 @@
 
 
 import os
+import json
+import hashlib
+import shutil
 import subprocess
+import tempfile
+import numpy as np
 import pandas as pd
-import math
-import datetime
-import itertools
 import argparse
 import logging
 import requests
 from tqdm import tqdm
+from pandas.api.extensions import take
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from fclib.common.utils import git_repo_path
-from fclib.feature_engineering.feature_utils import df_from_cartesian_product
+from fclib.common.columnar import save_columnar, load_columnar
+from fclib.feature_engineering.feature_utils import df_from_cartesian_product, sort_series
+from fclib.dataset.dtypes import OJ_DTYPES, plan_dtypes
+from fclib.dataset.rdata import read_rdata
 
 DATA_FILE_LIST = ["yx.csv", "storedemo.csv"]
+# R script that writes the csv files, used when the R data file cannot be decoded in Python
 SCRIPT_NAME = "load_oj_data.R"
 
+# Directory of the binary snapshot of the data under the download directory. The version is
+# increased whenever the layout of the snapshot changes, so that stale snapshots are not read.
+SNAPSHOT_VERSION = 3
+SNAPSHOT_DIR = "ojdata_snapshot_v{}".format(SNAPSHOT_VERSION)
+
 DEFAULT_TARGET_COL = "move"
 DEFAULT_STATIC_FEA = None
 DEFAULT_DYNAMIC_FEA = ["deal", "feat"]
 
+# Columns of the sales data that are not available in the aux data of a forecast period
+AUX_EXCLUDED_COLS = ["logmove", "constant", "profit"]
+
+# Directory under the data directory and manifest of the splits stored with write_columnar
+SPLIT_DATA_DIR = "splits"
+SPLITS_FILE = "splits.json"
+
+# Methods supported by complete_series for filling the values of missing time steps
+FILL_METHODS = ["ffill", "bfill", "ffill_bfill", "linear", "seasonal_naive", "zero"]
+
 # The start datetime of the first week in the record
 FIRST_WEEK_START = pd.to_datetime("1989-09-14 00:00:00")
 
 # Original data source
 OJ_URL = "https://github.com/cran/bayesm/raw/master/data/orangeJuice.rda"
 
+# Number of bytes read from the connection at once when downloading files
+DOWNLOAD_CHUNK_SIZE = 8 * 2 ** 20
+
 
 log = logging.getLogger(__name__)
 
 
-def maybe_download(url, dest_directory, filename=None):
+def maybe_download(url, dest_directory, filename=None, sha256=None, chunk_size=DOWNLOAD_CHUNK_SIZE, n_connections=1):
     """Download a file if it is not already downloaded.
+
+    The file is downloaded in large chunks to a temporary .part file, which is renamed to the
+    destination file once it is complete and its checksum matches, so that an interrupted
+    download is never mistaken for a complete file. An interrupted download is resumed with
+    an HTTP Range request if the server supports it. With several connections, ranges of the
+    file are fetched in parallel.
+
     Args:
         dest_directory (str): Destination directory.
         url (str): URL of the file to download.
         filename (str): File name.
+        sha256 (str): Expected SHA-256 hex digest of the file. If given, an existing file with
+            another digest is downloaded again, and a downloaded file with another digest
+            raises a ValueError.
+        chunk_size (int): Number of bytes read from the connection at once.
+        n_connections (int): Number of connections that fetch ranges of the file in parallel,
+            if the server supports Range requests.
         
     Returns:
         str: File path of the file downloaded.
@@ -47,24 +86,93 @@ def maybe_download(url, dest_directory, filename=None):
         filename = url.split("/")[-1]
     os.makedirs(dest_directory, exist_ok=True)
     filepath = os.path.join(dest_directory, filename)
-    if not os.path.exists(filepath):
-        r = requests.get(url, stream=True)
-        total_size = int(r.headers.get("content-length", 0))
-        block_size = 1024
-        num_iterables = math.ceil(total_size / block_size)
-
-        with open(filepath, "wb") as file:
-            for data in tqdm(r.iter_content(block_size), total=num_iterables, unit="KB", unit_scale=True,):
-                file.write(data)
-    else:
+    if os.path.exists(filepath) and (sha256 is None or _file_sha256(filepath) == sha256):
         log.debug("File {} already downloaded".format(filepath))
+        return filepath
+
+    part_path = filepath + ".part"
+    total_size = None
+    if n_connections > 1:
+        head = requests.head(url, allow_redirects=True)
+        head.raise_for_status()
+        if head.headers.get("accept-ranges") == "bytes" and "content-length" in head.headers:
+            total_size = int(head.headers["content-length"])
+    if total_size is not None:
+        _download_ranges(head.url, part_path, total_size, chunk_size, n_connections)
+    else:
+        _download_stream(url, part_path, chunk_size)
 
+    if sha256 is not None and _file_sha256(part_path) != sha256:
+        os.remove(part_path)
+        raise ValueError("Checksum of the file downloaded from {} does not match.".format(url))
+    os.replace(part_path, filepath)
     return filepath
 
 
+def _download_stream(url, part_path, chunk_size):
+    """Download a file to part_path, resuming from the end of an existing partial file."""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": "bytes={}-".format(offset)} if offset else {}
+    with requests.get(url, headers=headers, stream=True) as r:
+        if r.status_code == 416:
+            # The partial file is either complete or stale
+            if r.headers.get("content-range", "").endswith("/{}".format(offset)):
+                return
+            os.remove(part_path)
+            return _download_stream(url, part_path, chunk_size)
+        r.raise_for_status()
+        if r.status_code != 206:
+            # The server ignored the range and sends the whole file
+            offset = 0
+        total_size = offset + int(r.headers.get("content-length", 0))
+        with open(part_path, "ab" if offset else "wb") as file, tqdm(
+            total=total_size, initial=offset, unit="B", unit_scale=True
+        ) as progress:
+            for data in r.iter_content(chunk_size):
+                file.write(data)
+                progress.update(len(data))
+
+
+def _download_ranges(url, part_path, total_size, chunk_size, n_connections):
+    """Download a file to part_path by fetching byte ranges of it in parallel."""
+    with open(part_path, "wb") as file:
+        file.truncate(total_size)
+    bounds = np.linspace(0, total_size, n_connections + 1).astype(np.int64)
+    with tqdm(total=total_size, unit="B", unit_scale=True) as progress:
+
+        def fetch(start, end):
+            headers = {"Range": "bytes={}-{}".format(start, end - 1)}
+            with requests.get(url, headers=headers, stream=True) as r, open(part_path, "r+b") as file:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise IOError("Server did not return the requested range of {}.".format(url))
+                file.seek(start)
+                for data in r.iter_content(chunk_size):
+                    file.write(data)
+                    progress.update(len(data))
+
+        with ThreadPoolExecutor(n_connections) as executor:
+            ranges = [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+            for future in [executor.submit(fetch, start, end) for start, end in ranges]:
+                future.result()
+
+
+def _file_sha256(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def download_ojdata(dest_dir="."):
     """Download orange juice dataset from the original source.
 
+    The R data file is decoded by load_ojdata, in Python or with Rscript as a fallback, and
+    written to yx.csv and storedemo.csv, and to a binary snapshot that load_ojdata reads
+    without parsing the csv files.
+
      Args:
         dest_dir (str): Directory path for the downloaded file
     
@@ -81,48 +189,304 @@ def download_ojdata(dest_dir="."):
         data_exists = data_exists and os.path.exists(file_path)
 
     if not data_exists:
-        # Call data loading script
-        repo_path = git_repo_path()
-        script_path = os.path.join(repo_path, "fclib", "fclib", "dataset", SCRIPT_NAME)
-
-        try:
-            print(f"Destination directory: {dest_dir}")
-            output = subprocess.run(
-                ["Rscript", script_path, rda_path, dest_dir], stderr=subprocess.PIPE, stdout=subprocess.PIPE
-            )
-            print(output.stdout)
-            if output.returncode != 0:
-                raise Exception(f"Subprocess failed - {output.stderr}")
-
-        except subprocess.CalledProcessError as e:
-            raise e
+        print(f"Destination directory: {dest_dir}")
+        for f, df in zip(DATA_FILE_LIST, load_ojdata(dest_dir)):
+            # Same format as write.csv(quote = FALSE, na = " ", row.names = FALSE) in R
+            df.to_csv(os.path.join(dest_dir, f), index=False, na_rep=" ", float_format="%.15g")
+        print("Data download completed. Data saved to {}".format(dest_dir))
     else:
         print("Data already exists at the specified location.")
+    return rda_path
+
+
+def load_ojdata(data_dir="."):
+    """Load the orange juice sales and store demographics data.
+
+    The first call downloads the R data file if needed, decodes it and writes a binary
+    snapshot with one .npy file per column (see fclib.common.columnar) under data_dir, from
+    which later calls load the data. The data frames have the values and data types that
+    read_csv gives for yx.csv and storedemo.csv, e.g. int64 ids and string brands. If the
+    file cannot be decoded in Python, the csv files are written by the R script
+    load_oj_data.R instead when Rscript is installed.
+
+    Example:
+        yx, storedemo = load_ojdata("/home/ojdata")
 
+    Args:
+        data_dir (str): Directory of the downloaded file and of the snapshot
 
-def complete_and_fill_df(df, stores, brands, weeks):
+    Returns:
+        pandas.DataFrame: sales data, as in yx.csv
+        pandas.DataFrame: store demographics data, as in storedemo.csv
+    """
+    snapshot_dir = os.path.join(data_dir, SNAPSHOT_DIR)
+    if not os.path.isdir(snapshot_dir):
+        rda_path = maybe_download(OJ_URL, dest_directory=data_dir)
+        yx, storedemo = _read_ojdata(rda_path)
+        # Write to a temporary directory first, so that readers never see a partial snapshot
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=data_dir)
+        for name, df in zip(DATA_FILE_LIST, [yx, storedemo]):
+            save_columnar(df, os.path.join(tmp_dir, os.path.splitext(name)[0]))
+        try:
+            os.rename(tmp_dir, snapshot_dir)
+        except OSError:
+            # Another process wrote the snapshot first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return tuple(load_columnar(os.path.join(snapshot_dir, os.path.splitext(name)[0])) for name in DATA_FILE_LIST)
+
+
+def _read_ojdata(rda_path):
+    """Sales and store demographics data of the R data file, as read from the csv files."""
+    try:
+        data = read_rdata(rda_path)["orangeJuice"]
+        frames = data.values() if isinstance(data, dict) else data
+        return [_csv_dtypes(df) for df in frames]
+    except (ValueError, KeyError):
+        if shutil.which("Rscript") is None:
+            raise
+
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), SCRIPT_NAME)
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(os.path.abspath(rda_path)))
+    try:
+        output = subprocess.run(
+            ["Rscript", script_path, rda_path, tmp_dir], stderr=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        if output.returncode != 0:
+            raise Exception(f"Subprocess failed - {output.stderr}")
+        return [pd.read_csv(os.path.join(tmp_dir, f), na_values=" ") for f in DATA_FILE_LIST]
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _csv_dtypes(df):
+    """Cast the columns decoded from the R data file to the data types that read_csv infers for
+    the csv files: strings for factors, NaN for missing strings, and int64 for integers and for
+    floats without missing or fractional values."""
+    columns = OrderedDict()
+    for name, series in df.items():
+        if pd.api.types.is_categorical_dtype(series):
+            series = series.cat.rename_categories(series.cat.categories.astype(str)).astype(object)
+        if series.dtype == object:
+            series = series.where(series.notnull(), np.nan)
+        elif pd.api.types.is_integer_dtype(series):
+            series = series.astype(np.int64)
+        elif pd.api.types.is_float_dtype(series) and len(series) and series.notnull().all() and (series % 1 == 0).all():
+            series = series.astype(np.int64)
+        columns[name] = series.values
+    return pd.DataFrame(columns)
+
+
+def complete_and_fill_df(df, stores, brands, weeks, dense=False):
     """Completes missing rows in Orange Juice datasets and fills in the missing values.
-    
+
+    Every (store, brand, week) key is packed into one integer, which is the position of the
+    key in the grid of all the combinations of stores, brands and weeks. The rows of df are
+    scattered into that grid, where each time series occupies a contiguous block of weeks,
+    and missing values are forward filled and then backward filled within each series in
+    one vectorized pass over every column, like complete_series.
+
     Args:
-        df (pd.DataFrame): data frame to fill in the rows and missing values in
+        df (pd.DataFrame): data frame to fill in the rows and missing values in, with at most
+            one row for each (store, brand, week) key
         stores (list[int]): list of stores to include
         brands (list[int]): list of brands to include
         weeks (list[int]): list of weeks to include
+        dense (bool): whether to return the filled values of the non-key columns as a dense
+            (series x week x column) array instead of a data frame
         
     Returns:
-        pd.DataFrame: data frame with completed rows and missing values filled in
-    
+        pd.DataFrame: data frame with completed rows and missing values filled in, with one
+            row for each key in the order of the Cartesian product of stores, brands and weeks
+        If dense is True:
+        np.array: float array of shape (len(stores) * len(brands), len(weeks), number of
+            non-key columns) with series in the order of the Cartesian product of stores and brands
+        list[str]: names of the columns of the last axis of the array
     """
-    d = {"store": stores, "brand": brands, "week": weeks}
-    data_grid = df_from_cartesian_product(d)
-    # Complete all rows
-    df_filled = pd.merge(data_grid, df, how="left", on=["store", "brand", "week"])
-    # Fill in missing values
-    df_filled = df_filled.groupby(["store", "brand"]).apply(lambda x: x.fillna(method="ffill").fillna(method="bfill"))
-
+    key_cols = ["store", "brand", "week"]
+    key_lists = [stores, brands, weeks]
+    value_cols = [c for c in df.columns if c not in key_cols]
+    n_series, n_weeks = len(stores) * len(brands), len(weeks)
+
+    # Position of the key of every row in the grid, or -1 if the key is not in the grid
+    packed = np.zeros(len(df), dtype=np.int64)
+    in_grid = np.ones(len(df), dtype=bool)
+    for c, values in zip(key_cols, key_lists):
+        codes = pd.Index(values).get_indexer(df[c])
+        in_grid &= codes >= 0
+        packed = packed * len(values) + codes
+    packed = packed[in_grid]
+    if len(np.unique(packed)) != len(packed):
+        raise ValueError("Input dataframe contains more than one row for some (store, brand, week) keys.")
+
+    # Reindexing upcasts the columns that get missing values like a left merge on the grid
+    values = df.loc[in_grid, value_cols]
+    values.index = packed
+    values = values.reindex(np.arange(n_series * n_weeks))
+
+    row_start = np.repeat(np.arange(n_series) * n_weeks, n_weeks)
+    filled = [_fill_series(values[c].values, row_start, row_start + n_weeks, "ffill_bfill", None) for c in value_cols]
+    if dense:
+        dense_values = np.empty((n_series * n_weeks, len(value_cols)))
+        for i, column in enumerate(filled):
+            dense_values[:, i] = column
+        return dense_values.reshape(n_series, n_weeks, len(value_cols)), value_cols
+
+    df_filled = df_from_cartesian_product(dict(zip(key_cols, key_lists)))
+    for c, column in zip(value_cols, filled):
+        df_filled[c] = column
     return df_filled
 
 
+def complete_series(
+    df, ts_id_cols, time_col, freq, method="ffill_bfill", season_length=None, value_cols=None, per_series_range=False
+):
+    """Reindex every time series to a regular time grid and fill in the values of the new rows.
+
+    This generalizes complete_and_fill_df to any series identifiers, time frequency and fill
+    method. The rows are sorted once so that every completed series is a contiguous block,
+    and each fill method is a vectorized scan over all the blocks, without per-series calls.
+
+    Example:
+        df_filled = complete_series(df, ["store", "brand"], "week", 1, method="linear")
+        df_filled = complete_series(df, ["meter"], "timestamp", "H", method="seasonal_naive", season_length=24)
+
+    Args:
+        df (pd.DataFrame): Time series data of all the series in long format, with at most one
+            row for each series and time step
+        ts_id_cols (list[str]): Names of the columns that identify each time series. None or an
+            empty list treats df as a single time series.
+        time_col (str): Name of the time column, either datetimes or integers (e.g. week numbers)
+        freq: Frequency of the grid, a pandas frequency (e.g. "H", "W-THU") for datetimes or the
+            integer step between time steps for integer times
+        method (str): How to fill in missing values, one of
+            "ffill": last observed value of the series,
+            "bfill": next observed value of the series,
+            "ffill_bfill": forward fill followed by backward fill, like complete_and_fill_df,
+            "linear": linear interpolation between the surrounding observed values, like
+                pd.Series.interpolate on each series, i.e. values before the first observation
+                stay missing and values after the last observation repeat it. Columns that are
+                not numeric, e.g. strings or categories, are forward filled instead,
+            "seasonal_naive": value of the same season in the last observed season, i.e.
+                season_length steps earlier, repeatedly if that is missing as well,
+            "zero": zero,
+            None: leave missing values missing.
+        season_length (int): Number of time steps in a season, required for "seasonal_naive"
+        value_cols (list[str]): Columns to fill. Default value None fills all the columns
+            other than ts_id_cols and time_col. Other columns are missing in the new rows.
+        per_series_range (bool): Whether each series spans the range between its own first and
+            last time step, or all the series span the range of the whole data (default)
+
+    Returns:
+        pd.DataFrame: Completed data, sorted by series and time, with columns ts_id_cols,
+            time_col and the other columns of df. An empty df is returned unchanged.
+    """
+    if method is not None and method not in FILL_METHODS:
+        raise ValueError("Valid fill methods are {}".format(", ".join(FILL_METHODS)))
+    if method == "seasonal_naive" and not season_length:
+        raise ValueError("season_length is required for seasonal naive filling.")
+    ts_id_cols = list(ts_id_cols or [])
+    other_cols = [c for c in df.columns if c not in ts_id_cols and c != time_col]
+    value_cols = other_cols if value_cols is None else list(value_cols)
+    if len(df) == 0:
+        return df.copy()
+
+    # Time step of every row on the grid of the whole data
+    times = df[time_col].values
+    if np.issubdtype(times.dtype, np.integer):
+        first_time = times.min()
+        steps, remainders = np.divmod(times - first_time, freq)
+        on_grid = remainders == 0
+        grid = None
+    else:
+        times = times.astype("datetime64[ns]")
+        grid = pd.date_range(times.min(), times.max(), freq=freq).values
+        steps = pd.Index(grid).get_indexer(times)
+        on_grid = steps >= 0
+    if not on_grid.all():
+        raise ValueError("Timestamp(s) of the input dataframe are not on the grid of frequency {}.".format(freq))
+
+    order, starts, lengths = sort_series(df, ts_id_cols, time_col)
+    steps = steps[order]
+    if (np.diff(steps)[np.diff(np.repeat(np.arange(len(starts)), lengths)) == 0] == 0).any():
+        raise ValueError("Input dataframe contains more than one row for some series and time steps.")
+
+    ends = starts + lengths - 1
+    if per_series_range:
+        first_steps, last_steps = steps[starts], steps[ends]
+    else:
+        first_steps = np.zeros(len(starts), dtype=np.int64)
+        last_steps = np.full(len(starts), steps.max() if len(steps) else -1)
+    new_lengths = last_steps - first_steps + 1
+    new_starts = np.cumsum(new_lengths) - new_lengths
+    n_rows = new_lengths.sum()
+    positions = np.repeat(new_starts - first_steps, lengths) + steps
+
+    # Reindexing upcasts the columns that get missing values like a left merge on the grid
+    values = df[other_cols].iloc[order]
+    values.index = positions
+    values = values.reindex(np.arange(n_rows))
+
+    completed = pd.DataFrame({c: np.repeat(df[c].values[order[starts]], new_lengths) for c in ts_id_cols})
+    grid_steps = np.repeat(first_steps - new_starts, new_lengths) + np.arange(n_rows)
+    completed[time_col] = first_time + grid_steps * freq if grid is None else grid[grid_steps]
+
+    row_start = np.repeat(new_starts, new_lengths)
+    for c in other_cols:
+        column = values[c].values
+        if method is not None and c in value_cols:
+            row_end = row_start + np.repeat(new_lengths, new_lengths)
+            numeric = np.issubdtype(column.dtype, np.number)
+            column_method = "ffill" if method == "linear" and not numeric else method
+            column = _fill_series(column, row_start, row_end, column_method, season_length)
+        completed[c] = column
+    return completed
+
+
+def _fill_series(values, row_start, row_end, method, season_length):
+    """Fill missing values of a column of contiguous series, see complete_series."""
+    missing = pd.isnull(values)
+    if not missing.any():
+        return values
+    if method == "zero":
+        return np.where(missing, 0, values)
+    if method == "seasonal_naive":
+        # Forward fill within each series and season, by visiting the rows season by season
+        position = np.arange(len(values))
+        season = (position - row_start) % season_length
+        by_season = np.lexsort((position, season, row_start))
+        season_start = np.ones(len(values), dtype=bool)
+        season_start[1:] = (row_start[by_season][1:] != row_start[by_season][:-1]) | (
+            season[by_season][1:] != season[by_season][:-1]
+        )
+        group_start = np.maximum.accumulate(np.where(season_start, np.arange(len(values)), 0))
+        filled = _fill_series(values[by_season], group_start, None, "ffill", None)
+        result = np.empty_like(filled)
+        result[by_season] = filled
+        return result
+
+    position = np.arange(len(values))
+    previous = np.maximum.accumulate(np.where(missing, -1, position))
+    has_previous = previous >= row_start
+    if method == "ffill":
+        return np.where(has_previous, values[np.maximum(previous, 0)], values)
+
+    following = np.minimum.accumulate(np.where(missing, len(values), position)[::-1])[::-1]
+    has_following = following < row_end
+    following_values = values[np.minimum(following, len(values) - 1)]
+    if method == "bfill":
+        return np.where(has_following, following_values, values)
+    previous_values = values[np.maximum(previous, 0)]
+    if method == "ffill_bfill":
+        return np.where(has_previous, previous_values, np.where(has_following, following_values, values))
+
+    # Linear interpolation between the surrounding observations, repeating the last one at the end
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = (position - previous) / (following - previous)
+        interpolated = previous_values + weight * (following_values - previous_values)
+    filled = np.where(has_previous, np.where(has_following, interpolated, previous_values), values)
+    return np.where(missing, filled, values)
+
+
 def _gen_split_indices(n_splits=12, horizon=2, gap=2, first_week=40, last_week=156):
     """Generate week splits for given parameters"""
     test_start_index = last_week - (horizon * n_splits) + 1
@@ -145,13 +509,25 @@ def _gen_split_indices(n_splits=12, horizon=2, gap=2, first_week=40, last_week=1
     return test_start_week_list, test_end_week_list, train_end_week_list
 
 
-def split_train_test(data_dir, n_splits=1, horizon=2, gap=2, first_week=40, last_week=156, write_csv=False):
+def split_train_test(
+    data_dir,
+    n_splits=1,
+    horizon=2,
+    gap=2,
+    first_week=40,
+    last_week=156,
+    write_csv=False,
+    compact_dtypes=False,
+    copy=True,
+    write_columnar=False,
+):
     """Generate training, testing, and auxiliary datasets. Training data includes the historical 
     sales and external features; testing data contains the future sales and external features; 
     auxiliary data includes the future price, deal, and advertisement information which can be 
     used for making predictions (we assume such auxiliary information is available at the time 
     when we generate the forecasts). Use this function to generate the train, test, aux data for
-    each forecast period on the fly, or use write_csv flag to write data to files.
+    each forecast period on the fly, or use write_csv flag to write data to files. To process
+    the splits one at a time without holding all of them in memory, use iter_train_test_splits.
 
     Note that train_*.csv files in /train folder contain all the features in the training period
     and aux_*.csv files in /train folder contain all the features except 'logmove', 'constant',
@@ -177,6 +553,15 @@ def split_train_test(data_dir, n_splits=1, horizon=2, gap=2, first_week=40, last
         first_week (int, optional): first available week (default: 40) 
         last_week (int, optional): last available week (default: 156)
         write_csv (Boolean, optional): Whether to write out the data files or not (default: False)
+        compact_dtypes (Boolean, optional): Whether to read the data with the compact data types
+            in fclib.dataset.dtypes.OJ_DTYPES, i.e. 8/16-bit integers and float32 (default: False)
+        copy (Boolean, optional): Whether every data frame is an independent copy with the rows
+            in the order of the sales data, or a view of the sales data sorted by week that must
+            not be modified in place. Copies are always made if write_csv is True, so that the
+            files keep the order of the sales data (default: True)
+        write_columnar (Boolean, optional): Whether to store the sales data once in columnar
+            files under data_dir/splits, with a manifest of the rows of every split, from which
+            load_split reads the data of a split (default: False)
     
     Returns:
         list[pandas.DataFrame]: a list containing train data frames for each split
@@ -185,7 +570,9 @@ def split_train_test(data_dir, n_splits=1, horizon=2, gap=2, first_week=40, last
         
     """
     # Read sales data into dataframe
-    sales = pd.read_csv(os.path.join(data_dir, "yx.csv"), index_col=0)
+    sales = pd.read_csv(os.path.join(data_dir, "yx.csv"), index_col=0, dtype=OJ_DTYPES if compact_dtypes else None)
+    if write_columnar:
+        _write_columnar_splits(sales, data_dir, n_splits, horizon, gap, first_week, last_week)
 
     if write_csv:
         TRAIN_DATA_DIR = os.path.join(data_dir, "train")
@@ -199,19 +586,8 @@ def split_train_test(data_dir, n_splits=1, horizon=2, gap=2, first_week=40, last
     test_df_list = list()
     aux_df_list = list()
 
-    test_start_week_list, test_end_week_list, train_end_week_list = _gen_split_indices(
-        n_splits, horizon, gap, first_week, last_week
-    )
-
-    for i in range(n_splits):
-        data_mask = (sales.week >= first_week) & (sales.week <= train_end_week_list[i])
-        train_df = sales[data_mask].copy()
-        data_mask = (sales.week >= test_start_week_list[i]) & (sales.week <= test_end_week_list[i])
-        test_df = sales[data_mask].copy()
-        data_mask = (sales.week >= first_week) & (sales.week <= test_end_week_list[i])
-        aux_df = sales[data_mask].copy()
-        aux_df.drop(["logmove", "constant", "profit"], axis=1, inplace=True)
-
+    splits = iter_train_test_splits(sales, n_splits, horizon, gap, first_week, last_week, copy=copy or write_csv)
+    for i, (train_df, test_df, aux_df) in enumerate(splits):
         if write_csv:
             roundstr = "_" + str(i + 1) if n_splits > 1 else ""
             train_df.to_csv(os.path.join(TRAIN_DATA_DIR, "train" + roundstr + ".csv"))
@@ -225,6 +601,134 @@ def split_train_test(data_dir, n_splits=1, horizon=2, gap=2, first_week=40, last
     return train_df_list, test_df_list, aux_df_list
 
 
+def iter_train_test_splits(
+    data, n_splits=1, horizon=2, gap=2, first_week=40, last_week=156, compact_dtypes=False, copy=False
+):
+    """Lazily generate the training, testing, and auxiliary datasets of each split, see
+    split_train_test.
+
+    The sales data is sorted by week once, so that the data of every split is a contiguous
+    range of rows whose boundaries are found with a binary search. The data frames are views
+    of the sorted data by default, so iterating over any number of splits needs about two
+    copies of the data: the sorted sales and the sorted sales without the target columns
+    that are excluded from the auxiliary data. Copies take the rows of each range in the
+    order of the sales data instead, like boolean masks over the weeks.
+
+    Example:
+        for train_df, test_df, aux_df in iter_train_test_splits("/home/ojdata", n_splits=12):
+            ...
+
+    Args:
+        data (str or pandas.DataFrame): location of the download directory, or the sales data
+        n_splits (int, optional): number of splits (folds) to generate (default: 1)
+        horizon (int, optional): forecasting horizon, number of weeks to forecast (default: 2)
+        gap (int, optional): gap between training and testing, number of weeks between last training
+            week and first test week (default: 2)
+        first_week (int, optional): first available week (default: 40)
+        last_week (int, optional): last available week (default: 156)
+        compact_dtypes (Boolean, optional): Whether to read the data with the compact data types
+            in fclib.dataset.dtypes.OJ_DTYPES (default: False)
+        copy (Boolean, optional): Whether to yield independent copies with the rows in the order
+            of the sales data instead of views sorted by week, which must not be modified in
+            place (default: False)
+
+    Yields:
+        pandas.DataFrame: train data frame of the split
+        pandas.DataFrame: test data frame of the split
+        pandas.DataFrame: aux data frame of the split
+    """
+    if isinstance(data, pd.DataFrame):
+        sales = data
+    else:
+        sales = pd.read_csv(os.path.join(data, "yx.csv"), index_col=0, dtype=OJ_DTYPES if compact_dtypes else None)
+    order = np.argsort(sales.week.values, kind="mergesort")
+    splits = _split_rows(sales.week.values[order], n_splits, horizon, gap, first_week, last_week)
+    if copy:
+        # The original positions of the rows of a range, in increasing order
+        aux_sales = sales.drop(AUX_EXCLUDED_COLS, axis=1)
+        for train_rows, test_rows, aux_rows in splits:
+            train_df = sales.iloc[np.sort(order[train_rows])].copy()
+            test_df = sales.iloc[np.sort(order[test_rows])].copy()
+            aux_df = aux_sales.iloc[np.sort(order[aux_rows])].copy()
+            yield train_df, test_df, aux_df
+        return
+
+    sales = sales.iloc[order]
+    aux_sales = sales.drop(AUX_EXCLUDED_COLS, axis=1)
+    for train_rows, test_rows, aux_rows in splits:
+        yield sales.iloc[train_rows], sales.iloc[test_rows], aux_sales.iloc[aux_rows]
+
+
+def load_split(data_dir, split=0, columns=None):
+    """Load the training, testing, and auxiliary datasets of a split stored by split_train_test
+    with write_columnar=True.
+
+    Only the requested columns and the rows of the split are read from the columnar files.
+
+    Example:
+        train_df, test_df, aux_df = load_split("/home/ojdata", split=3, columns=["store", "brand", "week", "logmove"])
+
+    Args:
+        data_dir (str): location of the download directory
+        split (int, optional): index of the split, from 0 to n_splits - 1 (default: 0)
+        columns (list[str], optional): columns to load. Default value None loads all the columns,
+            except those that are excluded from the aux data.
+
+    Returns:
+        pandas.DataFrame: train data frame of the split, sorted by week
+        pandas.DataFrame: test data frame of the split, sorted by week
+        pandas.DataFrame: aux data frame of the split, sorted by week
+    """
+    split_dir = os.path.join(data_dir, SPLIT_DATA_DIR)
+    with open(os.path.join(split_dir, SPLITS_FILE)) as f:
+        rows = json.load(f)["rows"][split]
+    train_df, test_df, aux_df = [load_columnar(split_dir, columns, mmap_mode="r", rows=slice(*r)) for r in rows]
+    return train_df, test_df, aux_df.drop(AUX_EXCLUDED_COLS, axis=1, errors="ignore")
+
+
+def _sort_by_week(sales):
+    """Sales data sorted by week, keeping the original order of the rows of each week."""
+    return sales.iloc[np.argsort(sales.week.values, kind="mergesort")]
+
+
+def _split_rows(weeks, n_splits, horizon, gap, first_week, last_week):
+    """Ranges of rows of the train, test and aux data of every split, given the sorted weeks of
+    the sales data."""
+    test_start_week_list, test_end_week_list, train_end_week_list = _gen_split_indices(
+        n_splits, horizon, gap, first_week, last_week
+    )
+
+    def week_rows(start_week, end_week):
+        return slice(int(np.searchsorted(weeks, start_week, "left")), int(np.searchsorted(weeks, end_week, "right")))
+
+    return [
+        (
+            week_rows(first_week, train_end_week_list[i]),
+            week_rows(test_start_week_list[i], test_end_week_list[i]),
+            week_rows(first_week, test_end_week_list[i]),
+        )
+        for i in range(n_splits)
+    ]
+
+
+def _write_columnar_splits(sales, data_dir, n_splits, horizon, gap, first_week, last_week):
+    """Store the sales data sorted by week once, with the ranges of rows of every split."""
+    split_dir = os.path.join(data_dir, SPLIT_DATA_DIR)
+    sales = _sort_by_week(sales)
+    save_columnar(sales, split_dir)
+    splits = _split_rows(sales.week.values, n_splits, horizon, gap, first_week, last_week)
+    manifest = {
+        "n_splits": n_splits,
+        "horizon": horizon,
+        "gap": gap,
+        "first_week": first_week,
+        "last_week": last_week,
+        "rows": [[[r.start, r.stop] for r in rows] for rows in splits],
+    }
+    with open(os.path.join(split_dir, SPLITS_FILE), "w") as f:
+        json.dump(manifest, f)
+
+
 def specify_data_schema(
     df,
     time_col_name,
@@ -235,9 +739,18 @@ def specify_data_schema(
     static_feat_names=None,
     dynamic_feat_names=None,
     description=None,
+    sample_size=None,
+    random_state=None,
 ):
     """Specify the schema of a time series dataset.
 
+        The dataframe is validated in one pass: the timestamps are parsed once, their distinct
+        values are matched to integer positions on the grid of the frequency, and all the static
+        features are checked with one grouped count of distinct values. The dataframe is not
+        modified: unlike in earlier versions, df[time_col_name] is not converted to datetime in
+        place, so callers that need datetime timestamps should convert the column themselves,
+        e.g. with pd.to_datetime(df[time_col_name], format=time_format).
+
         Args:
             df (Pandas DataFrame): input time series dataframe
             time_col_name (str): name of the timestamp column
@@ -252,6 +765,16 @@ def specify_data_schema(
             static_feat_names (list): names of the feature columns that do not change over time
             dynamic_feat_names (list): names of the feature columns that can change over time
             description (str): description of the data (e.g., "training set", "testing set")
+            sample_size (int): if given, only the timestamps of sample_size random rows and the
+                               static features of sample_size random time series are checked,
+                               for very large inputs. A problem that affects a fraction p of the
+                               rows (or of the time series) is then missed with probability at
+                               most exp(-p * sample_size), e.g. less than 0.01% if 0.1% of the
+                               rows have irregular timestamps and sample_size is 10000. The
+                               sampled frequency check only finds timestamps that are off the
+                               grid of the frequency, not gaps between them, so the bound only
+                               holds for the former.
+            random_state (int): seed of the random sample
 
             Note that static_feat_names should include column names of the static features 
             other than those in ts_id_col_names. In addition, dynamic_feat_names should not 
@@ -313,16 +836,22 @@ def specify_data_schema(
     df_col_names = list(df)
     _check_col_names(df_col_names, time_col_name, "timestamp")
     _check_col_names(df_col_names, target_col_name, "target")
-    _check_time_format(df, time_col_name, time_format)
-    _check_frequency(df, time_col_name, frequency, time_format, ts_id_col_names)
     if ts_id_col_names is not None:
         _check_col_names(df_col_names, ts_id_col_names, "name_list")
     if static_feat_names is not None:
         _check_col_names(df_col_names, static_feat_names, "name_list")
-        _check_static_feat(df, ts_id_col_names, static_feat_names)
     if dynamic_feat_names is not None:
         _check_col_names(df_col_names, dynamic_feat_names, "name_list")
 
+    rng = np.random.RandomState(random_state)
+    time_col = df[time_col_name]
+    if sample_size is not None and sample_size < len(df):
+        # Independent draws, for which the error bound in the docstring holds
+        time_col = time_col.iloc[rng.randint(0, len(df), sample_size)]
+    _check_frequency(_parse_timestamps(time_col, time_format), frequency)
+    if static_feat_names is not None:
+        _check_static_feat(df, ts_id_col_names, static_feat_names, sample_size, rng)
+
     # Configuration of the time series data
     df_config = {
         "time_col_name": time_col_name,
@@ -351,46 +880,59 @@ def _check_col_names(df_col_names, input_col_names, input_type):
                 raise ValueError(c + " is an invalid column name. It cannot be found in the input dataframe.")
 
 
-def _check_time_format(df, time_col_name, time_format):
-    """Check if the timestamp format is valid.
+def _parse_timestamps(time_col, time_format):
+    """Parse the timestamps once, as datetime64 values.
     """
     try:
-        pd.to_datetime(df[time_col_name], format=time_format)
+        return pd.to_datetime(time_col, format=time_format).values
     except Exception:
         raise ValueError("Incorrect date format is specified.")
 
 
-def _check_frequency(df, time_col_name, frequency, time_format, ts_id_col_names):
-    """Check if the data frequency is valid.
+def _check_frequency(timestamps, frequency):
+    """Check if the data frequency is valid, i.e. if all the timestamps are on the grid of the
+    frequency between the first and the last timestamp.
     """
+    unique_timestamps = pd.unique(timestamps.view(np.int64)).view(timestamps.dtype)
+    missing = np.isnat(unique_timestamps)
     try:
-        df[time_col_name] = pd.to_datetime(df[time_col_name], format=time_format)
-        timestamps_all = pd.date_range(min(df[time_col_name]), end=max(df[time_col_name]), freq=frequency)
+        timestamps_all = pd.date_range(
+            unique_timestamps[~missing].min(), end=unique_timestamps[~missing].max(), freq=frequency
+        )
     except Exception:
         raise ValueError(
             "Input data frequency is invalid. Please use the aliases in "
             + "https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#timeseries-offset-aliases"
         )
 
-    condition1 = (ts_id_col_names is None) and (not set(df[time_col_name]) <= set(timestamps_all))
-    condition2 = (ts_id_col_names is not None) and (
-        not all(df.groupby(ts_id_col_names).apply(lambda x: set(x[time_col_name]) <= set(timestamps_all)))
-    )
-    if condition1 or condition2:
+    # Integer period codes of the distinct timestamps on the grid, -1 for irregular timestamps.
+    # Checking all timestamps against one grid is the same as checking every time series.
+    if missing.any() or (timestamps_all.get_indexer(unique_timestamps) < 0).any():
         raise ValueError(
             "Timestamp(s) with irregular frequency in the input dataframe. Please make sure the frequency "
             + "of each time series is as what specified by 'frequency'."
         )
 
 
-def _check_static_feat(df, ts_id_col_names, static_feat_names):
+def _check_static_feat(df, ts_id_col_names, static_feat_names, sample_size=None, rng=None):
     """Check if the input static features change over time and include ts_id_col_names.
     """
-    for feat in static_feat_names:
-        condition1 = (ts_id_col_names is None) and (df[feat].nunique() > 1)
-        condition2 = (ts_id_col_names is not None) and (df.groupby(ts_id_col_names)[feat].nunique().max() > 1)
-        if condition1 or condition2:
-            raise ValueError("Input feature column {} is supposed to be static but it is not.".format(feat))
+    if ts_id_col_names is None:
+        n_unique = df[static_feat_names].nunique()
+    else:
+        if sample_size is not None:
+            # Rows with a missing id are numbered -1 and, like in the groupby below, left out
+            series = df.groupby(ts_id_col_names, sort=False).ngroup().values
+            n_series = series.max() + 1 if len(series) else 0
+            if 0 < sample_size < n_series:
+                sampled = np.zeros(n_series, dtype=bool)
+                sampled[rng.randint(0, n_series, sample_size)] = True
+                rows = (series >= 0) & sampled[series]
+                df = df.loc[rows, list(OrderedDict.fromkeys(ts_id_col_names + static_feat_names))]
+        n_unique = df.groupby(ts_id_col_names)[static_feat_names].nunique().max()
+    changing = n_unique.index[n_unique > 1]
+    if len(changing) > 0:
+        raise ValueError("Input feature column {} is supposed to be static but it is not.".format(changing[0]))
 
 
 def specify_retail_data_schema(
@@ -400,6 +942,7 @@ def specify_retail_data_schema(
     static_feat_names=DEFAULT_STATIC_FEA,
     dynamic_feat_names=DEFAULT_DYNAMIC_FEA,
     description=None,
+    compact_dtypes=False,
 ):
     """Specify data schema of OrangeJuice dataset.
 
@@ -414,16 +957,19 @@ def specify_retail_data_schema(
         static_feat_names (list): names of the feature columns that do not change over time
         dynamic_feat_names (list): names of the feature columns that can change over time
         description (str): description of the data (e.g., "training set", "testing set")
+        compact_dtypes (bool): whether to read the data files with compact data types, see
+            fclib.dataset.dtypes
 
     Returns:
         df_config (dict): configuration of the time series data 
         df (Pandas DataFrame): sales data combined with store demographic features
     """
     # Read the 1st split of training data if "sales" is not specified
-    if not sales:
+    if sales is None:
         print("Sales dataframe is not given! The 1st split of training data will be used.")
-        sales = pd.read_csv(os.path.join(data_dir, "train", "train_round_1.csv"), index_col=False)
-        aux = pd.read_csv(os.path.join(data_dir, "train", "aux_round_1.csv"), index_col=False)
+        dtype = OJ_DTYPES if compact_dtypes else None
+        sales = pd.read_csv(os.path.join(data_dir, "train", "train_round_1.csv"), index_col=False, dtype=dtype)
+        aux = pd.read_csv(os.path.join(data_dir, "train", "aux_round_1.csv"), index_col=False, dtype=dtype)
         # Merge with future price, deal, and advertisement info
         aux_features = [
             "price1",
@@ -444,24 +990,11 @@ def specify_retail_data_schema(
 
     # Read store demographic data
     storedemo = pd.read_csv(os.path.join(data_dir, "storedemo.csv"), index_col=False)
+    if compact_dtypes:
+        # The file is small, so the types are planned from the frame instead of a second read
+        storedemo = storedemo.astype(plan_dtypes(storedemo)[0])
 
-    # Compute unit sales
-    sales["move"] = sales["logmove"].apply(lambda x: round(math.exp(x)) if x > 0 else 0)
-
-    # Make sure each time series has the same time span
-    store_list = sales["store"].unique()
-    brand_list = sales["brand"].unique()
-    week_list = range(sales["week"].min(), sales["week"].max() + 1)
-    item_list = list(itertools.product(store_list, brand_list, week_list))
-    item_df = pd.DataFrame.from_records(item_list, columns=["store", "brand", "week"])
-    sales = item_df.merge(sales, how="left", on=["store", "brand", "week"])
-
-    # Merge with storedemo
-    df = sales.merge(storedemo, how="left", left_on="store", right_on="STORE")
-    df.drop("STORE", axis=1, inplace=True)
-
-    # Create timestamp
-    df["timestamp"] = df["week"].apply(lambda x: FIRST_WEEK_START + datetime.timedelta(days=(x - 1) * 7))
+    df = _prepare_retail_data(sales, storedemo)
 
     df_config = specify_data_schema(
         df,
@@ -477,6 +1010,62 @@ def specify_retail_data_schema(
     return df_config, df
 
 
+def _prepare_retail_data(sales, storedemo):
+    """Complete the sales data to the same time span for every store and brand, and add the
+    unit sales, the store demographic features and the timestamp of every week.
+
+    The (store, brand, week) keys are packed into integer positions in the grid of all the
+    stores, brands and weeks, in order of first appearance of the stores and brands, so the
+    rows are placed with integer indexing instead of merges on the key columns.
+    """
+    # Compute unit sales, rounding halves to even like round()
+    logmove = sales["logmove"].values.astype(np.float64)
+    with np.errstate(invalid="ignore"):
+        sales["move"] = np.where(logmove > 0, np.rint(np.exp(logmove)), 0).astype(np.int64)
+
+    # Make sure each time series has the same time span
+    key_cols = ["store", "brand", "week"]
+    # Like unique(), factorize numbers the values in order of first appearance
+    store_codes, brand_codes = pd.factorize(sales["store"])[0], pd.factorize(sales["brand"])[0]
+    store_list, brand_list = sales["store"].unique(), sales["brand"].unique()
+    first_week, last_week = sales["week"].min(), sales["week"].max()
+    n_brands, n_weeks = len(brand_list), int(last_week - first_week + 1)
+    packed = (store_codes * n_brands + brand_codes) * n_weeks + (sales["week"].values.astype(np.int64) - first_week)
+
+    # Rows of the same key stay in their original order, as in a left merge on the grid
+    order = np.argsort(packed, kind="mergesort")
+    counts = np.bincount(packed, minlength=len(store_list) * n_brands * n_weeks)
+    n_rows = np.maximum(counts, 1)
+    row_start = np.cumsum(n_rows) - n_rows
+    sales_rows = np.full(n_rows.sum(), -1, dtype=np.int64)
+    rank = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+    sales_rows[row_start[packed[order]] + rank] = order
+    grid = np.repeat(np.arange(len(n_rows)), n_rows)
+
+    df = pd.DataFrame(
+        OrderedDict(
+            [
+                ("store", store_list[grid // (n_brands * n_weeks)]),
+                ("brand", brand_list[grid // n_weeks % n_brands]),
+                ("week", grid % n_weeks + np.int64(first_week)),
+            ]
+        )
+    )
+    # Taking -1 for missing keys upcasts the columns like a left merge. Adding the columns one
+    # at a time keeps a single temporary column in memory.
+    for c in sales.columns.drop(key_cols):
+        df[c] = take(sales[c].values, sales_rows, allow_fill=True)
+
+    # Merge with storedemo
+    demo_rows = pd.Index(storedemo["STORE"].values).get_indexer(df["store"].values)
+    for c in storedemo.columns.drop("STORE"):
+        df[c] = take(storedemo[c].values, demo_rows, allow_fill=True)
+
+    # Create timestamp
+    df["timestamp"] = FIRST_WEEK_START.to_datetime64() + (df["week"].values - 1) * np.timedelta64(7, "D")
+    return df
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -0,0 +1,338 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains a pure Python reader of the R data files (.rda, .RData) saved by R's
+save(), which decodes the XDR serialization format directly into NumPy arrays and pandas
+dataframes, so that no R installation is needed to read datasets distributed as R data.
+
+Atomic vectors, strings, lists, factors and data frames are supported, which covers the
+datasets of R packages. Functions, environments and other language objects are skipped
+over where possible and raise a ValueError otherwise.
+"""
+
+import bz2
+import gzip
+import lzma
+import struct
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+# Magic numbers of the supported R data file formats, after decompression
+RDATA_MAGIC = [b"RDX2\nX\n", b"RDX3\nX\n"]
+
+# R value of missing integers and logicals
+NA_INTEGER = -(2 ** 31)
+
+# SEXP types of the serialization format
+NILSXP = 0
+SYMSXP = 1
+LISTSXP = 2
+CLOSXP = 3
+ENVSXP = 4
+PROMSXP = 5
+LANGSXP = 6
+SPECIALSXP = 7
+BUILTINSXP = 8
+CHARSXP = 9
+LGLSXP = 10
+INTSXP = 13
+REALSXP = 14
+CPLXSXP = 15
+STRSXP = 16
+DOTSXP = 17
+VECSXP = 19
+EXPRSXP = 20
+RAWSXP = 24
+S4SXP = 25
+# Pseudo types of special values and references
+ALTREP_SXP = 238
+BASEENV_SXP = 241
+EMPTYENV_SXP = 242
+PERSISTSXP = 247
+PACKAGESXP = 248
+NAMESPACESXP = 249
+BASENAMESPACE_SXP = 250
+MISSINGARG_SXP = 251
+UNBOUNDVALUE_SXP = 252
+GLOBALENV_SXP = 253
+NILVALUE_SXP = 254
+REFSXP = 255
+
+PAIRLIST_TYPES = [LISTSXP, CLOSXP, PROMSXP, LANGSXP, DOTSXP]
+SPECIAL_TYPES = [
+    NILVALUE_SXP,
+    EMPTYENV_SXP,
+    BASEENV_SXP,
+    GLOBALENV_SXP,
+    UNBOUNDVALUE_SXP,
+    MISSINGARG_SXP,
+    BASENAMESPACE_SXP,
+]
+
+
+def read_rdata(path):
+    """Read the objects saved in an R data file.
+
+    Example:
+        objects = read_rdata("orangeJuice.rda")
+        yx, storedemo = objects["orangeJuice"]
+
+    Args:
+        path (str): Path of a gzip, bzip2, xz compressed or uncompressed .rda file
+
+    Returns:
+        OrderedDict: Objects in the file by name. Data frames are pandas dataframes, factors are
+            pandas categoricals, atomic vectors are NumPy arrays, named lists are OrderedDicts
+            and other lists are lists.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    return parse_rdata(data)
+
+
+def parse_rdata(data):
+    """Parse the content of an R data file, see read_rdata.
+
+    Args:
+        data (bytes): Content of the file, compressed or not
+
+    Returns:
+        OrderedDict: Objects in the file by name
+    """
+    data = _decompress(data)
+    magic = [m for m in RDATA_MAGIC if data.startswith(m)]
+    if not magic:
+        raise ValueError("Not an R data file in XDR format.")
+    reader = _XdrReader(data, len(magic[0]))
+    value = reader.read_item()
+    if not isinstance(value, _PairList):
+        raise ValueError("R data file does not contain a list of named objects.")
+    return OrderedDict(value.items)
+
+
+def _decompress(data):
+    if data[:2] == b"\x1f\x8b":
+        return gzip.decompress(data)
+    if data[:3] == b"BZh":
+        return bz2.decompress(data)
+    if data[:6] == b"\xfd7zXZ\x00":
+        return lzma.decompress(data)
+    return data
+
+
+class _PairList:
+    """Tagged values of an R pairlist."""
+
+    def __init__(self, items):
+        self.items = items
+
+
+class _XdrReader:
+    """Reader of R objects serialized in XDR (big-endian) format."""
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+        self.refs = []
+        version = self.read_int()
+        self.read_int()  # Version of R that wrote the file
+        self.read_int()  # Minimal version of R that can read the file
+        if version == 3:
+            self.read_bytes(self.read_int())  # Native encoding
+        elif version != 2:
+            raise ValueError("Unsupported R serialization format version {}.".format(version))
+
+    def read_bytes(self, n):
+        start = self.offset
+        self.offset += n
+        if self.offset > len(self.data):
+            raise ValueError("Unexpected end of R data file.")
+        return self.data[start : self.offset]
+
+    def read_int(self):
+        return struct.unpack(">i", self.read_bytes(4))[0]
+
+    def read_length(self):
+        length = self.read_int()
+        if length == -1:
+            upper, lower = struct.unpack(">II", self.read_bytes(8))
+            length = (upper << 32) + lower
+        return length
+
+    def read_array(self, dtype, length):
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.read_bytes(length * dtype.itemsize), dtype=dtype).astype(dtype.newbyteorder("="))
+
+    def read_string(self):
+        """Value of a CHARSXP, or None for NA_character_."""
+        flags = self.read_int()
+        if flags & 0xFF != CHARSXP:
+            raise ValueError("Expected a string in R data file.")
+        length = self.read_int()
+        if length == -1:
+            return None
+        # Strings flagged as LATIN1 (1 << 2) are decoded as such, others as UTF-8
+        return self.read_bytes(length).decode("latin-1" if (flags >> 12) & 4 else "utf-8", errors="replace")
+
+    def read_item(self):
+        flags = self.read_int()
+        sexp_type = flags & 0xFF
+        has_attr, has_tag = flags & (1 << 9), flags & (1 << 10)
+
+        if sexp_type in SPECIAL_TYPES:
+            return None
+        if sexp_type == REFSXP:
+            index = flags >> 8
+            return self.refs[(index if index else self.read_int()) - 1]
+        if sexp_type == SYMSXP:
+            name = self.read_string()
+            self.refs.append(name)
+            return name
+        if sexp_type in (PERSISTSXP, PACKAGESXP, NAMESPACESXP):
+            # Reference to a package or namespace environment by name
+            self.read_int()
+            for _ in range(self.read_int()):
+                self.read_item()
+            self.refs.append(None)
+            return None
+        if sexp_type == ENVSXP:
+            self.refs.append(None)
+            self.read_int()  # Locked
+            for _ in range(4):  # Enclosure, frame, hash table and attributes
+                self.read_item()
+            return None
+        if sexp_type == ALTREP_SXP:
+            return self.read_altrep()
+        if sexp_type == CHARSXP:
+            # Strings outside of a character vector, e.g. in the name of a namespace
+            self.offset -= 4
+            return self.read_string()
+        if sexp_type in (SPECIALSXP, BUILTINSXP):
+            # Primitive function, saved by name
+            self.read_bytes(self.read_int())
+            return None
+
+        if sexp_type in PAIRLIST_TYPES:
+            if has_attr:
+                self.read_attributes()
+            items = []
+            while True:
+                tag = self.read_item() if has_tag else None
+                items.append((tag, self.read_item()))
+                flags = self.read_int()
+                if flags & 0xFF == NILVALUE_SXP:
+                    break
+                if flags & 0xFF not in PAIRLIST_TYPES:
+                    # The end of the list is another object, e.g. the body of a function
+                    self.offset -= 4
+                    self.read_item()
+                    break
+                if flags & (1 << 9):
+                    self.read_attributes()
+                has_tag = flags & (1 << 10)
+            return _PairList(items) if sexp_type == LISTSXP else None
+
+        if sexp_type in (LGLSXP, INTSXP):
+            value = self.read_array(">i4", self.read_length())
+        elif sexp_type == REALSXP:
+            value = self.read_array(">f8", self.read_length())
+        elif sexp_type == CPLXSXP:
+            value = self.read_array(">c16", self.read_length())
+        elif sexp_type == STRSXP:
+            value = np.array([self.read_string() for _ in range(self.read_length())], dtype=object)
+        elif sexp_type in (VECSXP, EXPRSXP):
+            value = [self.read_item() for _ in range(self.read_length())]
+        elif sexp_type == RAWSXP:
+            value = np.frombuffer(self.read_bytes(self.read_length()), dtype=np.uint8)
+        elif sexp_type == S4SXP:
+            value = None
+        else:
+            raise ValueError("Unsupported object type {} in R data file.".format(sexp_type))
+
+        attributes = self.read_attributes() if has_attr else {}
+        return _convert(value, sexp_type, attributes)
+
+    def read_attributes(self):
+        attributes = self.read_item()
+        return OrderedDict(attributes.items) if isinstance(attributes, _PairList) else {}
+
+    def read_altrep(self):
+        """Value of a compact sequence or wrapper object, which R 3.5 and later may serialize
+        instead of the plain vector."""
+        info = self.read_item()
+        state = self.read_item()
+        attributes = self.read_item()
+        attributes = OrderedDict(attributes.items) if isinstance(attributes, _PairList) else {}
+        # The information is a pairlist of the class name, the package name and the vector type
+        class_name, sexp_type = info.items[0][1], int(info.items[2][1][0])
+        if class_name in ("compact_intseq", "compact_realseq"):
+            length, start, step = np.asarray(state, dtype=np.float64)[:3]
+            value = start + step * np.arange(int(length))
+            value = value.astype(np.int32) if class_name == "compact_intseq" else value
+        elif class_name.startswith("wrap_"):
+            # The state is a pairlist of the wrapped vector and of its metadata
+            value = state.items[0][1] if isinstance(state, _PairList) else state[0]
+        elif class_name == "deferred_string":
+            # The state is a pairlist of the numbers to convert to strings and of a scalar
+            numbers = state.items[0][1] if isinstance(state, _PairList) else state
+            value = np.array([_number_string(x) for x in numbers], dtype=object)
+        else:
+            raise ValueError("Unsupported compact object {} in R data file.".format(class_name))
+        return _convert(value, sexp_type, attributes) if attributes else value
+
+
+def _convert(value, sexp_type, attributes):
+    """Python value of an R vector with its attributes."""
+    classes = list(attributes.get("class", []))
+    names = attributes.get("names")
+
+    if "factor" in classes:
+        codes = np.where(value == NA_INTEGER, -1, value - 1)
+        return pd.Categorical.from_codes(codes, list(attributes["levels"]), ordered="ordered" in classes)
+    if "data.frame" in classes:
+        names = names if names is not None else [str(i) for i in range(len(value))]
+        columns = OrderedDict((name, _column(column)) for name, column in zip(names, value))
+        df = pd.DataFrame(columns, columns=list(columns))
+        row_names = attributes.get("row.names")
+        # Automatic row names are stored in the compact form c(NA, n) or c(NA, -n), other row
+        # names are strings or integers
+        compact = row_names is None or (
+            len(row_names) == 2 and row_names.dtype == np.int32 and row_names[0] == NA_INTEGER
+        )
+        if not compact:
+            df.index = pd.Index(row_names, dtype=row_names.dtype)
+        elif len(df.columns) == 0 and row_names is not None:
+            df = pd.DataFrame(index=pd.RangeIndex(abs(int(row_names[1]))))
+        return df
+    if sexp_type == LGLSXP:
+        return np.where(value == NA_INTEGER, np.nan, value) if (value == NA_INTEGER).any() else value.astype(bool)
+    if sexp_type in (VECSXP, EXPRSXP) and names is not None:
+        return OrderedDict(zip(names, value))
+    return value
+
+
+def _column(values):
+    """Data frame column of an R vector, where missing integers become NaN."""
+    if isinstance(values, np.ndarray) and values.dtype == np.int32:
+        missing = values == NA_INTEGER
+        return np.where(missing, np.nan, values) if missing.any() else values
+    return values
+
+
+def _number_string(x):
+    """String of a number formatted like as.character in R, or None for NA."""
+    if isinstance(x, (int, np.integer)):
+        return None if x == NA_INTEGER else str(x)
+    if np.isnan(x):
+        # NA_real_ is the NaN with the low word 1954
+        return None if np.float64(x).view(np.uint64) & 0xFFFFFFFF == 1954 else "NaN"
+    if np.isinf(x):
+        return "Inf" if x > 0 else "-Inf"
+    # Like R, up to 15 significant digits in fixed notation unless scientific notation is shorter
+    mantissa, exponent = "{:.14e}".format(x).split("e")
+    mantissa = mantissa.rstrip("0").rstrip(".")
+    scientific = "{}e{}{:02d}".format(mantissa, exponent[0], abs(int(exponent)))
+    fixed = np.format_float_positional(float(mantissa + "e" + exponent), trim="-")
+    return fixed if len(fixed) <= len(scientific) else scientific
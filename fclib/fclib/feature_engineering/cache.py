@@ -0,0 +1,186 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains an on-disk cache for computed feature dataframes, so that forecast
+rounds and hyperparameter tuning trials that work on overlapping data can reuse
+features that were already computed instead of rebuilding them.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+from fclib.common.columnar import MANIFEST_FILE, save_columnar, load_columnar
+
+
+class FeatureCache:
+    """Content-addressed cache of feature dataframes stored as columnar files.
+
+    Every entry is keyed by a hash of the input data slice and of the feature
+    specification, and is stored as a directory of per-column .npy files (see
+    fclib.common.columnar). Entries are written to a temporary directory and renamed into
+    place, so several processes can share a cache directory: readers never see partially
+    written entries, and concurrent writers of the same entry produce the same content.
+    When the cache grows beyond max_bytes, the least recently used entries are evicted.
+
+    Example:
+        cache = FeatureCache("./feature_cache")
+        spec = {"lags": list(lags), "window_size": window_size}
+        features = cache.compute_by_block(
+            data_filled, "week", spec,
+            lambda df: grouped_lag_features(df, ["store", "brand"], "week", ["move"], lags, window_size),
+            block_size=13, history=max(lags) + window_size,
+        )
+
+    Args:
+        cache_dir (str): Directory of the cache, which is created if it does not exist
+        max_bytes (int): Size budget of the cache in bytes
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 ** 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, df, spec):
+        """Hash of the content of a dataframe, excluding its index, and of a feature specification.
+
+        Args:
+            df (pd.DataFrame): Input data
+            spec (object): JSON-serializable description of the features computed from df
+
+        Returns:
+            str: Hexadecimal key
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(spec, sort_keys=True, default=str).encode())
+        digest.update(json.dumps([str(c) for c in df.columns] + [str(t) for t in df.dtypes]).encode())
+        digest.update(np.ascontiguousarray(pd.util.hash_pandas_object(df, index=False).values).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the dataframe stored under key, or None if there is no such entry."""
+        path = os.path.join(self.cache_dir, key)
+        try:
+            df = load_columnar(path)
+            # The modification time of the manifest records the last access for LRU eviction
+            os.utime(os.path.join(path, MANIFEST_FILE))
+        except (IOError, OSError, ValueError):
+            # The entry does not exist or was evicted by another process while reading
+            self.misses += 1
+            return None
+        self.hits += 1
+        return df
+
+    def put(self, key, df):
+        """Store a dataframe under key and evict least recently used entries if needed."""
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+        try:
+            save_columnar(df, tmp_dir)
+            os.rename(tmp_dir, os.path.join(self.cache_dir, key))
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def get_or_compute(self, df, spec, func):
+        """Return func(df) from the cache, computing and storing it on a cache miss.
+
+        Entries do not depend on the index of df, so the same rows at different row labels,
+        e.g. in the data grids of two forecast rounds, share an entry.
+
+        Args:
+            df (pd.DataFrame): Input data
+            spec (object): JSON-serializable description of the features computed by func
+            func (function): Function that computes features with one row for every row of df
+
+        Returns:
+            pd.DataFrame: Features computed by func, indexed like df
+        """
+        key = self.key(df, spec)
+        fea = self.get(key)
+        if fea is None:
+            fea = func(df)
+            self.put(key, fea.reset_index(drop=True))
+        fea.index = df.index
+        return fea
+
+    def compute_by_block(self, df, time_col, spec, func, block_size, history):
+        """Compute features block by block of time, reusing blocks that are already in the cache.
+
+        The time axis is cut into blocks of block_size time units aligned at multiples of
+        block_size, so that consecutive forecast rounds share all the blocks except the last
+        ones. The features of each block are computed by func from the rows of the block and
+        of the history preceding time units, and cached under the hash of that slice.
+
+        Args:
+            df (pd.DataFrame): Input data
+            time_col (str): Name of an integer time column, e.g. the week number
+            spec (object): JSON-serializable description of the features computed by func
+            func (function): Function that computes features with one row for every row of its
+                input dataframe, using only the past of every row
+            block_size (int): Number of time units in each block
+            history (int): Number of time units before each row that func needs, e.g. the
+                maximum lag plus the window size of moving averages
+
+        Returns:
+            pd.DataFrame: Features of all the rows of df, indexed like df
+        """
+        time = df[time_col].values
+        blocks = np.unique(time // block_size)
+        fea = []
+        for block in blocks:
+            start, end = block * block_size, (block + 1) * block_size
+            rows = (time >= start - history) & (time < end)
+            data = df[rows]
+            block_fea = self.get_or_compute(data, {"spec": spec, "time_col": time_col}, func)
+            fea.append(block_fea[(data[time_col] >= start).values])
+        return pd.concat(fea).reindex(df.index)
+
+    def size(self):
+        """Total size in bytes of the entries in the cache."""
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, name, size in entries:
+            if total <= self.max_bytes:
+                break
+            # Renaming first makes the removal atomic for readers in other processes
+            trash = os.path.join(self.cache_dir, ".evict-" + uuid.uuid4().hex)
+            try:
+                os.rename(os.path.join(self.cache_dir, name), trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove all the entries of the cache."""
+        for _, name, _ in self._entries():
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+    def _entries(self):
+        """(last access time, name, size in bytes) of every complete entry."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith("."):
+                continue
+            try:
+                files = [os.path.join(path, f) for f in os.listdir(path)]
+                size = sum(os.path.getsize(f) for f in files)
+                entries.append((os.path.getmtime(os.path.join(path, MANIFEST_FILE)), name, size))
+            except OSError:
+                continue
+        return entries
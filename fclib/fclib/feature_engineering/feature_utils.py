@@ -7,15 +7,17 @@ series forecasting applications. All functions defined assume that
 there is no missing data.
 """
 
-import calendar
-import itertools
 import pandas as pd
 import numpy as np
 import datetime
 from datetime import timedelta
+from numpy.lib.stride_tricks import as_strided
 from sklearn.preprocessing import MinMaxScaler
 from dateutil.relativedelta import relativedelta
 
+from fclib.common.panel import TimeSeriesPanel
+from fclib.feature_engineering.scaling import GroupedScaler
+
 ALLOWED_TIME_COLUMN_TYPES = [
     pd.Timestamp,
     pd.DatetimeIndex,
@@ -29,8 +31,28 @@ WEEK_DAY_TYPE_MAP = {1: 2, 3: 2}  # Map for converting Wednesday and
 HOLIDAY_CODE = 7
 SEMI_HOLIDAY_CODE = 8  # days before and after a holiday
 
+# Day type of each day of the week, indexed by day of week (0: Monday)
+DAY_TYPE_LOOKUP = np.array([0, 2, 2, 2, 4, 5, 6], dtype=np.int64)
+EPOCH_WEEKDAY = 3  # 1970-01-01 is a Thursday
+
+# Statistics supported by rolling_features
+ROLLING_STATS = ["mean", "std", "min", "max", "sum", "ewm"]
+
+# Period lengths of the seasonalities supported by fourier_features
+FOURIER_PERIODS = {"annual": 365.24, "weekly": 7, "daily": 24}
+
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# Units supported by add_datetime, with their length in nanoseconds for fixed-length units
+DATETIME_UNITS = {
+    "year": None,
+    "month": None,
+    "week": 7 * 24 * 3600 * 10 ** 9,
+    "day": 24 * 3600 * 10 ** 9,
+    "hour": 3600 * 10 ** 9,
+    "minute": 60 * 10 ** 9,
+}
+
 
 def is_datetime_like(x):
     """Function that checks if a data frame column x is of a datetime type."""
@@ -48,40 +70,227 @@ def day_type(datetime_col, holiday_col=None, semi_holiday_offset=timedelta(days=
     7: Holiday
     8: Days before and after a holiday
 
+    All computations are done on int64 day ordinals (days since the Unix
+    epoch), so the cost does not depend on how many holidays there are.
+
     Args:
         datetime_col: Datetime column.
         holiday_col: Holiday code column. Default value None.
         semi_holiday_offset: Time difference between the date before (or after)
-            the holiday and the holiday. Default value timedelta(days=1).
+            the holiday and the holiday. Either a single timedelta applied on
+            both sides or a (before, after) tuple of timedeltas. Offsets are
+            truncated to whole days. Default value timedelta(days=1).
     
     Returns:
         A numpy array containing converted datatime_col into day types.
     """
 
-    datetype = pd.DataFrame({"DayType": datetime_col.dt.dayofweek})
-    datetype.replace({"DayType": WEEK_DAY_TYPE_MAP}, inplace=True)
+    days = _day_ordinals(datetime_col)
+    datetype = DAY_TYPE_LOOKUP[(days + EPOCH_WEEKDAY) % 7]
 
     if holiday_col is not None:
-        holiday_mask = holiday_col > 0
-        datetype.loc[holiday_mask, "DayType"] = HOLIDAY_CODE
+        holiday_mask = np.asarray(holiday_col) > 0
+        datetype[holiday_mask] = HOLIDAY_CODE
+
+        holiday_days = np.unique(days[holiday_mask])
+        if len(holiday_days) > 0:
+            if isinstance(semi_holiday_offset, tuple):
+                before, after = semi_holiday_offset
+            else:
+                before = after = semi_holiday_offset
+            before = before // timedelta(days=1)
+            after = after // timedelta(days=1)
+
+            # A day is within the window of a holiday h if h - before <= day <= h + after,
+            # i.e. if the first holiday >= day - after is also <= day + before
+            idx = np.searchsorted(holiday_days, days - after, side="left")
+            near_holiday = holiday_days[np.minimum(idx, len(holiday_days) - 1)] <= days + before
+            near_holiday &= idx < len(holiday_days)
+
+            idx = np.searchsorted(holiday_days, days, side="left")
+            is_holiday = holiday_days[np.minimum(idx, len(holiday_days) - 1)] == days
+
+            datetype[near_holiday & ~is_holiday] = SEMI_HOLIDAY_CODE
+
+    return datetype
+
+
+def _datetime64_values(datetime_col):
+    """Returns the values of a datetime column as a datetime64[ns] numpy array."""
+    return np.asarray(datetime_col, dtype="datetime64[ns]")
+
+
+def _day_ordinals(datetime_col):
+    """Returns the number of days since 1970-01-01 of every entry of a datetime column."""
+    return _datetime64_values(datetime_col).astype("datetime64[D]").astype(np.int64)
+
+
+def unique_timestamps(datetime_col):
+    """Factorize a datetime column into its distinct timestamps.
+
+    Args:
+        datetime_col: Datetime column.
+
+    Returns:
+        np.array: Distinct timestamps as datetime64[ns], in order of first appearance
+        np.array: Position of the timestamp of every row in the distinct timestamps
+    """
+    codes, uniques = pd.factorize(_datetime64_values(datetime_col).view(np.int64))
+    return np.asarray(uniques).view("datetime64[ns]"), codes
+
+
+def on_unique_timestamps(func, datetime_col, *args, row_kwargs=None, **kwargs):
+    """Compute a calendar feature once per distinct timestamp and broadcast it to all the rows.
+
+    In a panel of many series that share one calendar, the cost of the feature then grows
+    with the number of distinct timestamps instead of the number of rows.
+
+    Example:
+        week_of_month_col = on_unique_timestamps(week_of_month, df["week_start"])
+        fourier, columns = on_unique_timestamps(fourier_features, df["week_start"], n_harmonics=3)
+        day_type_col = on_unique_timestamps(day_type, df["date"], row_kwargs={"holiday_col": df["holiday"]})
+
+    Args:
+        func (function): Feature function of this module that takes a datetime column as its
+            first argument, e.g. month_of_year, day_type, annual_fourier or fourier_features
+        datetime_col: Datetime column.
+        args, kwargs: Other arguments of func
+        row_kwargs (dict): Keyword arguments of func that have one value per row of
+            datetime_col, e.g. {"holiday_col": df["holiday"]} for day_type. The feature is then
+            computed once per distinct combination of a timestamp and the values of these
+            arguments. Default value None.
+
+    Returns:
+        The output of func for the rows of datetime_col. Series, arrays and dataframes, also
+        inside dicts and tuples, have one entry per row; Series and dataframes are indexed
+        like datetime_col if it is a Series.
+
+    Raises:
+        ValueError: if a value of row_kwargs does not have one value per row of datetime_col
+    """
+    uniques, codes = unique_timestamps(datetime_col)
+    index = datetime_col.index if isinstance(datetime_col, pd.Series) else None
+    if row_kwargs:
+        row_values = {name: np.asarray(value) for name, value in row_kwargs.items()}
+        for name, values in row_values.items():
+            if len(values) != len(codes):
+                raise ValueError("{} must have one value per row of datetime_col.".format(name))
+            # Missing values get code 0 and the others are numbered from 1
+            value_codes = pd.factorize(values)[0] + 1
+            codes = pd.factorize(codes * (value_codes.max(initial=0) + 1) + value_codes)[0]
+        _, first_rows = np.unique(codes, return_index=True)
+        uniques = _datetime64_values(datetime_col)[first_rows]
+        kwargs = dict(kwargs, **{name: values[first_rows] for name, values in row_values.items()})
+    return _take_rows(func(pd.Series(uniques), *args, **kwargs), codes, index, len(uniques))
+
+
+def _take_rows(result, codes, index, n_unique):
+    """Select the rows codes of the output of a feature function, see on_unique_timestamps."""
+    if isinstance(result, dict):
+        return {key: _take_rows(value, codes, index, n_unique) for key, value in result.items()}
+    elif isinstance(result, tuple):
+        return tuple(_take_rows(value, codes, index, n_unique) for value in result)
+    elif isinstance(result, pd.DataFrame):
+        return pd.DataFrame(result.values[codes], index=index, columns=result.columns)
+    elif isinstance(result, pd.Series):
+        return pd.Series(result.values[codes], index=index, name=result.name)
+    elif isinstance(result, np.ndarray) and result.ndim > 0 and len(result) == n_unique:
+        return result[codes]
+    return result
+
+
+class CalendarArrays:
+    """Calendar arrays of a datetime column, i.e. the timestamps truncated to days, months and
+    years, which are computed lazily at most once and shared by all the calendar and Fourier
+    features computed from them with CALENDAR_KERNELS and fourier_features.
+
+    Example:
+        calendar = CalendarArrays(df["date"])
+        month = CALENDAR_KERNELS["month_of_year"](calendar)
+        fourier, names = fourier_features(calendar, periods={"annual": FOURIER_PERIODS["annual"]})
+
+    Args:
+        datetime_col (pd.Series or np.array): Datetime values
+        cache (dict): Truncated arrays by unit ("D", "M" or "Y") to start from
+    """
+
+    def __init__(self, datetime_col, cache=None):
+        self.values = _datetime64_values(datetime_col)
+        self._cache = {} if cache is None else cache
+
+    def _truncated(self, unit):
+        if unit not in self._cache:
+            self._cache[unit] = self.values.astype("datetime64[" + unit + "]")
+        return self._cache[unit]
+
+    @property
+    def days(self):
+        return self._truncated("D")
+
+    @property
+    def months(self):
+        return self._truncated("M")
+
+    @property
+    def years(self):
+        return self._truncated("Y")
+
+    def rows(self, start, stop):
+        """Calendar arrays of the rows from start to stop, sharing the arrays computed so far."""
+        return CalendarArrays(self.values[start:stop], {unit: v[start:stop] for unit, v in self._cache.items()})
+
+
+def _year_array(calendar):
+    return calendar.years.astype(np.int64) + 1970
 
-        # Create a temporary Date column to calculate dates near the holidays
-        datetype["Date"] = pd.to_datetime(datetime_col.dt.date, format=DATETIME_FORMAT)
-        holiday_dates = set(datetype.loc[holiday_mask, "Date"])
 
-        semi_holiday_dates = [
-            pd.date_range(start=d - semi_holiday_offset, end=d + semi_holiday_offset, freq="D") for d in holiday_dates
-        ]
+def _month_of_year_array(calendar):
+    return calendar.months.astype(np.int64) % 12 + 1
 
-        # Flatten the list of lists
-        semi_holiday_dates = [d for dates in semi_holiday_dates for d in dates]
 
-        semi_holiday_dates = set(semi_holiday_dates)
-        semi_holiday_dates = semi_holiday_dates.difference(holiday_dates)
+def _day_of_week_array(calendar):
+    """Day of the week, 0 on Mondays like pandas dayofweek."""
+    return (calendar.days.astype(np.int64) + EPOCH_WEEKDAY) % 7
 
-        datetype.loc[datetype["Date"].isin(semi_holiday_dates), "DayType"] = SEMI_HOLIDAY_CODE
 
-    return datetype["DayType"].values
+def _hour_of_day_array(calendar):
+    return (calendar.values - calendar.days).astype("timedelta64[h]").astype(np.int64)
+
+
+def _day_of_month_array(calendar):
+    return (calendar.days - calendar.months.astype("datetime64[D]")).astype(np.int64) + 1
+
+
+def _week_of_month_array(calendar):
+    """Vectorized week of month, i.e. ceil((day of month + weekday of the 1st) / 7)."""
+    first_weekday = (calendar.months.astype("datetime64[D]").astype(np.int64) + EPOCH_WEEKDAY) % 7
+    return (_day_of_month_array(calendar) + first_weekday + 6) // 7
+
+
+def _day_of_year_array(calendar):
+    return (calendar.days - calendar.years.astype("datetime64[D]")).astype(np.int64) + 1
+
+
+def _time_of_year_array(calendar):
+    """Hours since the start of the year divided by the number of hours in the year minus one."""
+    time_of_year = (_day_of_year_array(calendar) - 1) * 24 + _hour_of_day_array(calendar)
+    year = _year_array(calendar)
+    is_leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    year_length = np.where(is_leap, 366, 365)
+    return time_of_year / (year_length * 24 - 1)
+
+
+# Array kernels of calendar features, by name, which take CalendarArrays
+CALENDAR_KERNELS = {
+    "year": _year_array,
+    "month_of_year": _month_of_year_array,
+    "week_of_month": _week_of_month_array,
+    "day_of_week": _day_of_week_array,
+    "day_of_month": _day_of_month_array,
+    "day_of_year": _day_of_year_array,
+    "hour_of_day": _hour_of_day_array,
+    "time_of_year": _time_of_year_array,
+}
 
 
 def hour_of_day(datetime_col):
@@ -103,16 +312,7 @@ def time_of_year(datetime_col):
         A numpy array containing converted datatime_col into time of year.
     """
 
-    time_of_year = pd.DataFrame(
-        {"DayOfYear": datetime_col.dt.dayofyear, "HourOfDay": datetime_col.dt.hour, "Year": datetime_col.dt.year}
-    )
-    time_of_year["TimeOfYear"] = (time_of_year["DayOfYear"] - 1) * 24 + time_of_year["HourOfDay"]
-
-    time_of_year["YearLength"] = time_of_year["Year"].apply(lambda y: 366 if calendar.isleap(y) else 365)
-
-    time_of_year["TimeOfYear"] = time_of_year["TimeOfYear"] / (time_of_year["YearLength"] * 24 - 1)
-
-    return time_of_year["TimeOfYear"].values
+    return _time_of_year_array(CalendarArrays(datetime_col))
 
 
 def week_of_year(datetime_col):
@@ -124,10 +324,11 @@ def week_of_month(date_time):
     """Returns the week of the month for a specified date.
 
     Args:
-        dt (Datetime): Input date
+        dt (Datetime): Input date, or a datetime column/array of dates
 
     Returns:
-        wom (Integer): Week of the month of the input date
+        wom (Integer): Week of the month of the input date. An int64 array (a Series if
+            the input is a Series) is returned for array inputs.
     """
 
     def _week_of_month(date_time):
@@ -140,7 +341,9 @@ def week_of_month(date_time):
         return wom
 
     if isinstance(date_time, pd.Series):
-        return date_time.apply(lambda x: _week_of_month(x))
+        return pd.Series(_week_of_month_array(CalendarArrays(date_time)), index=date_time.index, name=date_time.name)
+    elif isinstance(date_time, (pd.DatetimeIndex, np.ndarray)):
+        return _week_of_month_array(CalendarArrays(date_time))
     else:
         return _week_of_month(date_time)
 
@@ -270,7 +473,7 @@ def normalized_current_datehour(datetime_col, min_datehour, max_datehour):
     """
     Temporal feature indicating the position of the hour of a record in the
     entire time period under consideration, normalized to be between 0 and 1.
-    
+
     Args:
         datetime_col: Datetime column.
         min_datehour: minimum value of datehour.
@@ -279,18 +482,31 @@ def normalized_current_datehour(datetime_col, min_datehour, max_datehour):
     Returns:
         float: the position of the current datehour in the min_datehour:max_datehour range
     """
-    current_datehour = (datetime_col - min_datehour).apply(lambda x: x.days * 24 + x.seconds / 3600)
+    min_datehour = np.datetime64(pd.Timestamp(min_datehour).to_datetime64(), "ns")
+    max_datehour = np.datetime64(pd.Timestamp(max_datehour).to_datetime64(), "ns")
+    current_datehour = _timedelta_hours(_datetime64_values(datetime_col) - min_datehour)
 
-    max_min_diff = max_datehour - min_datehour
+    max_min_diff = _timedelta_hours(np.array([max_datehour - min_datehour]))[0]
 
     if max_min_diff != 0:
-        current_datehour = current_datehour / (max_min_diff.days * 24 + max_min_diff.seconds / 3600)
+        current_datehour = current_datehour / max_min_diff
+        if isinstance(datetime_col, pd.Series):
+            current_datehour = pd.Series(current_datehour, index=datetime_col.index)
     else:
-        current_datehour = pd.Series([0 for x in range(len(datetime_col))])
+        current_datehour = pd.Series(np.zeros(len(datetime_col), dtype=np.int64))
 
     return current_datehour
 
 
+def _timedelta_hours(timedelta_values):
+    """Converts timedelta64 values into hours as days * 24 + seconds / 3600, ignoring
+    fractions of a second like datetime.timedelta does."""
+    # Casting to seconds floors, which matches the days/seconds normalization of datetime.timedelta
+    seconds = timedelta_values.astype("timedelta64[s]").astype(np.int64)
+    days, seconds = np.divmod(seconds, 86400)
+    return days * 24 + seconds / 3600
+
+
 def normalized_columns(datetime_col, value_col, mode="log", output_colname="normalized_columns"):
     """
     Creates columns normalized to be log of input columns devided by global average of each columns,
@@ -426,20 +642,156 @@ def daily_fourier(datetime_col, n_harmonics):
     return output_dict
 
 
-def df_from_cartesian_product(dict_in):
+def fourier_features(datetime_col, periods=None, n_harmonics=3, dtype=np.float32, out=None, chunk_size=4096):
+    """
+    Creates a matrix of Fourier features for several periods at once.
+
+    Only the first harmonic of each period is computed with trigonometric functions,
+    higher harmonics are derived with the angle-addition recurrence
+    sin((n+1)x) = sin(nx)cos(x) + cos(nx)sin(x), cos((n+1)x) = cos(nx)cos(x) - sin(nx)sin(x).
+    The recurrence runs in float64 over chunks of rows, so temporary memory is bounded
+    by chunk_size regardless of the number of rows and harmonics.
+
+    Args:
+        datetime_col: Datetime column.
+        periods (dict): Maps the name of a seasonality to the length of its period. Valid
+            names are the keys of FOURIER_PERIODS ("annual", "weekly", "daily"), which
+            define the time variable used for the seasonality. Default value None uses
+            all the periods in FOURIER_PERIODS.
+        n_harmonics (int or dict): Number of harmonics, either for all the periods or
+            as a dict mapping each period name to its number of harmonics.
+        dtype: Data type of the output matrix. Default value np.float32.
+        out (np.array): Optional preallocated C-contiguous output matrix of shape
+            (len(datetime_col), number of features), in which case dtype is ignored.
+        chunk_size (int): Number of rows processed at once.
+
+    Returns:
+        np.array: Matrix containing the sine and cosine components of all the harmonics
+        list[str]: Names of the columns, e.g. "annual_sin_1", "annual_cos_1", ...
+    """
+    if periods is None:
+        periods = FOURIER_PERIODS
+    for name in periods:
+        if name not in FOURIER_PERIODS:
+            raise ValueError("Valid period names are {}".format(", ".join(FOURIER_PERIODS)))
+    if not isinstance(n_harmonics, dict):
+        n_harmonics = {name: n_harmonics for name in periods}
+
+    columns = []
+    for name in periods:
+        for n in range(1, n_harmonics[name] + 1):
+            columns += [name + "_sin_" + str(n), name + "_cos_" + str(n)]
+
+    calendar = datetime_col if isinstance(datetime_col, CalendarArrays) else CalendarArrays(datetime_col)
+    n_rows = len(calendar.values)
+    if out is None:
+        out = np.empty((n_rows, len(columns)), dtype=dtype)
+    elif out.shape != (n_rows, len(columns)):
+        raise ValueError("out should have shape {}".format((n_rows, len(columns))))
+
+    # Harmonics are computed into a column-major float64 block for each chunk of rows,
+    # which is then transposed into the output in one copy
+    block = np.empty((len(columns), min(chunk_size, n_rows)))
+    for start in range(0, n_rows, chunk_size):
+        chunk = calendar.rows(start, start + chunk_size)
+        chunk_block = block[:, : len(chunk.values)]
+        row = 0
+        for name, period in periods.items():
+            x = 2 * np.pi * _fourier_time(chunk, name) / period
+            sin_1, cos_1 = np.sin(x, out=chunk_block[row]), np.cos(x, out=chunk_block[row + 1])
+            for n in range(2, n_harmonics[name] + 1):
+                sin_n, cos_n = chunk_block[row], chunk_block[row + 1]
+                row += 2
+                np.multiply(sin_n, cos_1, out=chunk_block[row])
+                chunk_block[row] += cos_n * sin_1
+                np.multiply(cos_n, cos_1, out=chunk_block[row + 1])
+                chunk_block[row + 1] -= sin_n * sin_1
+            row += 2
+        out[start : start + len(chunk.values)] = chunk_block.T
+
+    return out, columns
+
+
+def _fourier_time(calendar, name):
+    """Time variable of a seasonality as used in annual_fourier, weekly_fourier and daily_fourier."""
+    if name == "annual":
+        return _day_of_year_array(calendar).astype(np.float64)
+    elif name == "weekly":
+        return (_day_of_week_array(calendar) + 1).astype(np.float64)
+    else:
+        return (_hour_of_day_array(calendar) + 1).astype(np.float64)
+
+
+def df_from_cartesian_product(dict_in, categorical=False):
     """Generate a Pandas dataframe from Cartesian product of lists.
     
     Args: 
         dict_in (Dictionary): Dictionary containing multiple lists, e.g. {"fea1": list1, "fea2": list2}
+        categorical (Boolean): Whether to return categorical columns, whose categories are the
+            distinct values of each list and whose values are stored as compact integer codes
         
     Returns:
         df (Dataframe): Dataframe corresponding to the Caresian product of the lists
     """
-    from itertools import product
+    lists = [_product_values(v) for v in dict_in.values()]
+    sizes = [len(v) for v in lists]
+    n_rows = int(np.prod(sizes))
+
+    codes = []
+    for i, size in enumerate(sizes):
+        repeats = int(np.prod(sizes[i + 1 :]))
+        codes.append(np.tile(np.repeat(np.arange(size), repeats), n_rows // (size * repeats) if n_rows else 0))
+
+    return _df_from_codes(dict_in.keys(), lists, codes, pd.RangeIndex(n_rows), categorical)
+
+
+def cartesian_product_chunks(dict_in, chunk_size, categorical=False):
+    """Generate the dataframe of df_from_cartesian_product in chunks of rows, e.g. to merge a
+    very large grid with other data chunk by chunk.
+
+    Args:
+        dict_in (Dictionary): Dictionary containing multiple lists, e.g. {"fea1": list1, "fea2": list2}
+        chunk_size (Integer): Maximum number of rows of each chunk
+        categorical (Boolean): Whether to return categorical columns
 
-    cart = list(product(*dict_in.values()))
-    df = pd.DataFrame(cart, columns=dict_in.keys())
-    return df
+    Returns:
+        object: A generator of dataframes whose concatenation is df_from_cartesian_product(dict_in)
+    """
+    lists = [_product_values(v) for v in dict_in.values()]
+    sizes = [len(v) for v in lists]
+    strides = [int(np.prod(sizes[i + 1 :])) for i in range(len(sizes))]
+    n_rows = int(np.prod(sizes))
+
+    for start in range(0, n_rows, chunk_size):
+        rows = np.arange(start, min(start + chunk_size, n_rows))
+        codes = [(rows // stride) % size for stride, size in zip(strides, sizes)]
+        yield _df_from_codes(dict_in.keys(), lists, codes, pd.RangeIndex(rows[0], rows[-1] + 1), categorical)
+
+
+def _product_values(values):
+    """Values of a list of a Cartesian product as a series, whose data type is inferred like
+    the columns of a dataframe built from the rows of the product, e.g. mixed types stay objects."""
+    if not isinstance(values, (np.ndarray, pd.Index, pd.Series)):
+        values = list(values)
+    return pd.Series(values).reset_index(drop=True)
+
+
+def _df_from_codes(names, lists, codes, index, categorical):
+    """Build a dataframe whose columns take the values of lists at positions codes. Categorical
+    columns have the distinct values of each list as categories, in order of first appearance."""
+    columns = {}
+    for name, values, col_codes in zip(names, lists, codes):
+        if categorical:
+            value_codes, categories = pd.factorize(values)
+            code_type = np.promote_types(np.min_scalar_type(max(len(categories) - 1, 0)), np.int8)
+            columns[name] = pd.Categorical.from_codes(value_codes.astype(code_type)[col_codes], categories=categories)
+        elif isinstance(values.dtype, np.dtype):
+            columns[name] = values.values[col_codes]
+        else:
+            # Extension types, e.g. time zone aware timestamps, are kept by taking from the series
+            columns[name] = values.take(col_codes)
+            columns[name].index = index
+    return pd.DataFrame(columns, index=index, columns=list(names))
 
 
 def lagged_features(df, lags):
@@ -467,19 +819,172 @@ def moving_averages(df, start_step, window_size=None):
     Args:
         df (Dataframe): Input features as a dataframe
         start_step (Integer): Starting time step of rolling mean
-        window_size (Integer): Windows size of rolling mean
+        window_size (Integer): Windows size of rolling mean. If None, the mean is computed over
+            an expanding window of all the history, see rolling_features for other statistics
     
     Returns:
         fea (Dataframe): Dataframe consisting of the moving averages
+
+    Raises:
+        ValueError: if window_size is not None or a positive integer
     """
+    shifted = df.shift(start_step)
     if window_size is None:
-        # Use a large window to compute average over all historical data
-        window_size = df.shape[0]
-    fea = df.shift(start_step).rolling(min_periods=1, center=False, window=window_size).mean()
+        fea = shifted.expanding(min_periods=1).mean()
+    elif isinstance(window_size, (int, np.integer)) and window_size > 0:
+        fea = shifted.rolling(min_periods=1, center=False, window=window_size).mean()
+    else:
+        raise ValueError("window_size must be a positive integer or None, got {}".format(window_size))
     fea.columns = fea.columns + "_mean"
     return fea
 
 
+def rolling_features(df, start_step, windows, stats=("mean",), expanding=False):
+    """Compute several statistics of every feature over moving time windows in one pass.
+
+    Like moving_averages, the statistics of each row are computed over the window that
+    ends start_step rows before it and missing values are skipped. Sums, means and
+    standard deviations are computed from the deviations of the values of each window from
+    one of its values (see _window_moments), so that they keep their precision next to
+    large level shifts and standard deviations are exactly 0 over windows of equal values
+    like in pandas. Minimums and maximums use a block-wise prefix/suffix scan (van
+    Herk/Gil-Werman) whose cost does not depend on the window size, and exponentially
+    weighted means use each window size as span.
+
+    Args:
+        df (Dataframe): Input features as a dataframe
+        start_step (Integer): Starting time step of the windows
+        windows (List): Window sizes
+        stats (List): Statistics to compute, valid values are "mean", "std", "min", "max",
+            "sum" and "ewm"
+        expanding (Boolean): Whether to also compute every statistic except "ewm" over all
+            the history up to start_step rows before each row
+
+    Returns:
+        fea (Dataframe): Dataframe with columns "<col>_<stat><window>" for each window, followed
+            by columns "<col>_<stat>" over the expanding window if expanding is True
+    """
+    for stat in stats:
+        if stat not in ROLLING_STATS:
+            raise ValueError("Valid values for stats are {}".format(", ".join(ROLLING_STATS)))
+
+    values = df.shift(start_step).values.astype(np.float64)
+    n_rows, n_cols = values.shape
+
+    specs = [(stat, w, str(w)) for w in windows for stat in stats]
+    if expanding:
+        specs += [(stat, None, "") for stat in stats if stat != "ewm"]
+    fea = np.empty((n_rows, len(specs) * n_cols))
+    rolling_stats(values, np.array([0]), np.array([n_rows]), [spec[:2] for spec in specs], fea)
+
+    columns = [c + "_" + stat + suffix for stat, _, suffix in specs for c in df.columns]
+    return pd.DataFrame(fea, index=df.index, columns=columns)
+
+
+def rolling_stats(values, starts, lengths, specs, out):
+    """Write rolling statistics of the columns of a 2-D array of sorted series into out, which
+    is the kernel of rolling_features for multiple series, e.g. sorted with sort_series.
+
+    Windows do not extend before the start of the series of each row, and a window of None
+    includes all the previous rows of the series. The values are expected to be shifted
+    already, e.g. with shift_within_series.
+
+    Args:
+        values (np.array): Float array of shape (# of rows, # of columns) of sorted series
+        starts (np.array): Position of the first row of each series
+        lengths (np.array): Number of rows of each series
+        specs (list[tuple]): (stat, window) pairs, where stat is one of ROLLING_STATS
+        out (np.array): Array of shape (# of rows, len(specs) * # of columns), with one block of
+            columns for each pair of specs
+    """
+    n_cols = values.shape[1]
+    stats = [stat for stat, _ in specs]
+
+    sum_windows = list(dict.fromkeys(window for stat, window in specs if stat in ("mean", "std", "sum")))
+    moments = dict(zip(sum_windows, _window_moments(values, starts, lengths, sum_windows, "std" in stats)))
+
+    for i, (stat, window) in enumerate(specs):
+        block = out[:, i * n_cols : (i + 1) * n_cols]
+        if stat in ("min", "max"):
+            block[:] = _grouped_extreme(values, starts, lengths, window, np.fmin if stat == "min" else np.fmax)
+        elif stat == "ewm":
+            block[:] = _grouped_ewm_mean(values, starts, lengths, window)
+        else:
+            reference, count, total, squares = moments[window]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if stat == "sum":
+                    block[:] = np.where(count > 0, total + count * reference, np.nan)
+                elif stat == "mean":
+                    block[:] = np.where(count > 0, reference + total / count, np.nan)
+                else:
+                    var = np.maximum((squares - total * total / count) / (count - 1), 0)
+                    block[:] = np.where(count > 1, np.sqrt(var), np.nan)
+
+
+def _grouped_ewm_mean(values, starts, lengths, span):
+    """Exponentially weighted means of the columns of a 2-D array of sorted series, like
+    pandas ewm(span=span).mean() on every series.
+
+    The weighted sums of the values and of the weights of the non-missing values follow the
+    recurrence y[t] = decay * y[t - 1] + x[t], whose decay is 0 at the start of every series so
+    that no series leaks into the next one. It is solved for all the series at once by a
+    parallel prefix scan.
+    """
+    if len(starts) <= 1:
+        return pd.DataFrame(values).ewm(span=span).mean().values
+    decay = np.full((len(values), 1), 1 - 2 / (span + 1))
+    decay[starts] = 0
+    observed = ~np.isnan(values)
+    sums = _linear_recurrence(decay, np.where(observed, values, 0), lengths.max())
+    weights = _linear_recurrence(decay, observed.astype(np.float64), lengths.max())
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weights > 0, sums / weights, np.nan)
+
+
+def _linear_recurrence(decay, x, max_length):
+    """Solution of y[t] = decay[t] * y[t - 1] + x[t] along the rows, where decay is 0 at least
+    every max_length rows, computed by a Hillis-Steele scan in log2(max_length) vectorized steps."""
+    decay, y = decay.copy(), x.copy()
+    step = 1
+    while step < max_length:
+        y[step:] += decay[step:] * y[:-step]
+        decay[step:] *= decay[:-step]
+        step *= 2
+    return y
+
+
+def _grouped_extreme(values, starts, lengths, window, func):
+    """Trailing window minimum or maximum of sorted series, see _rolling_extreme. A window
+    of None includes all the previous rows. Multiple series are laid out with window - 1
+    missing rows between them, so that no window reaches into the previous series."""
+    if len(starts) <= 1:
+        return func.accumulate(values, axis=0) if window is None else _rolling_extreme(values, window, func)
+
+    window = lengths.max() if window is None else min(window, lengths.max())
+    gap = max(window, 1) - 1
+    positions = np.arange(len(values)) + np.repeat(np.arange(len(starts)) * gap, lengths)
+    padded = np.full((len(values) + len(starts) * gap, values.shape[1]), np.nan)
+    padded[positions] = values
+    return _rolling_extreme(padded, window, func)[positions]
+
+
+def _rolling_extreme(values, window, func):
+    """Trailing window minimum or maximum (func is np.fmin or np.fmax) of the columns of a 2-D
+    array, ignoring missing values. The array is padded to whole blocks of window rows, and
+    the extreme over each window is combined from a suffix scan of the block containing its
+    first row and a prefix scan of the block containing its last row."""
+    n_rows, n_cols = values.shape
+    window = max(min(window, n_rows), 1)
+    n_blocks = -(-(n_rows + window - 1) // window)
+    padded = np.full((n_blocks * window, n_cols), np.nan)
+    padded[window - 1 : window - 1 + n_rows] = values
+
+    blocks = padded.reshape(n_blocks, window, n_cols)
+    prefix = func.accumulate(blocks, axis=1).reshape(-1, n_cols)
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_cols)
+    return func(suffix[:n_rows], prefix[window - 1 : window - 1 + n_rows])
+
+
 def combine_features(df, lag_fea, lags, window_size, used_columns):
     """Combine lag features, moving average features, and orignal features in the data.
     
@@ -500,6 +1005,173 @@ def combine_features(df, lag_fea, lags, window_size, used_columns):
     return fea_all
 
 
+def grouped_lag_features(df, group_cols, time_col, lag_cols, lags, windows, start_step=2):
+    """Create lagged features and moving averages for every time series in a multi-series dataframe.
+
+    This is equivalent to running combine_features on every group of a
+    df.groupby(group_cols).apply(...) call, but the data is sorted once and all the features
+    of all the series are computed in vectorized passes over the contiguous series, without
+    per-group Python calls. Values never leak across series.
+
+    Args:
+        df (pd.DataFrame): Time series data of all the series in long format
+        group_cols (list[str]): Names of the columns that identify each time series, e.g. ["store", "brand"]
+        time_col (str): Name of the column used to order the rows of each time series
+        lag_cols (list[str]): Names of the columns for creating lagged features and moving averages
+        lags (list[int]): Lag lengths
+        windows (int, list[int] or None): Window size(s) of the moving averages. If None, the
+            average is computed over all the history of each series.
+        start_step (int): Starting time step of the moving averages, as in moving_averages
+
+    Returns:
+        pd.DataFrame: Lagged features named like lagged_features ("<col>_lag<lag>") followed by
+            moving averages named "<col>_mean" for a single window, or "<col>_mean<window>"
+            when windows is a list ("<col>_mean" for None), indexed like df
+    """
+    if windows is None or isinstance(windows, (int, np.integer)):
+        windows, mean_suffixes = [windows], ["_mean"]
+    else:
+        mean_suffixes = ["_mean" + ("" if w is None else str(w)) for w in windows]
+
+    order, starts, lengths = sort_series(df, group_cols, time_col)
+    row_start = np.repeat(starts, lengths)
+    row_end = row_start + np.repeat(lengths, lengths)
+    values = df[lag_cols].values.astype(np.float64)[order]
+
+    n_cols = len(lag_cols)
+    columns = [c + "_lag" + str(lag) for lag in lags for c in lag_cols]
+    columns += [c + suffix for suffix in mean_suffixes for c in lag_cols]
+    fea = np.empty((len(values), len(columns)))
+
+    for i, lag in enumerate(lags):
+        fea[:, i * n_cols : (i + 1) * n_cols] = shift_within_series(values, row_start, row_end, lag)
+
+    shifted = shift_within_series(values, row_start, row_end, start_step)
+    offset = len(lags) * n_cols
+    for i, (reference, count, total, _) in enumerate(_window_moments(shifted, starts, lengths, windows)):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(count > 0, reference + total / count, np.nan)
+        fea[:, offset + i * n_cols : offset + (i + 1) * n_cols] = means
+
+    return pd.DataFrame(_unsort(fea, order), index=df.index, columns=columns)
+
+
+def sort_series(df, group_cols, time_col=None, sort_groups=True):
+    """Sort the rows of a multi-series dataframe by series and time.
+
+    Args:
+        df (pd.DataFrame): Time series data of all the series in long format
+        group_cols (list[str]): Names of the columns that identify each time series
+        time_col (str): Name of the time column. If None, the rows of each series keep their order.
+        sort_groups (bool): Whether to order the series by the values of group_cols or by
+            order of first appearance of each value, like itertools.product over unique()
+
+    Returns:
+        np.array: Permutation that sorts the rows (stable, so ties keep their original order)
+        np.array: Position of the first sorted row of each series
+        np.array: Number of rows of each series
+    """
+    group_codes = [pd.factorize(df[c], sort=sort_groups)[0] for c in group_cols]
+    time_codes = [pd.factorize(df[time_col], sort=True)[0]] if time_col is not None else []
+    # np.lexsort sorts by the last key first
+    order = np.lexsort(time_codes + group_codes[::-1]) if group_codes or time_codes else np.arange(len(df))
+
+    n_rows = len(order)
+    new_series = np.zeros(n_rows, dtype=bool)
+    new_series[:1] = True
+    for codes in group_codes:
+        sorted_codes = codes[order]
+        new_series[1:] |= sorted_codes[1:] != sorted_codes[:-1]
+
+    starts = np.flatnonzero(new_series)
+    return order, starts, np.diff(np.append(starts, n_rows))
+
+
+def shift_within_series(values, row_start, row_end, lag):
+    """Shift the rows of a 2-D array of sorted series by lag steps, filling with NaN at the
+    boundaries of each series.
+
+    Args:
+        values (np.array): Array of shape (# of rows, # of columns) of series sorted with
+            sort_series
+        row_start (np.array): Position of the first row of the series of each row
+        row_end (np.array): Position after the last row of the series of each row
+        lag (int): Number of steps to shift by
+
+    Returns:
+        np.array: Float array of the shifted values
+    """
+    src = np.arange(len(values)) - lag
+    valid = (src >= row_start) & (src < row_end)
+    shifted = np.full(values.shape, np.nan)
+    shifted[valid] = values[src[valid]]
+    return shifted
+
+
+def _window_moments(values, starts, lengths, windows, squares=False):
+    """Numbers of non-missing values, sums and optionally sums of squares of the columns of a
+    2-D array of sorted series over trailing windows that end at each row and do not extend
+    before the start of its series. A window of None includes all the previous rows of the
+    series.
+
+    The sums are taken of the deviations from a reference value that is one of the values of
+    each window: the last non-missing value up to the row for finite windows, and the first
+    non-missing value of the series for windows of None. Series and periods at very different
+    levels, e.g. before and after a burst of large values, thus keep their precision, and the
+    deviations over windows of equal values are exactly 0. Finite windows are summed directly,
+    in one pass over the offsets up to the largest window, and windows of None by cumulative
+    sums that restart at every series.
+
+    Returns:
+        list: (references, counts, sums, sums of squares) for each window, where the sums are
+            those of the deviations from the reference of each row, and the sums of squares are
+            None if squares is False
+    """
+    n_rows, n_cols = values.shape
+    observed = ~np.isnan(values)
+    rows = np.arange(n_rows)
+    row_start = np.repeat(starts, lengths)
+    results = {}
+
+    finite = sorted(set(w for w in windows if w is not None))
+    if finite:
+        last = np.maximum.accumulate(np.where(observed, rows[:, None], -1), axis=0)
+        reference = np.where(last >= row_start[:, None], values[np.maximum(last, 0), np.arange(n_cols)], np.nan)
+        moments = [np.zeros((n_rows, n_cols)) for _ in range(3 if squares else 2)]
+        done = 0
+        for window in finite:
+            for k in range(done, min(window, n_rows)):
+                in_window = observed[: n_rows - k] & (rows[k:] - k >= row_start[k:])[:, None]
+                deviations = np.where(in_window, values[: n_rows - k] - reference[k:], 0)
+                moments[0][k:] += in_window
+                moments[1][k:] += deviations
+                if squares:
+                    moments[2][k:] += deviations * deviations
+            done = max(done, min(window, n_rows))
+            results[window] = (reference, *[m.copy() for m in moments]) + (() if squares else (None,))
+
+    if None in windows:
+        first = np.where(observed, rows[:, None], n_rows)
+        if n_rows > 0:
+            first = np.repeat(np.minimum.reduceat(first, starts, axis=0), lengths, axis=0)
+        reference = np.where(first < n_rows, values[np.minimum(first, n_rows - 1), np.arange(n_cols)], np.nan)
+        deviations = np.where(observed, values - reference, 0)
+        terms = [observed.astype(np.float64), deviations] + ([deviations * deviations] if squares else [])
+        series = np.repeat(np.arange(len(starts)), lengths)
+        moments = [pd.DataFrame(term).groupby(series).cumsum().values for term in terms]
+        results[None] = (reference, *moments) + (() if squares else (None,))
+    return [results[window] for window in windows]
+
+
+def _unsort(values, order):
+    """Bring the rows of an array sorted with permutation order back to the original order."""
+    if np.array_equal(order, np.arange(len(order))):
+        return values
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    return values[inverse]
+
+
 def gen_sequence(df, seq_len, seq_cols, start_timestep=0, end_timestep=None):
     """Reshape time series features into an array of dimension (# of time steps, # of 
     features).  
@@ -526,12 +1198,16 @@ def gen_sequence(df, seq_len, seq_cols, start_timestep=0, end_timestep=None):
         yield data_array[start:stop, :]
 
 
-def gen_sequence_array(df_all, seq_len, seq_cols, grain1_name, grain2_name, start_timestep=0, end_timestep=None):
+def gen_sequence_array(
+    df_all, seq_len, seq_cols, grain1_name=None, grain2_name=None, start_timestep=0, end_timestep=None
+):
     """Combine feature sequences for all the combinations of (grain1_name, grain2_name) into a 
     3-dimensional array.
     
     Args:
-        df_all (pd.Dataframe): Time series data of all the grains for multi-granular data
+        df_all (pd.Dataframe or TimeSeriesPanel): Time series data of all the grains for
+            multi-granular data. With a TimeSeriesPanel, the time series are those of the panel
+            in its order, time steps are positions on its time axis and grain names are not used.
         seq_len (int): Number of previous time series values to be used to form sequences
         seq_cols (list[str]): A list of names of the feature columns 
         grain1_name (str): Name of the 1st column indicating the time series graunularity
@@ -542,22 +1218,103 @@ def gen_sequence_array(df_all, seq_len, seq_cols, grain1_name, grain2_name, star
     Returns:
         seq_array (np.array): An array of feature sequences for all combinations of granularities
     """
-    seq_gen = (
-        list(
-            gen_sequence(
-                df_all[(df_all[grain1_name] == grain1) & (df_all[grain2_name] == grain2)],
-                seq_len,
-                seq_cols,
-                start_timestep,
-                end_timestep,
-            )
-        )
-        for grain1, grain2 in itertools.product(df_all[grain1_name].unique(), df_all[grain2_name].unique())
+    if isinstance(df_all, TimeSeriesPanel):
+        return _panel_sequence_array(df_all, seq_len, seq_cols, start_timestep, end_timestep)
+    windows, window_index = gen_sequence_view(
+        df_all, seq_len, seq_cols, [grain1_name, grain2_name], start_timestep, end_timestep
     )
-    seq_array = np.concatenate(list(seq_gen)).astype(np.float32)
+    # Gathering the windows is the only copy of the data
+    seq_array = windows[window_index]
     return seq_array
 
 
+def gen_sequence_view(df_all, seq_len, seq_cols, grain_cols, start_timestep=0, end_timestep=None):
+    """Create zero-copy feature sequences of all the time series in a dataframe.
+
+    The rows of df_all are sorted by grain once into a contiguous float32 array, and every
+    sequence is a strided window over that array. The sequences of all the time series
+    are windows[window_index], in the order of gen_sequence_array, i.e. time series are
+    ordered like the Cartesian product of the unique values of the grain columns and
+    combinations that are not present in the data are skipped.
+
+    Args:
+        df_all (pd.Dataframe): Time series data of all the grains for multi-granular data
+        seq_len (int): Number of previous time series values to be used to form sequences
+        seq_cols (list[str]): A list of names of the feature columns
+        grain_cols (list[str]): Names of the columns indicating the time series granularity
+        start_timestep (int): First time step you can use to create feature sequences
+        end_timestep (int): Last time step you can use to create feature sequences. If None,
+            sequences go up to the end of each time series as in gen_sequence.
+
+    Returns:
+        windows (np.array): Read-only view of shape (# of windows, sequence length, # of features)
+            of all the windows over the sorted rows, including those across time series
+        window_index (np.array): Positions in windows of the feature sequences of all the time series
+
+    Raises:
+        ValueError: if the feature sequences do not have the same length, i.e. if end_timestep
+            does not leave seq_len time steps at the end of some time series.
+    """
+    order, starts, lengths = sort_series(df_all, grain_cols, sort_groups=False)
+    data_array = df_all[seq_cols].values.astype(np.float32)
+    if not np.array_equal(order, np.arange(len(order))):
+        data_array = data_array[order]
+    data_array = np.ascontiguousarray(data_array)
+
+    # Sequence starts of each series are start_timestep, ..., end_timestep - seq_len + 1 as in gen_sequence
+    series_end = lengths if end_timestep is None else np.full(len(lengths), end_timestep)
+    counts = np.maximum(series_end - seq_len + 2 - start_timestep, 0)
+    series_id = np.repeat(np.arange(len(starts)), counts)
+    timestep = start_timestep + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    # Sequences are cut at the end of each series as in gen_sequence
+    seq_lengths = np.unique(np.minimum(seq_len, lengths[series_id] - timestep))
+    if len(seq_lengths) > 1 or (len(seq_lengths) == 1 and seq_lengths[0] <= 0):
+        raise ValueError(
+            "Feature sequences have different lengths. Please make sure that end_timestep leaves "
+            + "seq_len time steps in every time series."
+        )
+    window_len = seq_lengths[0] if len(seq_lengths) == 1 else seq_len
+    window_index = starts[series_id] + timestep
+
+    n_windows = max(len(data_array) - window_len + 1, 0)
+    row_stride, col_stride = data_array.strides
+    windows = as_strided(
+        data_array,
+        shape=(n_windows, window_len, len(seq_cols)),
+        strides=(row_stride, row_stride, col_stride),
+        writeable=False,
+    )
+    return windows, window_index
+
+
+def _panel_sequence_array(panel, seq_len, seq_cols, start_timestep, end_timestep):
+    """Feature sequences of all the series of a panel, see gen_sequence_array."""
+    n_series, n_times, _ = panel.shape
+    series_end = n_times if end_timestep is None else end_timestep
+    timestep = np.arange(start_timestep, max(series_end - seq_len + 2, start_timestep))
+
+    # All the series have the same length, so the sequences are cut alike at the end of the time axis
+    seq_lengths = np.unique(np.minimum(seq_len, n_times - timestep))
+    if len(seq_lengths) > 1 or (len(seq_lengths) == 1 and seq_lengths[0] <= 0):
+        raise ValueError(
+            "Feature sequences have different lengths. Please make sure that end_timestep leaves "
+            + "seq_len time steps in every time series."
+        )
+    window_len = seq_lengths[0] if len(seq_lengths) == 1 else seq_len
+
+    data_array = panel.values[:, start_timestep:, [panel.feature_position(c) for c in seq_cols]]
+    data_array = np.ascontiguousarray(data_array, dtype=np.float32)
+    series_stride, time_stride, col_stride = data_array.strides
+    windows = as_strided(
+        data_array,
+        shape=(n_series, len(timestep), window_len, len(seq_cols)),
+        strides=(series_stride, time_stride, time_stride, col_stride),
+        writeable=False,
+    )
+    return windows.reshape(n_series * len(timestep), window_len, len(seq_cols))
+
+
 def static_feature_array(df_all, total_timesteps, seq_cols, grain1_name, grain2_name):
     """Generate an arary which encodes all the static features.
     
@@ -570,29 +1327,53 @@ def static_feature_array(df_all, total_timesteps, seq_cols, grain1_name, grain2_
         
     Return:
         fea_array (np.array): An array of static features of all the grains, e.g. all the
-            combinations of stores and brands in retail sale forecasting
+            combinations of stores and brands in retail sale forecasting. Non-negative integer
+            features are returned with the smallest unsigned integer type that holds their
+            values (e.g. uint8), which can be fed to create_dcnn_model without conversion.
     """
-    fea_df = (
-        df_all.groupby([grain1_name, grain2_name]).apply(lambda x: x.iloc[:total_timesteps, :]).reset_index(drop=True)
-    )
-    fea_array = fea_df[seq_cols].values
+    order, starts, lengths = sort_series(df_all, [grain1_name, grain2_name])
+    # Keep the first total_timesteps rows of every series
+    position = np.arange(len(order)) - np.repeat(starts, lengths)
+    rows = order[position < total_timesteps]
+
+    fea_array = df_all[seq_cols].values[rows]
+    if fea_array.size > 0 and np.issubdtype(fea_array.dtype, np.integer) and fea_array.min() >= 0:
+        fea_array = fea_array.astype(np.promote_types(np.min_scalar_type(fea_array.max()), np.uint8))
     return fea_array
 
 
-def normalize_columns(df, seq_cols, scaler=MinMaxScaler()):
+def normalize_columns(df, seq_cols, scaler=None, group_cols=None):
     """Normalize a subset of columns of a dataframe.
     
     Args:
         df (pd.DataFrame): Input dataframe 
         seq_cols (list[str]): A list of names of columns to be normalized
-        scaler (object): A scikit learn scaler object
+        scaler (object): A scikit learn scaler object or a GroupedScaler. Default value
+            None creates a new MinMaxScaler, or a GroupedScaler("minmax") if group_cols
+            is given.
+        group_cols (list[str]): Names of the columns that identify each time series. If
+            given, every series is normalized with its own statistics. Required with a
+            GroupedScaler.
     
     Returns:
         pd.DataFrame: Normalized dataframe
         object: Scaler object
+
+    Raises:
+        ValueError: if scaler is a GroupedScaler and group_cols is None
     """
     cols_fixed = df.columns.difference(seq_cols)
-    df_scaled = pd.DataFrame(scaler.fit_transform(df[seq_cols]), columns=seq_cols, index=df.index)
+    if group_cols is None and isinstance(scaler, GroupedScaler):
+        raise ValueError("group_cols must be given to normalize the columns with a GroupedScaler.")
+    if group_cols is not None:
+        if scaler is None:
+            scaler = GroupedScaler("minmax")
+        scaled = scaler.fit(df, group_cols, seq_cols).transform(df)
+    else:
+        if scaler is None:
+            scaler = MinMaxScaler()
+        scaled = scaler.fit_transform(df[seq_cols])
+    df_scaled = pd.DataFrame(scaled, columns=seq_cols, index=df.index)
     df_scaled = pd.concat([df[cols_fixed], df_scaled], axis=1)
     return df_scaled, scaler
 
@@ -628,7 +1409,19 @@ def get_datetime_col(df, datetime_colname):
 def get_month_day_range(date):
     """
     Returns the first date and last date of the month of the given date.
+
+    The date can also be a datetime64 array, a DatetimeIndex or a datetime Series, in which
+    case the ranges of all the dates are computed at once with month arithmetic and the
+    outputs have the type of the input.
     """
+    if _is_datetime_array(date):
+        values = _datetime64_values(date)
+        months = values.astype("datetime64[M]")
+        time = values - values.astype("datetime64[D]")
+        first_day = months.astype("datetime64[D]") + time
+        last_day = (months + 1).astype("datetime64[D]") - np.timedelta64(1, "D") + time + np.timedelta64(23, "h")
+        return _like_datetime_input(first_day, date), _like_datetime_input(last_day, date)
+
     # Replace the date in the original timestamp with day 1
     first_day = date + relativedelta(day=1)
     # Replace the date in the original timestamp with day 1
@@ -643,6 +1436,12 @@ def add_datetime(input_datetime, unit, add_count):
     Function to add a specified units of time (years, months, weeks, days,
     hours, or minutes) to the input datetime.
 
+    The input datetime can also be a datetime64 array, a DatetimeIndex or a datetime
+    Series, and add_count an array of the same length, in which case the offsets are
+    applied to all the datetimes at once. Like relativedelta, adding years or months
+    clamps the day to the last day of the resulting month, e.g. 2000-01-31 plus one
+    month is 2000-02-29.
+
     Args:
         input_datetime: datatime to be added to
         unit: unit of time, valid values: 'year', 'month', 'week',
@@ -656,6 +1455,31 @@ def add_datetime(input_datetime, unit, add_count):
         Exception: if invalid unit is provided. Valid units are:
             'year', 'month', 'week', 'day', 'hour', 'minute'.
     """
+    if unit not in DATETIME_UNITS:
+        raise Exception(
+            "Invalid backtest step unit, {}, provided. Valid " "step units are Y, M, W, D, h, " "and m".format(unit)
+        )
+
+    if _is_datetime_array(input_datetime):
+        values = _datetime64_values(input_datetime)
+        if unit in ("year", "month"):
+            add_count = np.asarray(add_count)
+            if not np.all(add_count == np.round(add_count)):
+                raise ValueError("Non-integer years and months are ambiguous and not currently supported.")
+            add_months = add_count.astype(np.int64) * (12 if unit == "year" else 1)
+            days = values.astype("datetime64[D]")
+            months = values.astype("datetime64[M]")
+            day_of_month = (days - months.astype("datetime64[D]")).astype(np.int64)
+            new_months = months + add_months
+            first_days = new_months.astype("datetime64[D]")
+            month_length = ((new_months + 1).astype("datetime64[D]") - first_days).astype(np.int64)
+            new_days = first_days + np.minimum(day_of_month, month_length - 1)
+            new_datetime = new_days + (values - days)
+        else:
+            offset = np.asarray(add_count, dtype=np.float64) * DATETIME_UNITS[unit]
+            new_datetime = values + np.round(offset).astype("timedelta64[ns]")
+        return _like_datetime_input(new_datetime, input_datetime)
+
     if unit == "year":
         new_datetime = input_datetime + relativedelta(years=add_count)
     elif unit == "month":
@@ -666,10 +1490,20 @@ def add_datetime(input_datetime, unit, add_count):
         new_datetime = input_datetime + relativedelta(days=add_count)
     elif unit == "hour":
         new_datetime = input_datetime + relativedelta(hours=add_count)
-    elif unit == "minute":
-        new_datetime = input_datetime + relativedelta(minutes=add_count)
     else:
-        raise Exception(
-            "Invalid backtest step unit, {}, provided. Valid " "step units are Y, M, W, D, h, " "and m".format(unit)
-        )
+        new_datetime = input_datetime + relativedelta(minutes=add_count)
     return new_datetime
+
+
+def _is_datetime_array(x):
+    """Whether x is an array-like of datetimes rather than a single datetime."""
+    return isinstance(x, (np.ndarray, pd.DatetimeIndex, pd.Series))
+
+
+def _like_datetime_input(values, like):
+    """Wrap a datetime64[ns] array like the datetime array-like input of a function."""
+    if isinstance(like, pd.Series):
+        return pd.Series(values, index=like.index, name=like.name)
+    elif isinstance(like, pd.DatetimeIndex):
+        return pd.DatetimeIndex(values, name=like.name)
+    return values
@@ -0,0 +1,208 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains a stateful feature generator that computes lagged features and moving
+averages of newly arriving time steps from a compact per-series state, without
+recomputing the features over the history of every series.
+"""
+
+import numpy as np
+import pandas as pd
+
+from fclib.feature_engineering.feature_utils import sort_series
+
+
+class IncrementalLagFeatures:
+    """Lagged features and moving averages of new time steps of many series.
+
+    The state of each series is a ring buffer with its most recent values, which has room
+    for the largest lag and the moving window, and the running sum and count of the
+    non-missing values in its moving window. Appending one time step of all the series
+    costs O(number of series), independent of the length of the history. The running sums are
+    compensated (Neumaier summation), so that the rounding errors of adding and removing
+    values do not build up over long streams, e.g. after bursts of large values. The features are
+    those of combine_features, i.e. lagged_features(df[cols], lags) and
+    moving_averages(df[cols], start_step, window_size) computed on each series.
+
+    Example:
+        state = IncrementalLagFeatures(["move"], lags=[2, 3, 4], window_size=10)
+        state.fit(history_df, ["store", "brand"], "week")
+        state.save("lag_state.npz")
+        ...
+        state = IncrementalLagFeatures.load("lag_state.npz")
+        new_fea = state.update(new_week_df)
+
+    Args:
+        cols (list[str]): Names of the columns for creating lagged features and moving averages
+        lags (list[int]): Lag lengths
+        window_size (int): Window size of the moving averages. If None, the average is computed
+            over all the history of each series.
+        start_step (int): Starting time step of the moving averages, as in moving_averages
+    """
+
+    def __init__(self, cols, lags, window_size=None, start_step=2):
+        self.cols = list(cols)
+        self.lags = [int(lag) for lag in lags]
+        self.window_size = window_size
+        self.start_step = start_step
+        # Room for the largest lag and for the value that leaves the moving window
+        self.buffer_size = max(self.lags + [start_step + (window_size or 0)]) + 1
+        self.group_cols = None
+        self.series_keys = None
+        self.buffer = None
+        self.position = None
+        self.sums = None
+        self.compensations = None
+        self.counts = None
+
+    @property
+    def columns(self):
+        """Names of the feature columns, in the order of combine_features."""
+        return [c + "_lag" + str(lag) for lag in self.lags for c in self.cols] + [c + "_mean" for c in self.cols]
+
+    def fit(self, df, group_cols, time_col):
+        """Initialize the state of every series from its history.
+
+        Args:
+            df (pd.DataFrame): History of all the series in long format
+            group_cols (list[str]): Names of the columns that identify each time series
+            time_col (str): Name of the column used to order the rows of each time series
+
+        Returns:
+            IncrementalLagFeatures: The initialized feature state
+        """
+        order, starts, lengths = sort_series(df, group_cols, time_col)
+        values = df[self.cols].values.astype(np.float64)[order]
+        n_series, n_cols, size = len(starts), len(self.cols), self.buffer_size
+
+        self.group_cols = list(group_cols)
+        first_rows = order[starts]
+        self.series_keys = pd.MultiIndex.from_arrays(
+            [df[c].values[first_rows] for c in self.group_cols], names=self.group_cols
+        )
+
+        # The newest value of every series is stored in the last slot of the buffer
+        row_series = np.repeat(np.arange(n_series), lengths)
+        steps_back = np.repeat(starts + lengths, lengths) - 1 - np.arange(len(values))
+        recent = steps_back < size
+        self.buffer = np.full((n_series, size, n_cols), np.nan)
+        self.buffer[row_series[recent], size - 1 - steps_back[recent]] = values[recent]
+        self.position = np.full(n_series, size - 1, dtype=np.int64)
+
+        in_window = steps_back >= self.start_step
+        if self.window_size is not None:
+            in_window &= steps_back < self.start_step + self.window_size
+        self.sums = np.zeros((n_series, n_cols))
+        self.compensations = np.zeros((n_series, n_cols))
+        self.counts = np.zeros((n_series, n_cols), dtype=np.int64)
+        # Add the values of the windows one time step of all the series at a time, oldest first
+        window_rows = np.flatnonzero(in_window)
+        window_rows = window_rows[np.argsort(-steps_back[window_rows], kind="stable")]
+        for rows in np.split(window_rows, np.flatnonzero(np.diff(steps_back[window_rows])) + 1):
+            self._add_to_window(row_series[rows], values[rows], 1)
+        return self
+
+    def update(self, df):
+        """Append the next time step of some or all of the series and compute its features.
+
+        Series that were not seen before are added with an empty history.
+
+        Args:
+            df (pd.DataFrame): New observations with the group columns and the value columns,
+                with at most one row for each series
+
+        Returns:
+            pd.DataFrame: Lagged features and moving averages of the new rows, indexed like df
+        """
+        index = self._series_index(df)
+        if len(np.unique(index)) != len(index):
+            raise ValueError("Input dataframe contains more than one row for some time series.")
+        size = self.buffer_size
+
+        position = (self.position[index] + 1) % size
+        self.position[index] = position
+        self.buffer[index, position] = df[self.cols].values.astype(np.float64)
+
+        self._add_to_window(index, self.buffer[index, (position - self.start_step) % size], 1)
+        if self.window_size is not None:
+            leaving = self.buffer[index, (position - self.start_step - self.window_size) % size]
+            self._add_to_window(index, leaving, -1)
+
+        fea = [self.buffer[index, (position - lag) % size] for lag in self.lags]
+        counts = self.counts[index]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fea.append(np.where(counts > 0, (self.sums[index] + self.compensations[index]) / counts, np.nan))
+        return pd.DataFrame(np.hstack(fea), index=df.index, columns=self.columns)
+
+    def _add_to_window(self, index, values, sign):
+        observed = ~np.isnan(values)
+        values = sign * np.where(observed, values, 0)
+        sums = self.sums[index]
+        new_sums = sums + values
+        # Neumaier summation: keep the low-order bits lost by the addition
+        self.compensations[index] += np.where(
+            np.abs(sums) >= np.abs(values), (sums - new_sums) + values, (values - new_sums) + sums
+        )
+        self.sums[index] = new_sums
+        self.counts[index] += sign * observed
+
+    def _series_index(self, df):
+        """Position of the series of every row of df in the state, adding new series."""
+        keys = pd.MultiIndex.from_arrays([df[c].values for c in self.group_cols], names=self.group_cols)
+        index = self.series_keys.get_indexer(keys)
+        new = index < 0
+        if new.any():
+            new_keys = keys[new].unique()
+            n_old, n_new = len(self.series_keys), len(new_keys)
+            self.series_keys = self.series_keys.append(new_keys)
+            self.buffer = np.concatenate([self.buffer, np.full((n_new,) + self.buffer.shape[1:], np.nan)])
+            self.position = np.concatenate([self.position, np.full(n_new, self.buffer_size - 1, dtype=np.int64)])
+            self.sums = np.concatenate([self.sums, np.zeros((n_new, len(self.cols)))])
+            self.compensations = np.concatenate([self.compensations, np.zeros((n_new, len(self.cols)))])
+            self.counts = np.concatenate([self.counts, np.zeros((n_new, len(self.cols)), dtype=np.int64)])
+            index[new] = n_old + new_keys.get_indexer(keys[new])
+        return index
+
+    def save(self, path):
+        """Save the state as a compressed .npz file."""
+        keys = {"key_" + str(i): np.asarray(self.series_keys.get_level_values(i)) for i in range(len(self.group_cols))}
+        for name, values in keys.items():
+            if values.dtype == object:
+                keys[name] = values.astype(str)
+        np.savez_compressed(
+            path,
+            cols=np.asarray(self.cols, dtype=str),
+            lags=np.asarray(self.lags),
+            window_size=-1 if self.window_size is None else self.window_size,
+            start_step=self.start_step,
+            group_cols=np.asarray(self.group_cols, dtype=str),
+            buffer=self.buffer,
+            position=self.position,
+            sums=self.sums,
+            compensations=self.compensations,
+            counts=self.counts,
+            **keys
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a state saved with save."""
+        with np.load(path) as data:
+            window_size = int(data["window_size"])
+            state = cls(
+                data["cols"].tolist(),
+                data["lags"].tolist(),
+                None if window_size < 0 else window_size,
+                int(data["start_step"]),
+            )
+            state.group_cols = data["group_cols"].tolist()
+            state.series_keys = pd.MultiIndex.from_arrays(
+                [data["key_" + str(i)] for i in range(len(state.group_cols))], names=state.group_cols
+            )
+            state.buffer = data["buffer"]
+            state.position = data["position"]
+            state.sums = data["sums"]
+            state.compensations = data["compensations"]
+            state.counts = data["counts"]
+        return state
@@ -0,0 +1,271 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains a feature pipeline that computes calendar, Fourier, lag, rolling
+window and normalization features described by a declarative specification in a
+single planned pass over a dataframe.
+"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from fclib.feature_engineering.feature_utils import (
+    CALENDAR_KERNELS,
+    ROLLING_STATS,
+    fourier_features,
+    unique_timestamps,
+    CalendarArrays,
+    sort_series,
+    shift_within_series,
+    rolling_stats,
+)
+from fclib.feature_engineering.scaling import SCALING_METHODS, GroupedScaler
+
+# Calendar features supported by FeaturePipeline
+CALENDAR_FEATURES = list(CALENDAR_KERNELS)
+
+
+class FeaturePipeline:
+    """Compute a set of features in one planned pass over a multi-series dataframe.
+
+    Instead of calling the functions of feature_utils one at a time, the pipeline
+    extracts only the columns that the specification uses, truncates the timestamps to
+    days, months and years at most once for all the calendar and Fourier features and by
+    default only for the distinct timestamps, sorts the series once for all the lag and rolling window
+    features, and writes every feature into one preallocated column block. The time spent
+    in each stage of the last transform is reported in the timings attribute.
+
+    Example:
+        pipeline = FeaturePipeline(
+            datetime_col="week_start",
+            group_cols=["store", "brand"],
+            time_col="week",
+            calendar=["week_of_month", "month_of_year"],
+            fourier={"periods": {"annual": 365.24}, "n_harmonics": 2},
+            lags={"cols": ["move"], "lags": [2, 3, 4]},
+            rolling={"cols": ["move"], "windows": [4, 8], "stats": ["mean", "std"], "start_step": 2},
+            normalize={"cols": ["price1", "price2"], "method": "minmax"},
+        )
+        train_fea = pipeline.fit_transform(train_df)
+        test_fea = pipeline.transform(test_df)
+
+    Args:
+        datetime_col (str): Name of the datetime column used by the calendar and Fourier features
+        group_cols (list[str]): Names of the columns that identify each time series. Default
+            value None treats the dataframe as a single time series.
+        time_col (str): Name of the column used to order the rows of each time series for
+            the lag and rolling window features. Default value None uses datetime_col, or the
+            order of the rows if datetime_col is None as well.
+        calendar (list[str]): Names of calendar features, valid values are the entries of
+            CALENDAR_FEATURES. Values are encoded like the functions of feature_utils with
+            the same name, e.g. day_of_week is 0 on Mondays.
+        fourier (dict): Keyword arguments of fourier_features, i.e. "periods" and "n_harmonics"
+        lags (dict): Lagged features, with keys "cols" (columns to lag) and "lags" (lag lengths).
+            Columns are named "<col>_lag<lag>".
+        rolling (dict): Rolling window statistics, see rolling_features. Keys are "cols",
+            "windows", "stats" (default ["mean"]), "start_step" (default 2) and "expanding"
+            (default False). Columns are named "<col>_<stat><window>" and "<col>_<stat>".
+        normalize (dict): Normalized copies of columns, with keys "cols" and "method" ("minmax"
+            or "standard", default "minmax"). The statistics are computed by fit, per series if
+            group_cols is given. Columns are named "<col>_normalized".
+        dtype: Data type of the feature block. Default value np.float64.
+        dedup_timestamps (bool): Whether to compute the calendar and Fourier features once per
+            distinct timestamp and broadcast them to the rows, so that their cost grows with
+            the number of distinct timestamps rather than rows. Default value True.
+    """
+
+    def __init__(
+        self,
+        datetime_col=None,
+        group_cols=None,
+        time_col=None,
+        calendar=None,
+        fourier=None,
+        lags=None,
+        rolling=None,
+        normalize=None,
+        dtype=np.float64,
+        dedup_timestamps=True,
+    ):
+        self.datetime_col = datetime_col
+        self.group_cols = list(group_cols) if group_cols else []
+        self.time_col = time_col if time_col is not None else datetime_col
+        self.calendar = list(dict.fromkeys(calendar or []))
+        self.fourier = fourier
+        self.lags = lags
+        self.rolling = rolling
+        self.normalize = normalize
+        self.dtype = dtype
+        self.dedup_timestamps = dedup_timestamps
+        self.scaler = None
+        self.timings = OrderedDict()
+
+        for name in self.calendar:
+            if name not in CALENDAR_FEATURES:
+                raise ValueError("Valid calendar features are {}".format(", ".join(CALENDAR_FEATURES)))
+        if (self.calendar or fourier is not None) and datetime_col is None:
+            raise ValueError("datetime_col is required for calendar and Fourier features")
+        if rolling is not None:
+            for stat in rolling.get("stats", ["mean"]):
+                if stat not in ROLLING_STATS:
+                    raise ValueError("Valid values for stats are {}".format(", ".join(ROLLING_STATS)))
+        if normalize is not None and normalize.get("method", "minmax") not in SCALING_METHODS:
+            raise ValueError("Valid values for method are {}".format(", ".join(SCALING_METHODS)))
+
+        self.stages = self._plan()
+        self.columns = [c for _, columns in self.stages for c in columns]
+
+    def _plan(self):
+        """Names of the stages to run, in order, and the columns that each stage writes."""
+        stages = []
+        if self.calendar:
+            stages.append(("calendar", self.calendar))
+        if self.fourier is not None:
+            empty = np.array([], dtype="datetime64[ns]")
+            stages.append(("fourier", fourier_features(empty, **self.fourier)[1]))
+        if self.lags is not None:
+            stages.append(
+                ("lags", [c + "_lag" + str(lag) for lag in self.lags["lags"] for c in self.lags["cols"]])
+            )
+        if self.rolling is not None:
+            columns = [
+                c + "_" + stat + suffix for stat, _, suffix in self._rolling_specs() for c in self.rolling["cols"]
+            ]
+            stages.append(("rolling", columns))
+        if self.normalize is not None:
+            stages.append(("normalize", [c + "_normalized" for c in self.normalize["cols"]]))
+        return stages
+
+    def _rolling_specs(self):
+        """(stat, window, column suffix) of every rolling window statistic, like rolling_features."""
+        stats = self.rolling.get("stats", ["mean"])
+        specs = [(stat, w, str(w)) for w in self.rolling["windows"] for stat in stats]
+        if self.rolling.get("expanding", False):
+            specs += [(stat, None, "") for stat in stats if stat != "ewm"]
+        return specs
+
+    @property
+    def used_columns(self):
+        """Names of the input columns that the pipeline reads; all other columns are ignored."""
+        columns = [self.datetime_col] if (self.calendar or self.fourier is not None) else []
+        if self.lags is not None or self.rolling is not None or self.normalize is not None:
+            columns += self.group_cols
+        if self.lags is not None or self.rolling is not None:
+            columns += [self.time_col] if self.time_col is not None else []
+        for spec in [self.lags, self.rolling, self.normalize]:
+            if spec is not None:
+                columns += spec["cols"]
+        return list(dict.fromkeys(columns))
+
+    def fit(self, df):
+        """Compute the normalization statistics, if any.
+
+        Args:
+            df (pd.DataFrame): Training data
+
+        Returns:
+            FeaturePipeline: The fitted pipeline
+        """
+        if self.normalize is not None:
+            method = self.normalize.get("method", "minmax")
+            cols = self.normalize["cols"]
+            if self.group_cols:
+                self.scaler = GroupedScaler(method).fit(df, self.group_cols, cols)
+            else:
+                values = df[cols].values.astype(np.float64)
+                if method == "minmax":
+                    offset = np.nanmin(values, axis=0)
+                    scale = np.nanmax(values, axis=0) - offset
+                else:
+                    offset, scale = np.nanmean(values, axis=0), np.nanstd(values, axis=0)
+                self.scaler = (offset, np.where(scale > 0, scale, 1.0))
+        return self
+
+    def fit_transform(self, df):
+        """Fit the pipeline on df and compute the features of df, see transform."""
+        return self.fit(df).transform(df)
+
+    def transform(self, df):
+        """Compute all the features of df.
+
+        Args:
+            df (pd.DataFrame): Time series data of all the series in long format
+
+        Returns:
+            pd.DataFrame: Features in the order of the columns attribute, indexed like df
+        """
+        if self.normalize is not None and self.scaler is None:
+            raise ValueError("The pipeline needs to be fitted before computing normalized features.")
+
+        self.timings = OrderedDict()
+        start = time.perf_counter()
+        data = df[self.used_columns]
+        n_rows = len(data)
+        # Column-major, so that every stage writes contiguous columns and the dataframe
+        # built from the block does not copy it
+        fea = np.empty((n_rows, len(self.columns)), dtype=self.dtype, order="F")
+        if self.calendar or self.fourier is not None:
+            if self.dedup_timestamps:
+                timestamps, time_codes = unique_timestamps(data[self.datetime_col])
+            else:
+                timestamps, time_codes = data[self.datetime_col], None
+            calendar = CalendarArrays(timestamps)
+        series = None
+        if self.lags is not None or self.rolling is not None:
+            order, starts, lengths = sort_series(data, self.group_cols, self.time_col)
+            series = order, starts, lengths, np.repeat(starts, lengths), np.repeat(starts + lengths, lengths)
+        self.timings["prepare"] = time.perf_counter() - start
+
+        offset = 0
+        for name, columns in self.stages:
+            start = time.perf_counter()
+            block = fea[:, offset : offset + len(columns)]
+            if name == "calendar":
+                for i, feature in enumerate(columns):
+                    values = CALENDAR_KERNELS[feature](calendar)
+                    block[:, i] = values if time_codes is None else values[time_codes]
+            elif name == "fourier":
+                if time_codes is None:
+                    fourier_features(calendar, out=block, **self.fourier)
+                else:
+                    block[:] = fourier_features(calendar, dtype=self.dtype, **self.fourier)[0][time_codes]
+            elif name == "lags":
+                self._lag_stage(data, series, block)
+            elif name == "rolling":
+                self._rolling_stage(data, series, block)
+            else:
+                self._normalize_stage(data, block)
+            offset += len(columns)
+            self.timings[name] = time.perf_counter() - start
+
+        return pd.DataFrame(fea, index=df.index, columns=self.columns)
+
+    def _lag_stage(self, data, series, block):
+        order, _, _, row_start, row_end = series
+        cols = self.lags["cols"]
+        values = data[cols].values.astype(np.float64)[order]
+        for i, lag in enumerate(self.lags["lags"]):
+            block[order, i * len(cols) : (i + 1) * len(cols)] = shift_within_series(values, row_start, row_end, lag)
+
+    def _rolling_stage(self, data, series, block):
+        order, starts, lengths, row_start, row_end = series
+        values = data[self.rolling["cols"]].values.astype(np.float64)[order]
+        shifted = shift_within_series(values, row_start, row_end, self.rolling.get("start_step", 2))
+        fea = np.empty(block.shape)
+        rolling_stats(shifted, starts, lengths, [spec[:2] for spec in self._rolling_specs()], fea)
+        block[order] = fea
+
+    def _normalize_stage(self, data, block):
+        cols = self.normalize["cols"]
+        block[:] = data[cols].values
+        if self.group_cols:
+            self.scaler.transform(data, cols, out=block)
+        else:
+            offset, scale = self.scaler
+            block -= offset
+            block /= scale
+
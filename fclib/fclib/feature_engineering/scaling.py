@@ -0,0 +1,178 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+This file contains a scaler that normalizes every time series of a multi-series
+dataset with its own statistics, and persists them for inverse transforms at
+inference time.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+
+SCALING_METHODS = ["minmax", "standard"]
+
+
+class GroupedScaler:
+    """Scale the columns of every time series with statistics of that series.
+
+    With method "minmax" each series is scaled to [0, 1] like sklearn's MinMaxScaler, with
+    method "standard" it is centered and divided by its standard deviation like sklearn's
+    StandardScaler. Series that are constant in a column are only shifted.
+
+    Example:
+        scaler = GroupedScaler("minmax").fit(train_df, ["store", "brand"], ["move", "price"])
+        scaler.save("scaler.npz")
+        ...
+        scaler = GroupedScaler.load("scaler.npz")
+        pred_df["move"] = scaler.inverse_transform(pred_df, ["move"])[:, 0]
+
+    Args:
+        method (str): Scaling method, valid values are "minmax" and "standard"
+    """
+
+    def __init__(self, method="minmax"):
+        if method not in SCALING_METHODS:
+            raise ValueError("Valid values for method are {}".format(", ".join(SCALING_METHODS)))
+        self.method = method
+        self.group_cols = None
+        self.value_cols = None
+        self.series_keys = None
+        self.offset = None
+        self.scale = None
+
+    def fit(self, df, group_cols, value_cols):
+        """Compute the statistics of every series in one grouped reduction.
+
+        Args:
+            df (pd.DataFrame): Time series data of all the series in long format
+            group_cols (list[str]): Names of the columns that identify each time series
+            value_cols (list[str]): Names of the columns to be scaled
+
+        Returns:
+            GroupedScaler: The fitted scaler
+        """
+        grouped = df.groupby(group_cols, sort=True)[list(value_cols)]
+        if self.method == "minmax":
+            offset = grouped.min()
+            scale = grouped.max() - offset
+        else:
+            offset = grouped.mean()
+            scale = grouped.std(ddof=0)
+
+        self.group_cols = list(group_cols)
+        self.value_cols = list(value_cols)
+        self.series_keys = pd.MultiIndex.from_arrays(
+            [offset.index.get_level_values(i) for i in range(len(group_cols))], names=self.group_cols
+        )
+        self.offset = offset.values.astype(np.float64)
+        scale = scale.values.astype(np.float64)
+        self.scale = np.where(scale > 0, scale, 1.0)
+        return self
+
+    def series_index(self, df):
+        """Position of the series of every row of df in the fitted statistics.
+
+        Raises:
+            ValueError: if df contains series that were not seen during fit.
+        """
+        keys = pd.MultiIndex.from_arrays([df[c].values for c in self.group_cols], names=self.group_cols)
+        index = self.series_keys.get_indexer(keys)
+        if (index < 0).any():
+            raise ValueError("Input dataframe contains time series that the scaler was not fitted on.")
+        return index
+
+    def transform(self, df, value_cols=None, out=None):
+        """Scale columns of df with the statistics of the series of every row.
+
+        Args:
+            df (pd.DataFrame): Data including the group columns and the columns to be scaled
+            value_cols (list[str]): Columns to scale, a subset of the fitted columns. Default
+                value None scales all the fitted columns.
+            out (np.array): Optional float array of shape (len(df), len(value_cols)) that
+                holds the values to scale and is scaled in place, e.g. a float32 buffer.
+
+        Returns:
+            np.array: Scaled values
+        """
+        return self._apply(df, value_cols, out, inverse=False)
+
+    def inverse_transform(self, df, value_cols=None, out=None):
+        """Bring scaled columns of df back to their original scale, see transform."""
+        return self._apply(df, value_cols, out, inverse=True)
+
+    def _apply(self, df, value_cols, out, inverse):
+        if value_cols is None:
+            value_cols = self.value_cols
+        cols = [self.value_cols.index(c) for c in value_cols]
+        if out is None:
+            out = df[value_cols].values.astype(np.float64)
+
+        index = self.series_index(df)
+        offset = self.offset[index[:, None], cols].astype(out.dtype, copy=False)
+        scale = self.scale[index[:, None], cols].astype(out.dtype, copy=False)
+        if inverse:
+            out *= scale
+            out += offset
+        else:
+            out -= offset
+            out /= scale
+        return out
+
+    def save(self, path):
+        """Save the fitted statistics as a compressed .npz file.
+
+        Series keys are stored with their types: numeric, boolean and datetime keys as arrays,
+        and object keys, e.g. strings, integers mixed with strings or tuples, as JSON.
+        """
+        keys = {}
+        for i in range(len(self.group_cols)):
+            values = np.asarray(self.series_keys.get_level_values(i))
+            if values.dtype == object:
+                keys["json_key_" + str(i)] = np.asarray(json.dumps(values.tolist(), default=_json_scalar))
+            else:
+                keys["key_" + str(i)] = values
+        np.savez_compressed(
+            path,
+            method=self.method,
+            group_cols=np.asarray(self.group_cols, dtype=str),
+            value_cols=np.asarray(self.value_cols, dtype=str),
+            offset=self.offset,
+            scale=self.scale,
+            **keys
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a scaler saved with save, without refitting."""
+        with np.load(path) as data:
+            scaler = cls(str(data["method"]))
+            scaler.group_cols = data["group_cols"].tolist()
+            scaler.value_cols = data["value_cols"].tolist()
+            scaler.series_keys = pd.MultiIndex.from_arrays(
+                [_load_keys(data, i) for i in range(len(scaler.group_cols))], names=scaler.group_cols
+            )
+            scaler.offset = data["offset"]
+            scaler.scale = data["scale"]
+        return scaler
+
+
+def _json_scalar(value):
+    """JSON value of a NumPy scalar in an object array of series keys."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Series keys of type {} cannot be saved.".format(type(value).__name__))
+
+
+def _load_keys(data, i):
+    """Keys of the i-th group column of a saved scaler, as saved by GroupedScaler.save."""
+    if "key_" + str(i) in data.files:
+        return data["key_" + str(i)]
+    # JSON has no tuples, and lists cannot be keys, so all the lists were tuples
+    values = json.loads(str(data["json_key_" + str(i)]))
+    return pd.Index([_tuples(v) for v in values], dtype=object, tupleize_cols=False)
+
+
+def _tuples(value):
+    return tuple(_tuples(v) for v in value) if isinstance(value, list) else value
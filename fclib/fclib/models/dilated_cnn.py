@@ -7,8 +7,10 @@ This file contains utility functions for builing Dilated CNN model to solve time
 
 
 from math import ceil, log
+import numpy as np
 from tensorflow.keras.layers import Input, Lambda, Embedding, Conv1D, Dropout, Flatten, Dense, concatenate
 from tensorflow.keras.models import Model
+from tensorflow.keras.utils import Sequence
 
 
 def create_dcnn_model(
@@ -31,6 +33,7 @@ def create_dcnn_model(
         n_filters (int): Number of filters in each convolutional layer
         dropout_rate (float): Dropout rate in the network
         max_cat_id (list[int]): Each entry in the list represents the maximum value of the ID of a specific categorical variable. 
+            The categorical input has the smallest unsigned integer type that holds the largest ID.
 
     Returns:
         object: Keras Model object
@@ -40,7 +43,7 @@ def create_dcnn_model(
 
     # Categorical input
     n_cat_fea = len(max_cat_id)
-    cat_fea_in = Input(shape=(n_cat_fea,), dtype="uint8")
+    cat_fea_in = Input(shape=(n_cat_fea,), dtype=category_dtype(max(max_cat_id)).name)
     cat_flatten = []
     for i, m in enumerate(max_cat_id):
         cat_fea = Lambda(lambda x, i: x[:, i, None], arguments={"i": i})(cat_fea_in)
@@ -79,3 +82,84 @@ def create_dcnn_model(
     model = Model(inputs=[seq_in, cat_fea_in], outputs=output)
 
     return model
+
+
+def category_dtype(max_cat_id):
+    """Smallest unsigned integer type, at least uint8, that holds the IDs of categorical features.
+
+    Args:
+        max_cat_id (int): Maximum value of the IDs
+
+    Returns:
+        np.dtype: Data type of the categorical input of a Dilated CNN model
+    """
+    return np.promote_types(np.min_scalar_type(int(max_cat_id)), np.uint8)
+
+
+class SequenceBatchGenerator(Sequence):
+    """Generate mini-batches for a Dilated CNN model on demand.
+
+    Instead of materializing the 3-dimensional array of all the overlapping input sequences,
+    each batch is gathered from zero-copy window views (see gen_sequence_view in
+    fclib.feature_engineering.feature_utils), so the memory used for training only depends
+    on the size of the data and of a batch. Batches are independent of each other, hence
+    they can be built in parallel and prefetched by Keras, e.g.
+    model.fit(generator, epochs=EPOCHS, workers=4, max_queue_size=10).
+
+    Args:
+        seq_inputs (list[tuple]): (windows, window_index) pairs of the dynamic features. The
+            sequences of all the pairs are concatenated along the feature axis to form the
+            sequence input of the model, so the pairs must have the same sequence length.
+        cat_input (np.array): Categorical features of every sample, e.g. the output of
+            static_feature_array. Cast to category_dtype(max(max_cat_id)), the type of the
+            categorical input of create_dcnn_model.
+        output (tuple): Optional (windows, window_index) pair of the target sequences. Each
+            target sequence is flattened to a vector of length n_outputs.
+        max_cat_id (list[int]): Maximum value of the ID of each categorical feature, as passed
+            to create_dcnn_model
+        batch_size (int): Number of samples in each batch
+        shuffle (bool): Whether to shuffle the samples at the end of every epoch
+        seed (int): Random seed used for shuffling
+    """
+
+    def __init__(
+        self, seq_inputs, cat_input, output=None, max_cat_id=[100, 100], batch_size=64, shuffle=True, seed=None
+    ):
+        n_samples = len(cat_input)
+        for _, window_index in seq_inputs + ([output] if output is not None else []):
+            if len(window_index) != n_samples:
+                raise ValueError("All the inputs and the output should have the same number of samples.")
+
+        self.seq_inputs = seq_inputs
+        cat_input = np.asarray(cat_input)
+        if cat_input.size > 0 and (cat_input.min() < 0 or not np.array_equal(cat_input, np.floor(cat_input))):
+            raise ValueError("Categorical features should be non-negative integer IDs.")
+        if cat_input.shape[1:] != (len(max_cat_id),):
+            raise ValueError("Categorical features should have one column for each entry of max_cat_id.")
+        if cat_input.size > 0 and (cat_input.max(axis=0) > np.asarray(max_cat_id)).any():
+            raise ValueError("Categorical feature IDs should not exceed max_cat_id.")
+        self.cat_input = cat_input.astype(category_dtype(max(max_cat_id)))
+        self.output = output
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random_state = np.random.RandomState(seed)
+        self.sample_order = np.arange(n_samples)
+        if shuffle:
+            self.random_state.shuffle(self.sample_order)
+
+    def __len__(self):
+        return ceil(len(self.sample_order) / self.batch_size)
+
+    def __getitem__(self, idx):
+        samples = self.sample_order[idx * self.batch_size : (idx + 1) * self.batch_size]
+        seq_in = np.concatenate([windows[window_index[samples]] for windows, window_index in self.seq_inputs], axis=2)
+        batch_in = (seq_in, self.cat_input[samples])
+        if self.output is None:
+            # A 1-tuple, so that Keras does not take the two model inputs for inputs and targets
+            return (batch_in,)
+        windows, window_index = self.output
+        return batch_in, windows[window_index[samples]].reshape(len(samples), -1)
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.random_state.shuffle(self.sample_order)
@@ -6,16 +6,21 @@ This file contains utility functions for builing multiple linear regression
 models to forecast many time series individually.
 """
 
+import numpy as np
 import pandas as pd
 from sklearn.linear_model import LinearRegression
 
+from fclib.common.panel import TimeSeriesPanel
+
 
 def fit(train_df, grain_col_names, fea_col_names=[], target_col_name="target"):
     """Train multiple linear regression models with each being trained on an individual time 
     series specified by columns in grain_col_names.
     
     Args: 
-        train_df (pandas.DataFrame): Training data frame including all the features
+        train_df (pandas.DataFrame or TimeSeriesPanel): Training data frame including all the features,
+            or a panel of the time series, whose time steps with missing values and series without
+            any observed time step are skipped
         grain_col_names (list[str]): List of the column names that specify each time series
         fea_col_names (list[str]): List of the names of columns that we want to use as input features
         target_col_name (str): Name of the target column
@@ -23,6 +28,8 @@ def fit(train_df, grain_col_names, fea_col_names=[], target_col_name="target"):
     Returns:
         dict: Dictionary including all the trained linear regression models
     """
+    if isinstance(train_df, TimeSeriesPanel):
+        return _fit_panel(train_df, fea_col_names, target_col_name)
     lr_models = {}
     if not fea_col_names:
         fea_col_names = list(train_df.columns)
@@ -40,7 +47,9 @@ def predict(
     """Predict target variable with multiple linear regression models that have been trained.
 
     Args:
-        test_df (pandas.DataFrame): Dataframe including all needed features
+        test_df (pandas.DataFrame or TimeSeriesPanel): Dataframe including all needed features, or a
+            panel of the time series, whose time steps with missing features and series without any
+            observed time step are skipped
         lr_models (dict): A dictionary that includes all the trained linear regression models with format 
             {(grain1, grain2, ...): model1, (grain1, grain2, ...): model2, ...}
         time_col_name (str): Name of the time column
@@ -52,25 +61,68 @@ def predict(
     Returns:
         pandas.DataFrame including the predictions of the target variable
     """
-    pred_dfs = []
-    if not fea_col_names:
-        fea_col_names = list(test_df.columns)
-    for name, group in test_df.groupby(grain_col_names):
-        lr = lr_models[name]
-        cur_pred = lr.predict(group[fea_col_names])
-        dict1 = {
-            time_col_name: list(group[time_col_name]),
-            "prediction": cur_pred,
-        }
-        dict2 = dict(zip(grain_col_names, name))
-        for grain in grain_col_names:
-            dict2[grain] = [dict2[grain]] * len(cur_pred)
-        cur_pred_df = pd.DataFrame({**dict1, **dict2})
-        pred_dfs.append(cur_pred_df)
-    pred_all = pd.concat(pred_dfs)
-    pred_all.reset_index(drop=True, inplace=True)
+    if isinstance(test_df, TimeSeriesPanel):
+        pred_all = _predict_panel(test_df, lr_models, time_col_name, grain_col_names, fea_col_names)
+    else:
+        pred_dfs = []
+        if not fea_col_names:
+            fea_col_names = list(test_df.columns)
+        for name, group in test_df.groupby(grain_col_names):
+            lr = lr_models[name]
+            cur_pred = lr.predict(group[fea_col_names])
+            dict1 = {
+                time_col_name: list(group[time_col_name]),
+                "prediction": cur_pred,
+            }
+            dict2 = dict(zip(grain_col_names, name))
+            for grain in grain_col_names:
+                dict2[grain] = [dict2[grain]] * len(cur_pred)
+            cur_pred_df = pd.DataFrame({**dict1, **dict2})
+            pred_dfs.append(cur_pred_df)
+        pred_all = pd.concat(pred_dfs)
+        pred_all.reset_index(drop=True, inplace=True)
     if nonnegative_output:
         pred_all["prediction"] = pred_all["prediction"].apply(lambda x: max(0, x))
     if integer_output:
         pred_all["prediction"] = pred_all["prediction"].apply(lambda x: round(x))
     return pred_all
+
+
+def _fit_panel(panel, fea_col_names, target_col_name):
+    """Train a linear regression model on each series of a panel, see fit."""
+    if not fea_col_names:
+        fea_col_names = [c for c in panel.feature_names if c != target_col_name]
+    fea_positions = [panel.feature_position(c) for c in fea_col_names]
+    target = panel.feature(target_col_name)
+    lr_models = {}
+    for i, name in enumerate(panel.series_index):
+        x = panel.values[i][:, fea_positions]
+        observed = ~np.isnan(x).any(axis=1) & ~np.isnan(target[i])
+        # Like groupby, which has no group for a series without rows
+        if not observed.any():
+            continue
+        lr = LinearRegression()
+        lr.fit(pd.DataFrame(x[observed], columns=fea_col_names), target[i][observed])
+        lr_models[name] = lr
+    return lr_models
+
+
+def _predict_panel(panel, lr_models, time_col_name, grain_col_names, fea_col_names):
+    """Predictions of the models of each series of a panel, see predict."""
+    if not fea_col_names:
+        fea_col_names = panel.feature_names
+    fea_positions = [panel.feature_position(c) for c in fea_col_names]
+    pred_dfs = []
+    for i, name in enumerate(panel.series_index):
+        x = panel.values[i][:, fea_positions]
+        observed = ~np.isnan(x).any(axis=1)
+        if not observed.any():
+            continue
+        prediction = lr_models[name].predict(pd.DataFrame(x[observed], columns=fea_col_names))
+        cur_pred_df = pd.DataFrame({time_col_name: panel.time_index.values[observed], "prediction": prediction})
+        for grain, value in zip(grain_col_names, name if isinstance(name, tuple) else (name,)):
+            cur_pred_df[grain] = value
+        pred_dfs.append(cur_pred_df)
+    if not pred_dfs:
+        return pd.DataFrame(columns=[time_col_name, "prediction"] + list(grain_col_names))
+    return pd.concat(pred_dfs, ignore_index=True)
@@ -0,0 +1,50 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fclib.common.columnar import save_columnar, load_columnar
+
+
+def test_columnar_round_trip(tmp_path):
+    df = pd.DataFrame(
+        {
+            "store": np.array([2, 5, 8], dtype=np.int16),
+            "move": [1.5, np.nan, 3.0],
+            "deal": [True, False, True],
+            "week_start": pd.date_range("1989-09-14", periods=3, freq="7D"),
+            "brand": ["a", "b", "a"],
+            "size": pd.Categorical(["s", "l", "s"], categories=["s", "l"], ordered=True),
+        }
+    )
+    path = str(tmp_path / "df")
+    assert save_columnar(df, path) > 0
+    loaded = load_columnar(path)
+    pd.testing.assert_frame_equal(loaded, df)
+
+    df.index = pd.MultiIndex.from_arrays([[1, 1, 2], ["x", "y", "x"]], names=["a", "b"])
+    save_columnar(df, path)
+    loaded = load_columnar(path, columns=["move", "store"], mmap_mode="r")
+    pd.testing.assert_frame_equal(loaded, df[["move", "store"]])
+    loaded = load_columnar(path, mmap_mode="r", rows=slice(1, 3))
+    pd.testing.assert_frame_equal(loaded, df.iloc[1:3])
+
+    with pytest.raises(KeyError):
+        load_columnar(path, columns=["price"])
+    with pytest.raises(ValueError):
+        save_columnar(pd.DataFrame({"t": pd.date_range("2000-01-01", periods=2, tz="UTC")}), path)
+
+
+def test_columnar_missing_strings(tmp_path):
+    df = pd.DataFrame({"name": ["x", None, np.nan, ""], "empty": [None] * 4}, index=["a", np.nan, "c", "d"])
+    path = str(tmp_path / "df")
+    save_columnar(df, path)
+    loaded = load_columnar(path)
+    assert list(loaded["name"].isnull()) == [False, True, True, False] and loaded["name"][3] == ""
+    assert loaded["empty"].isnull().all() and list(loaded.index.isnull()) == [False, True, False, False]
+    assert list(load_columnar(path, mmap_mode="r", rows=slice(1, 3))["name"].isnull()) == [True, True]
+
+    with pytest.raises(ValueError):
+        save_columnar(pd.DataFrame({"mixed": ["x", 1]}), path)
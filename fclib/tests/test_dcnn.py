@@ -1,7 +1,11 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-from fclib.models.dilated_cnn import create_dcnn_model
+import numpy as np
+import pytest
+
+from fclib.feature_engineering.feature_utils import df_from_cartesian_product, gen_sequence_view, static_feature_array
+from fclib.models.dilated_cnn import create_dcnn_model, category_dtype, SequenceBatchGenerator
 
 
 def test_create_dcnn_model():
@@ -17,3 +21,39 @@ def test_create_dcnn_model():
         seq_len=1, n_dyn_fea=1, n_outputs=2, n_dilated_layers=2, kernel_size=2, dropout_rate=0.05, max_cat_id=[30, 120]
     )
     assert mod2 is not None
+
+
+def test_sequence_batch_generator():
+    df = df_from_cartesian_product({"store": [1, 2], "brand": [1, 2, 3], "week": list(range(20))})
+    df["move"] = np.arange(len(df), dtype=float)
+    df["deal"] = df["week"] % 2
+
+    seq_len, horizon = 4, 2
+    move_in = gen_sequence_view(df, seq_len, ["move"], ["store", "brand"], 0, 15)
+    deal_in = gen_sequence_view(df, seq_len, ["deal"], ["store", "brand"], 0, 15)
+    output = gen_sequence_view(df, horizon, ["move"], ["store", "brand"], seq_len, 17)
+    cat_fea_in = static_feature_array(df, 13, ["store", "brand"], "store", "brand")
+
+    gen = SequenceBatchGenerator([move_in, deal_in], cat_fea_in, output, max_cat_id=[2, 3], batch_size=5, seed=1)
+    assert len(gen) == 16  # 6 series x 13 windows / 5
+    (seq_in, cat_in), target = gen[0]
+    assert seq_in.shape == (5, seq_len, 2) and cat_in.dtype == np.uint8 and target.shape == (5, horizon)
+    # targets directly follow the input sequences
+    assert np.array_equal(target[:, 0], seq_in[:, -1, 0] + 1)
+
+    model = create_dcnn_model(seq_len=seq_len, n_dyn_fea=2, n_outputs=horizon, max_cat_id=[2, 3])
+    model.compile(loss="mae", optimizer="adam")
+    model.fit(gen, epochs=1, verbose=0)
+    predict_gen = SequenceBatchGenerator([move_in, deal_in], cat_fea_in, max_cat_id=[2, 3], shuffle=False)
+    assert model.predict(predict_gen).shape == (78, horizon)
+
+    # The type of the IDs is that of the model input, even if the data has smaller IDs
+    small_ids = SequenceBatchGenerator([move_in], cat_fea_in, max_cat_id=[2, 300], shuffle=False)
+    assert small_ids.cat_input.dtype == category_dtype(300) == np.uint16
+    # IDs above 255 keep their values
+    large_ids = SequenceBatchGenerator([move_in], cat_fea_in.astype(int) + 300, max_cat_id=[302, 303], shuffle=False)
+    assert np.array_equal(large_ids[0][0][1], cat_fea_in[:64] + 300)
+    with pytest.raises(ValueError):
+        SequenceBatchGenerator([move_in], cat_fea_in.astype(int) - 5)
+    with pytest.raises(ValueError):
+        SequenceBatchGenerator([move_in], cat_fea_in, max_cat_id=[2, 2])
@@ -0,0 +1,66 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import os
+import numpy as np
+import pandas as pd
+
+from fclib.dataset.dtypes import plan_dtypes, plan_csv_dtypes, read_csv_compact
+from fclib.dataset.ojdata import split_train_test
+
+
+def _retail_frame():
+    n = 1000
+    return pd.DataFrame(
+        {
+            "store": np.arange(n) % 137 + 2,
+            "week": np.arange(n) + 40,
+            "delta": np.arange(n) - 500,
+            "price": np.linspace(0, 1, n),
+            "move_lag2": np.linspace(0, 1, n),
+            "region": np.where(np.arange(n) % 2 == 0, "east", "west"),
+            "note": ["note " + str(i) for i in range(n)],
+        }
+    )
+
+
+def test_plan_dtypes():
+    df = _retail_frame()
+    plan, report = plan_dtypes(df, id_cols=["store"], feature_cols=["move_lag2"])
+    assert plan["store"] == np.uint8 and plan["week"] == np.uint16 and plan["delta"] == np.int16
+    assert plan["price"] == np.float32 and "move_lag2" not in plan
+    assert str(plan["region"]) == "category" and "note" not in plan
+    assert report["planned_bytes"].sum() < report["current_bytes"].sum()
+    compact = df.astype(plan)
+    assert report.loc["store", "planned_bytes"] == compact["store"].memory_usage(index=False)
+    assert (compact["region"] == df["region"]).all()
+
+    plan, _ = plan_dtypes(df, id_cols=["store"], categorical_ids=True, downcast_features=True)
+    assert list(plan["store"].categories) == list(range(2, 139))
+    assert plan["move_lag2"] == np.float32
+
+
+def test_plan_csv_dtypes(tmp_path):
+    df = _retail_frame()
+    path = str(tmp_path / "data.csv")
+    df.to_csv(path, index=False)
+
+    # Chunks see only part of the range of each column, the plan covers all of them
+    plan, report = plan_csv_dtypes(path, id_cols=["store"], categorical_ids=True, chunksize=100)
+    assert plan["week"] == np.uint16 and plan["delta"] == np.int16
+    assert len(plan["store"].categories) == 137
+    assert report.loc["week", "current_bytes"] == df["week"].memory_usage(index=False)
+
+    compact = read_csv_compact(path, dtype=plan)
+    assert compact["week"].dtype == np.uint16 and compact["price"].dtype == np.float32
+    assert (compact["store"].astype(int) == df["store"]).all()
+    assert read_csv_compact(path)["delta"].dtype == np.int16
+
+
+def test_split_train_test_compact(generate_ojdata):
+    resdir = "fclib/tests/resources"
+    df = pd.read_csv(os.path.join(resdir, "ojdatagen.csv"))
+    df.to_csv(os.path.join(resdir, "yx.csv"), index=False)
+    (traindf, testdf, _) = split_train_test(resdir, 2, 2, 1, 50, 60, compact_dtypes=True)
+    assert traindf[0]["week"].dtype == np.int16 and traindf[0]["logmove"].dtype == np.float32
+    assert max(traindf[1].week) < min(testdf[1].week)
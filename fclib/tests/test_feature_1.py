@@ -1,8 +1,12 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import calendar
+import math
+import numpy as np
 import pandas as pd
 import datetime
+import pytest
 
 
 from fclib.feature_engineering.feature_utils import (
@@ -16,6 +20,9 @@ from fclib.feature_engineering.feature_utils import (
     day_of_week,
     day_of_month,
     day_of_year,
+    fourier_features,
+    unique_timestamps,
+    on_unique_timestamps,
 )
 
 
@@ -46,6 +53,13 @@ def test_day_type():
     dty2 = day_type(dates, hols)
     assert all(dty2 == [7, 8, 0])
 
+    # hourly data with a holiday on 2000-01-04 and asymmetric offsets
+    hourly = pd.Series(pd.date_range("2000-01-01", "2000-01-07 23:00:00", freq="H"))
+    hourly_hols = (hourly.dt.day == 4).astype(int)
+    dty3 = day_type(hourly, hourly_hols, (datetime.timedelta(days=2), datetime.timedelta(days=1)))
+    assert len(dty3) == len(hourly)
+    assert all(dty3[::24] == [5, 8, 8, 7, 8, 2, 4])
+
 
 # date component extractors
 
@@ -63,6 +77,14 @@ def test_time_of_year():
     assert all(tyr >= 0 and tyr <= 1)
 
 
+def test_time_of_year_parity():
+    dates = pd.Series(pd.date_range("1999-12-30", "2001-01-02", freq="7H"))
+    expected = [
+        ((d.dayofyear - 1) * 24 + d.hour) / ((366 if calendar.isleap(d.year) else 365) * 24 - 1) for d in dates
+    ]
+    assert np.array_equal(time_of_year(dates), expected)
+
+
 def test_week_of_year():
     dates = sample_date
     assert week_of_year(dates)[0] == 52  # first day of 2000 is in last week of 1999
@@ -73,6 +95,15 @@ def test_week_of_month():
     assert week_of_month(dates)[0] == 1  # first day of 2000 is in first month of 2000
 
 
+def test_week_of_month_parity():
+    dates = pd.Series(pd.date_range("1999-12-01", "2000-03-31 12:00:00", freq="13H"))
+    expected = [math.ceil((d.day + d.replace(day=1).weekday()) / 7.0) for d in dates]
+    wom = week_of_month(dates)
+    assert list(wom) == expected
+    assert list(week_of_month(dates.values)) == expected
+    assert week_of_month(dates[10]) == expected[10]
+
+
 def test_month_of_year():
     dates = sample_date
     assert month_of_year(dates)[0] == 1
@@ -117,3 +148,35 @@ def test_day_of_year():
 #     dates = sample_date
 #     enc = encoded_week_of_year(dates)
 #     assert len(enc.columns) == 53
+
+
+def test_on_unique_timestamps():
+    weeks = pd.date_range("2019-12-05", periods=20, freq="7D")
+    dt = pd.Series(np.tile(weeks, 5), index=np.arange(100) + 10)
+    uniques, codes = unique_timestamps(dt)
+    assert len(uniques) == 20 and np.array_equal(uniques[codes], dt.values)
+
+    for func in [week_of_month, month_of_year, day_type, time_of_year]:
+        result = on_unique_timestamps(func, dt)
+        assert np.array_equal(np.asarray(result), np.asarray(func(dt)))
+    assert on_unique_timestamps(week_of_month, dt).index.equals(dt.index)
+
+    fourier, columns = on_unique_timestamps(fourier_features, dt, n_harmonics=2)
+    expected, expected_columns = fourier_features(dt, n_harmonics=2)
+    assert columns == expected_columns and np.allclose(fourier, expected)
+
+
+def test_on_unique_timestamps_row_kwargs():
+    days = pd.date_range("2019-12-20", periods=15)
+    dt = pd.Series(np.tile(days, 3), index=np.arange(45) + 10)
+    # Holidays differ between the series that share the timestamps, and some codes are missing
+    holiday = pd.Series(np.zeros(45), index=dt.index)
+    holiday.iloc[[5, 13, 21, 40]] = [1, 2, 1, np.nan]
+
+    result = on_unique_timestamps(day_type, dt, row_kwargs={"holiday_col": holiday})
+    assert np.array_equal(result, day_type(dt, holiday))
+    offset = (datetime.timedelta(days=2), datetime.timedelta(days=1))
+    result = on_unique_timestamps(day_type, dt, row_kwargs={"holiday_col": holiday}, semi_holiday_offset=offset)
+    assert np.array_equal(result, day_type(dt, holiday, semi_holiday_offset=offset))
+    with pytest.raises(ValueError):
+        on_unique_timestamps(day_type, dt, row_kwargs={"holiday_col": holiday.values[:-1]})
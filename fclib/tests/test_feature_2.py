@@ -1,6 +1,7 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import numpy as np
 import pandas as pd
 import datetime
 import pytest
@@ -8,16 +9,23 @@ import pytest
 
 from fclib.feature_engineering.feature_utils import (
     df_from_cartesian_product,
+    cartesian_product_chunks,
     lagged_features,
     moving_averages,
+    rolling_features,
     combine_features,
+    grouped_lag_features,
+    sort_series,
     gen_sequence_array,
+    gen_sequence_view,
     static_feature_array,
     normalize_columns,
     get_datetime_col,
     get_month_day_range,
     add_datetime,
 )
+from fclib.common.panel import TimeSeriesPanel
+from fclib.feature_engineering.scaling import GroupedScaler
 
 # misc utilities
 
@@ -27,6 +35,25 @@ def test_df_from_cartesian_product():
     df = df_from_cartesian_product(d)
     assert len(df) == 27
     assert list(df.columns) == ["x1", "x2", "x3"]
+    assert df.iloc[5].tolist() == [1, 5, "c"]
+
+    dfcat = df_from_cartesian_product(d, categorical=True)
+    assert all(dfcat.dtypes == "category")
+    assert dfcat.astype(object).equals(df.astype(object))
+
+    # Values keep their types, and repeated values are one category
+    d = {"x1": [1, "x", 1], "x2": pd.date_range("2020-01-01", periods=2, tz="UTC")}
+    df = df_from_cartesian_product(d)
+    assert df.x1.tolist() == [1, 1, "x", "x", 1, 1] and str(df.x2.dtype) == "datetime64[ns, UTC]"
+    dfcat = df_from_cartesian_product(d, categorical=True)
+    assert dfcat.x1.cat.categories.tolist() == [1, "x"] and dfcat.x1.tolist() == df.x1.tolist()
+
+
+def test_cartesian_product_chunks():
+    d = {"x1": [1, 2, 3], "x2": [4, 5, 6, 7], "x3": ["a", "b"]}
+    chunks = list(cartesian_product_chunks(d, 5))
+    assert [len(c) for c in chunks] == [5, 5, 5, 5, 4]
+    assert pd.concat(chunks).equals(df_from_cartesian_product(d))
 
 
 def test_lagged_features():
@@ -41,6 +68,56 @@ def test_moving_averages():
     dfma = moving_averages(df, 1, 2)
     assert dfma.shape == (3, 2)
     assert all(pd.isna(dfma.iloc[0, :]))
+    assert list(dfma.x1_mean[1:]) == [1, 1.5]
+    assert list(moving_averages(df, 1).x2_mean[1:]) == [4, 4.5]
+    with pytest.raises(ValueError):
+        moving_averages(df, 1, 0)
+
+
+def test_rolling_features():
+    df = pd.DataFrame({"x1": [1.0, 5, 2, np.nan, 4, 8, 3, 3, 7, 1], "x2": [float(x % 4) for x in range(10)]})
+    fea = rolling_features(df, 1, [2, 4], ["mean", "std", "min", "max", "sum", "ewm"], expanding=True)
+    assert fea.shape == (10, 2 * (2 * 6 + 5))
+    assert all(pd.isna(fea.iloc[0, :]))
+
+    shifted = df.shift(1)
+    for w in [2, 4]:
+        rolling = shifted.rolling(w, min_periods=1)
+        for stat in ["mean", "std", "min", "max", "sum"]:
+            expected = getattr(rolling, stat)().add_suffix("_" + stat + str(w))
+            assert np.allclose(fea[expected.columns], expected, equal_nan=True)
+        expected = shifted.ewm(span=w).mean().add_suffix("_ewm" + str(w))
+        assert np.allclose(fea[expected.columns], expected, equal_nan=True)
+    for stat in ["mean", "std", "min", "max", "sum"]:
+        expected = getattr(shifted.expanding(min_periods=1), stat)().add_suffix("_" + stat)
+        assert np.allclose(fea[expected.columns], expected, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        rolling_features(df, 1, [2], ["median"])
+
+
+def test_rolling_features_near_zero_variance():
+    # Constant and nearly constant windows at a high level, next to level shifts
+    rng = np.random.RandomState(0)
+    x = np.r_[np.full(20, 1e6), 1e6 + 1e-4 * rng.randn(20), np.full(10, 3.3), 1e-9 * rng.randn(10), 100 * rng.randn(20)]
+    x[[3, 33, 70]] = np.nan
+    df = pd.DataFrame({"x": x})
+    fea = rolling_features(df, 1, [3, 5, 12], ["mean", "std"], expanding=True)
+
+    shifted = df.x.shift(1)
+    for w in [3, 5, 12, None]:
+        suffix = "" if w is None else str(w)
+        windows = [shifted[0 if w is None else max(i - w + 1, 0) : i + 1].dropna() for i in range(len(x))]
+        # Windows of equal values have a standard deviation of exactly 0, like in pandas rolling().std()
+        constant = np.array([len(v) > 1 and v.min() == v.max() for v in windows])
+        assert (fea["x_std" + suffix][constant] == 0).all()
+        if w is not None:
+            assert (shifted.rolling(w, min_periods=1).std()[constant] == 0).all()
+        # Other windows match a two-pass computation, even when pandas loses precision
+        exact = np.array([v.std() for v in windows])
+        assert np.allclose(fea["x_std" + suffix][~constant], exact[~constant], rtol=1e-9, atol=0, equal_nan=True)
+        exact = np.array([v.mean() for v in windows])
+        assert np.allclose(fea["x_mean" + suffix], exact, rtol=1e-12, atol=0, equal_nan=True)
 
 
 def test_combine_features():
@@ -49,6 +126,57 @@ def test_combine_features():
     assert dfcomb.shape == (3, 8)
 
 
+def test_grouped_lag_features():
+    df = df_from_cartesian_product({"g1": [1, 2], "g2": ["a", "b"], "t": list(range(6))})
+    df["y"] = np.arange(len(df), dtype=float)
+    df = df.sample(frac=1, random_state=0)
+
+    fea = grouped_lag_features(df, ["g1", "g2"], "t", ["y"], [1, 2], 3)
+    assert list(fea.columns) == ["y_lag1", "y_lag2", "y_mean"]
+    assert fea.index.equals(df.index)
+
+    expected = df.sort_values(["g1", "g2", "t"]).groupby(["g1", "g2"], group_keys=False).apply(
+        lambda x: combine_features(x, ["y"], [1, 2], 3, [])
+    )
+    assert np.allclose(fea.values, expected.loc[df.index].values, equal_nan=True)
+    # the first rows of every series have no history
+    assert all(pd.isna(fea.loc[df["t"] == 0, "y_lag1"]))
+
+    multi = grouped_lag_features(df, ["g1", "g2"], "t", ["y"], [], [2, None])
+    assert list(multi.columns) == ["y_mean2", "y_mean"]
+
+
+def test_sort_series():
+    df = pd.DataFrame({"g": ["b", "a", "b", "a", "b"], "t": [2, 1, 1, 1, 0]})
+    order, starts, lengths = sort_series(df, ["g"], "t")
+    # ties in time keep their original order
+    assert list(order) == [1, 3, 4, 2, 0]
+    assert list(starts) == [0, 2] and list(lengths) == [2, 3]
+
+    order, starts, lengths = sort_series(df, ["g"], sort_groups=False)
+    assert list(order) == [0, 2, 4, 1, 3]
+    assert list(starts) == [0, 3] and list(lengths) == [3, 2]
+
+    order, starts, lengths = sort_series(df.iloc[:0], ["g"], "t")
+    assert len(order) == len(starts) == len(lengths) == 0
+
+
+def test_grouped_lag_features_level_shifts():
+    # Small values right after bursts of huge values, whose means cumulative sums cannot resolve
+    rng = np.random.RandomState(0)
+    y = rng.uniform(0, 1, 120)
+    y[(np.arange(120) // 15) % 2 == 0] *= 1e12
+    y[::7] = np.nan
+    df = pd.DataFrame({"g": np.repeat([1, 2], 60), "t": np.tile(np.arange(60), 2), "y": y})
+    fea = grouped_lag_features(df, ["g"], "t", ["y"], [], [4, 10, None])
+
+    shifted = df.groupby("g")["y"].shift(2)
+    for w in [4, 10, None]:
+        starts = [60 * (i // 60) if w is None else max(i - w + 1, 60 * (i // 60)) for i in range(len(y))]
+        exact = np.array([shifted[start : i + 1].mean() for i, start in enumerate(starts)])
+        assert np.allclose(fea["y_mean" + ("" if w is None else str(w))], exact, rtol=1e-9, atol=0, equal_nan=True)
+
+
 def test_gen_sequence_array():
     val = pd.Series(x for x in range(8))
     df0 = df_from_cartesian_product({"x1": [1, 2], "x2": [1, 2, 3, 4]})
@@ -57,12 +185,53 @@ def test_gen_sequence_array():
     assert len(arr) == 8
 
 
+def test_gen_sequence_view():
+    df = df_from_cartesian_product({"x1": [2, 1], "x2": [1, 2, 3], "t": list(range(6))})
+    df["y"] = [float(x) for x in range(len(df))]
+    # drop the (1, 2) series
+    df = df[~((df["x1"] == 1) & (df["x2"] == 2))]
+
+    windows, window_index = gen_sequence_view(df, 3, ["y"], ["x1", "x2"], 1, 4)
+    assert not windows.flags.writeable
+    assert windows.shape[1:] == (3, 1)
+    # 5 series with start times 1 and 2
+    assert len(window_index) == 10
+
+    arr = gen_sequence_array(df, 3, ["y"], "x1", "x2", 1, 4)
+    assert arr.dtype == np.float32 and arr.flags.owndata
+    assert np.array_equal(arr, windows[window_index])
+    # 1st window of the (2, 1) series covers time steps 1, 2, 3
+    assert list(arr[0, :, 0]) == [1, 2, 3]
+    # (1, 1) series comes right after the (2, x) series
+    assert list(arr[6, :, 0]) == [19, 20, 21]
+
+    with pytest.raises(ValueError):
+        gen_sequence_view(df, 3, ["y"], ["x1", "x2"], 0, None)
+
+    # A dense panel gives the same sequences as a dataframe without missing time steps
+    full = df_from_cartesian_product({"x1": [2, 1], "x2": [1, 2, 3], "t": list(range(6))})
+    full["y"] = np.arange(len(full), dtype=float)
+    panel = TimeSeriesPanel.from_long(full, ["x1", "x2"], "t", sort=False)
+    assert np.array_equal(
+        gen_sequence_array(panel, 3, ["y"], start_timestep=1, end_timestep=4),
+        gen_sequence_array(full, 3, ["y"], "x1", "x2", 1, 4),
+    )
+    with pytest.raises(ValueError):
+        gen_sequence_array(panel, 3, ["y"])
+
+
 def test_static_feature_array():
     val = pd.Series(x for x in range(8))
     df0 = df_from_cartesian_product({"x1": [1, 2], "x2": [1, 2, 3, 4]})
     df = pd.concat([val.to_frame("y"), df0], axis=1)
     arr = static_feature_array(df, 8, ["x1", "x2"], "x1", "x2")
     assert len(arr) == 8
+    assert arr.dtype == np.uint8
+
+    df1 = df_from_cartesian_product({"x1": [2, 1], "x2": [300, 4], "t": [0, 1, 2]})
+    arr1 = static_feature_array(df1, 2, ["x1", "x2"], "x1", "x2")
+    assert arr1.dtype == np.uint16
+    assert arr1.tolist() == [[1, 4], [1, 4], [1, 300], [1, 300], [2, 4], [2, 4], [2, 300], [2, 300]]
 
 
 def test_normalize_columns():
@@ -71,6 +240,14 @@ def test_normalize_columns():
     assert len(sc) == len(df)
     assert all(sc["x"] >= 0) and all(sc["x"] <= 1)
 
+    df["g"] = np.repeat([0, 1], 10)
+    df.loc[df["g"] == 1, "x"] *= 100
+    (sc, scaler) = normalize_columns(df, ["x"], group_cols=["g"])
+    assert np.allclose(sc["x"], np.tile(np.arange(10) / 9, 2))
+    assert (sc["g"] == df["g"]).all()
+    with pytest.raises(ValueError):
+        normalize_columns(df, ["x"], scaler=GroupedScaler("minmax"))
+
 
 def test_get_datetime_col():
     df = pd.DataFrame({"x1": ["2001-01-01", "2001-01-02", "2001-01-03"], "x2": [1, 2, 3], "x3": ["a", "b", "c"]})
@@ -98,3 +275,30 @@ def test_add_datetime():
 
     xd = add_datetime(x, "day", 1)
     assert xd == datetime.datetime(2000, 1, 2)
+
+
+def test_get_month_day_range_array():
+    x = pd.DatetimeIndex(["2000-01-15", "2000-02-29 06:00", "2001-12-31"])
+    (first, last) = get_month_day_range(x)
+    assert isinstance(first, pd.DatetimeIndex)
+    for i in range(len(x)):
+        assert (first[i], last[i]) == get_month_day_range(x[i].to_pydatetime())
+    (first, last) = get_month_day_range(x.values)
+    assert first.dtype == "datetime64[ns]" and first[0] == np.datetime64("2000-01-01")
+
+
+def test_add_datetime_array():
+    x = pd.DatetimeIndex(["2000-01-31 10:00", "2000-02-29", "2001-03-31 23:59", "2003-12-15"])
+    for unit in ["year", "month", "week", "day", "hour", "minute"]:
+        for count in [-13, 1, 25]:
+            expected = pd.DatetimeIndex([add_datetime(d.to_pydatetime(), unit, count) for d in x])
+            assert add_datetime(x, unit, count).equals(expected)
+
+    xm = add_datetime(pd.Series(x), "month", np.array([1, 2, 3, 4]))
+    assert isinstance(xm, pd.Series)
+    assert xm.tolist() == [pd.Timestamp(add_datetime(d.to_pydatetime(), "month", i + 1)) for i, d in enumerate(x)]
+
+    with pytest.raises(ValueError):
+        add_datetime(x, "month", 0.5)
+    with pytest.raises(Exception):
+        add_datetime(x, "second", 1)
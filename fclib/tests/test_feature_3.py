@@ -1,6 +1,7 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -48,6 +49,17 @@ def test_normalized_current_datehour():
     assert len(bad) == len(dates)
 
 
+def test_normalized_current_datehour_parity():
+    dates = pd.Series(pd.date_range("1999-12-31 22:15:30.5", periods=50, freq="173T"))
+    min_dh, max_dh = pd.Timestamp("1999-12-31 23:00:00"), dates.max()
+    span = max_dh - min_dh
+    expected = [
+        ((d - min_dh).days * 24 + (d - min_dh).seconds / 3600) / (span.days * 24 + span.seconds / 3600) for d in dates
+    ]
+    ndt = normalized_current_datehour(dates, min_dh, max_dh)
+    assert np.array_equal(ndt.values, expected)
+
+
 def test_normalized_columns():
     dates = pd.to_datetime(pd.Series(["2000-01-01", "2000-01-02", "2000-01-03"]))
     vals = pd.Series([1, 2, 3])
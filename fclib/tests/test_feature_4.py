@@ -1,11 +1,19 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import numpy as np
 import pandas as pd
 import datetime
+import pytest
 
 
-from fclib.feature_engineering.feature_utils import annual_fourier, weekly_fourier, daily_fourier, fourier_approximation
+from fclib.feature_engineering.feature_utils import (
+    annual_fourier,
+    weekly_fourier,
+    daily_fourier,
+    fourier_approximation,
+    fourier_features,
+)
 
 # Fourier stuff
 
@@ -34,3 +42,24 @@ def test_daily_fourier():
     dates = pd.to_datetime(pd.Series([datetime.date(2000, 1, 1) + datetime.timedelta(days=x) for x in range(365)]))
     fd = daily_fourier(dates, 5)
     assert len(fd) == 10
+
+
+def test_fourier_features():
+    dates = pd.Series(pd.date_range("2000-01-01", periods=500, freq="5H"))
+    expected = {**annual_fourier(dates, 4), **weekly_fourier(dates, 3), **daily_fourier(dates, 2)}
+
+    fea, cols = fourier_features(
+        dates, n_harmonics={"annual": 4, "weekly": 3, "daily": 2}, dtype=np.float64, chunk_size=64
+    )
+    assert cols == list(expected)
+    assert fea.shape == (500, 18) and fea.flags["C_CONTIGUOUS"]
+    assert np.allclose(fea, np.column_stack(list(expected.values())))
+
+    out = np.empty((500, 4), dtype=np.float32)
+    fea32, cols32 = fourier_features(dates, periods={"weekly": 7}, n_harmonics=2, out=out)
+    assert fea32 is out
+    assert cols32 == ["weekly_sin_1", "weekly_cos_1", "weekly_sin_2", "weekly_cos_2"]
+    assert np.allclose(fea32, fea[:, 8:12], atol=1e-6)
+
+    with pytest.raises(ValueError):
+        fourier_features(dates, periods={"monthly": 30})
@@ -0,0 +1,45 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import numpy as np
+import pandas as pd
+
+from fclib.feature_engineering.cache import FeatureCache
+from fclib.feature_engineering.feature_utils import df_from_cartesian_product, grouped_lag_features
+
+
+def _data(last_week):
+    df = df_from_cartesian_product({"store": [1, 2], "brand": [1, 2, 3], "week": range(40, last_week + 1)})
+    df["move"] = np.sin(df["store"] * 7 + df["brand"] * 3 + df["week"])
+    return df
+
+
+def _lag_features(df):
+    return grouped_lag_features(df, ["store", "brand"], "week", ["move"], [2, 3], 4)
+
+
+def test_feature_cache(tmp_path):
+    cache = FeatureCache(str(tmp_path / "cache"))
+    df = _data(100)
+    fea = cache.get_or_compute(df, {"lags": [2, 3]}, _lag_features)
+    assert cache.misses == 1
+    pd.testing.assert_frame_equal(cache.get_or_compute(df, {"lags": [2, 3]}, _lag_features), fea)
+    assert cache.hits == 1
+    # A different spec or different data is a different entry
+    assert cache.key(df, {"lags": [2]}) != cache.key(df, {"lags": [2, 3]})
+    assert cache.key(df.iloc[1:], {"lags": [2]}) != cache.key(df, {"lags": [2]})
+
+    cache = FeatureCache(str(tmp_path / "blocks"))
+    for last_week in [100, 102]:
+        df = _data(last_week)
+        fea = cache.compute_by_block(df, "week", "lags", _lag_features, block_size=10, history=6)
+        pd.testing.assert_frame_equal(fea, _lag_features(df))
+    # Only the last block is recomputed for the second round
+    assert cache.hits == 6 and cache.misses == 8
+
+    size = cache.size()
+    cache.max_bytes = size // 2
+    cache.evict()
+    assert 0 < cache.size() <= size // 2
+    cache.clear()
+    assert cache.size() == 0
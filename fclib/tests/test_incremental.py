@@ -0,0 +1,69 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fclib.feature_engineering.feature_utils import (
+    df_from_cartesian_product,
+    grouped_lag_features,
+    lagged_features,
+    moving_averages,
+)
+from fclib.feature_engineering.incremental import IncrementalLagFeatures
+
+
+def _expected(df, lags, window_size):
+    fea = []
+    for _, group in df.groupby(["store", "brand"]):
+        group = group.sort_values("week")
+        lagged = lagged_features(group[["move"]], lags)
+        fea.append(pd.concat([lagged, moving_averages(group[["move"]], 2, window_size)], axis=1))
+    return pd.concat(fea).loc[df.index]
+
+
+@pytest.mark.parametrize("window_size", [3, None])
+def test_incremental_lag_features(tmp_path, window_size):
+    df = df_from_cartesian_product({"store": [1, 2], "brand": ["a", "b"], "week": range(1, 21)})
+    df["move"] = np.random.RandomState(0).randint(0, 100, len(df)).astype(float)
+    df.loc[df.index[::7], "move"] = np.nan
+    df = df.sample(frac=1, random_state=0)
+    lags = [1, 2, 5]
+    expected = _expected(df, lags, window_size)
+
+    state = IncrementalLagFeatures(["move"], lags, window_size).fit(df[df["week"] <= 8], ["store", "brand"], "week")
+    for week in range(9, 21):
+        if week == 15:
+            state.save(str(tmp_path / "state.npz"))
+            state = IncrementalLagFeatures.load(str(tmp_path / "state.npz"))
+        new_rows = df[df["week"] == week]
+        fea = state.update(new_rows)
+        assert list(fea.columns) == list(expected.columns)
+        assert np.allclose(fea.values, expected.loc[new_rows.index].values, equal_nan=True)
+
+    # New series start with an empty history, and a series can appear only once per update
+    fea = state.update(pd.DataFrame({"store": [3, 1], "brand": ["a", "a"], "move": [5.0, 1.0]}))
+    assert fea.iloc[0].isnull().all() and fea.iloc[1].notnull().any()
+    with pytest.raises(ValueError):
+        state.update(pd.DataFrame({"store": [1, 1], "brand": ["a", "a"], "move": [5.0, 1.0]}))
+
+
+@pytest.mark.parametrize("window_size", [10, None])
+def test_incremental_lag_features_long_run(window_size):
+    # Bursts of huge values between small ones make naive running sums drift away from the window
+    n_weeks = 3000
+    df = df_from_cartesian_product({"store": [1, 2], "brand": [1], "week": range(1, n_weeks + 1)})
+    rng = np.random.RandomState(1)
+    df["move"] = rng.uniform(0, 1, len(df))
+    burst = (df["week"] // 25) % 2 == 0
+    df.loc[burst, "move"] = rng.uniform(1e11, 1e12, burst.sum())
+    df.loc[df.index[::13], "move"] = np.nan
+    lags = [1, 3]
+    expected = grouped_lag_features(df, ["store", "brand"], "week", ["move"], lags, window_size)
+
+    state = IncrementalLagFeatures(["move"], lags, window_size).fit(df[df["week"] <= 50], ["store", "brand"], "week")
+    for week in range(51, n_weeks + 1):
+        new_rows = df[df["week"] == week]
+        fea = state.update(new_rows)
+        np.testing.assert_allclose(fea.values, expected.loc[new_rows.index].values, rtol=1e-9)
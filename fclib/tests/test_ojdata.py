@@ -5,9 +5,27 @@ import os
 import shutil
 import pandas as pd
 import numpy as np
+import pytest
+import hashlib
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
 from tempfile import TemporaryDirectory
 
-from fclib.dataset.ojdata import download_ojdata, complete_and_fill_df, _gen_split_indices, split_train_test
+from fclib.dataset.ojdata import (
+    download_ojdata,
+    maybe_download,
+    complete_and_fill_df,
+    complete_series,
+    _gen_split_indices,
+    _check_static_feat,
+    split_train_test,
+    iter_train_test_splits,
+    load_split,
+    specify_retail_data_schema,
+    specify_data_schema,
+    FIRST_WEEK_START,
+    AUX_EXCLUDED_COLS,
+)
 
 
 # data file that will be created and deleted each time test is run
@@ -70,6 +88,79 @@ def test_download_retail_data():
             assert list(df) == COLUMN_NAME_LIST[idx]
 
 
+class _RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves the bytes of the server's payload, with support for Range requests."""
+
+    def do_HEAD(self):
+        self.send_payload(head=True)
+
+    def do_GET(self):
+        self.send_payload(head=False)
+
+    def send_payload(self, head):
+        payload = self.server.payload
+        self.server.ranges.append(self.headers.get("Range"))
+        start, end = 0, len(payload)
+        if self.headers.get("Range"):
+            first, last = self.headers["Range"][len("bytes=") :].split("-")
+            start, end = int(first), int(last) + 1 if last else len(payload)
+            if start >= len(payload):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(len(payload)))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end - 1, len(payload)))
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        if not head:
+            self.wfile.write(payload[start:end])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = HTTPServer(("127.0.0.1", 0), _RangeRequestHandler)
+    server.payload = np.random.RandomState(0).bytes(100000)
+    server.ranges = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_maybe_download(http_server, tmp_path):
+    url = "http://127.0.0.1:{}/data.bin".format(http_server.server_port)
+    payload = http_server.payload
+    sha256 = hashlib.sha256(payload).hexdigest()
+
+    path = maybe_download(url, str(tmp_path / "full"), sha256=sha256, chunk_size=4096)
+    assert open(path, "rb").read() == payload and http_server.ranges == [None]
+    maybe_download(url, str(tmp_path / "full"), sha256=sha256)
+    assert len(http_server.ranges) == 1
+
+    # An interrupted download is resumed from the end of the partial file
+    os.makedirs(str(tmp_path / "resume"))
+    with open(str(tmp_path / "resume" / "data.bin.part"), "wb") as f:
+        f.write(payload[:30000])
+    path = maybe_download(url, str(tmp_path / "resume"), sha256=sha256)
+    assert open(path, "rb").read() == payload and http_server.ranges[-1] == "bytes=30000-"
+    assert not os.path.exists(path + ".part")
+
+    path = maybe_download(url, str(tmp_path / "parallel"), sha256=sha256, n_connections=3)
+    assert open(path, "rb").read() == payload
+    assert sorted(http_server.ranges[-3:]) == ["bytes=0-33332", "bytes=33333-66665", "bytes=66666-99999"]
+
+    with pytest.raises(ValueError):
+        maybe_download(url, str(tmp_path / "checksum"), sha256="0" * 64)
+    assert not os.listdir(str(tmp_path / "checksum"))
+
+
 def test_complete_and_fill_df(generate_ojdata):
     ojdata = pd.read_csv(ojdata_csv, index_col=False)
 
@@ -89,6 +180,78 @@ def test_complete_and_fill_df(generate_ojdata):
     assert len(row_out) == len(ojdata)
 
 
+def test_complete_and_fill_df_dense(generate_ojdata):
+    ojdata = pd.read_csv(ojdata_csv, index_col=False)
+    ojdata.loc[0, "logmove"] = np.nan
+    ojdata.loc[4, "logmove"] = np.nan
+    # The last week of store 2, brand 3 and a series that is not in the data
+    sparse = ojdata.drop(len(ojdata) - 1).sample(frac=1, random_state=0)
+
+    out = complete_and_fill_df(sparse, stores=[1, 2], brands=[1, 2, 3, 4], weeks=list(range(50, 61)))
+    assert len(out) == 2 * 4 * 11
+    assert list(out.columns) == list(ojdata.columns)
+    series = out[(out["store"] == 1) & (out["brand"] == 1)]
+    assert series["logmove"].iloc[0] == ojdata["logmove"].iloc[1]
+    assert series["logmove"].iloc[4] == ojdata["logmove"].iloc[3]
+    assert out["logmove"].iloc[-12] == ojdata["logmove"].iloc[-2]
+    assert out.loc[out["brand"] == 4, "logmove"].isnull().all()
+
+    values, columns = complete_and_fill_df(
+        sparse, stores=[1, 2], brands=[1, 2, 3, 4], weeks=list(range(50, 61)), dense=True
+    )
+    assert values.shape == (8, 11, len(columns)) and columns == list(ojdata.columns[3:])
+    assert np.allclose(values.reshape(-1, len(columns)), out[columns].values, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        complete_and_fill_df(pd.concat([ojdata, ojdata.iloc[:1]]), [1, 2], [1, 2, 3], list(range(50, 61)))
+
+
+def test_complete_series():
+    df = pd.DataFrame(
+        {"store": [1, 1, 1, 2, 2], "week": [1, 3, 6, 2, 4], "move": [1.0, 3.0, 6.0, 2.0, np.nan]}
+    ).sample(frac=1, random_state=0)
+
+    linear = complete_series(df, ["store"], "week", 1, method="linear")
+    assert list(linear.columns) == ["store", "week", "move"]
+    assert list(linear.store) == [1] * 6 + [2] * 6
+    assert list(linear.week) == list(range(1, 7)) * 2
+    expected = df.set_index(["store", "week"]).reindex(pd.MultiIndex.from_arrays([linear.store, linear.week]))
+    expected = expected.groupby(level="store").move.transform(lambda s: s.interpolate())
+    assert np.allclose(linear.move.values, expected.values, equal_nan=True)
+
+    ffill = complete_series(df, ["store"], "week", 1, method="ffill", per_series_range=True)
+    assert list(ffill.week) == list(range(1, 7)) + [2, 3, 4]
+    assert list(ffill.move) == [1, 1, 3, 3, 3, 6, 2, 2, 2]
+    assert list(complete_series(df, ["store"], "week", 1, method="zero").move.iloc[6:]) == [0, 2, 0, 0, 0, 0]
+
+    # Every other week on a datetime grid, with a season of two steps
+    times = pd.date_range("2020-01-02", periods=6, freq="2W-THU")
+    biweekly = pd.DataFrame({"time": times[[0, 1, 2, 5]], "move": [1.0, 2.0, 3.0, 6.0]})
+    seasonal = complete_series(biweekly, None, "time", "2W-THU", method="seasonal_naive", season_length=2)
+    assert (seasonal.time.values == times.values).all()
+    assert list(seasonal.move) == [1, 2, 3, 2, 3, 6]
+
+    with pytest.raises(ValueError):
+        complete_series(df, ["store"], "week", 2)
+    with pytest.raises(ValueError):
+        complete_series(pd.concat([df, df.iloc[:1]]), ["store"], "week", 1)
+    with pytest.raises(ValueError):
+        complete_series(df, ["store"], "week", 1, method="cubic")
+    with pytest.raises(ValueError):
+        complete_series(df, ["store"], "week", 1, method="seasonal_naive")
+
+
+def test_complete_series_mixed_and_empty():
+    df = pd.DataFrame({"store": [1, 1, 1], "week": [1, 3, 4], "move": [1.0, 3.0, 4.0], "promo": ["a", "b", None]})
+    # Non-numeric columns are forward filled by linear interpolation
+    linear = complete_series(df, ["store"], "week", 1, method="linear")
+    assert list(linear.move) == [1, 2, 3, 4]
+    assert list(linear.promo) == ["a", "a", "b", "b"]
+
+    empty = complete_series(df.iloc[:0], ["store"], "week", 1, method="linear")
+    assert empty.empty and list(empty.columns) == list(df.columns)
+
+
 def test_gen_split_indices(generate_ojdata):
     base = _gen_split_indices()
     assert len(base) == 3
@@ -114,3 +277,132 @@ def test_split_train_test(generate_ojdata):
 
     for i in list(range(3)):
         assert max(traindf[i].week) < min(testdf[i].week)
+
+
+def test_split_train_test_row_order(generate_ojdata, tmp_path):
+    # Copies and csv files keep the store, brand and week order of the sales data, like boolean masks
+    sales = pd.read_csv(ojdata_csv, index_col=0).sample(frac=1, random_state=0)
+    sales.to_csv(str(tmp_path / "yx.csv"))
+    test_start, test_end, train_end = _gen_split_indices(3, 2, 1, 50, 60)
+    for copy in [True, False]:
+        traindf, testdf, auxdf = split_train_test(str(tmp_path), 3, 2, 1, 50, 60, write_csv=True, copy=copy)
+        for i in range(3):
+            expected = sales[(sales.week >= 50) & (sales.week <= train_end[i])]
+            written = pd.read_csv(str(tmp_path / "train" / "train_{}.csv".format(i + 1)), index_col=0)
+            pd.testing.assert_frame_equal(written, expected)
+            pd.testing.assert_frame_equal(traindf[i], expected)
+            expected = sales[(sales.week >= test_start[i]) & (sales.week <= test_end[i])]
+            pd.testing.assert_frame_equal(testdf[i], expected)
+            expected = sales[(sales.week >= 50) & (sales.week <= test_end[i])].drop(AUX_EXCLUDED_COLS, axis=1)
+            written = pd.read_csv(str(tmp_path / "train" / "auxi_{}.csv".format(i + 1)), index_col=0)
+            pd.testing.assert_frame_equal(written, expected)
+            pd.testing.assert_frame_equal(auxdf[i], expected)
+
+
+def test_iter_train_test_splits(generate_ojdata):
+    sales = pd.read_csv(ojdata_csv, index_col=0)
+    splits = list(iter_train_test_splits(sales, 3, 2, 1, 50, 60))
+    assert len(splits) == 3
+
+    def sort(df):
+        return df.reset_index().sort_values(["store", "brand", "week"]).reset_index(drop=True)
+
+    test_start, test_end, train_end = _gen_split_indices(3, 2, 1, 50, 60)
+    for i, (train_df, test_df, aux_df) in enumerate(splits):
+        expected = sales[(sales.week >= 50) & (sales.week <= train_end[i])]
+        pd.testing.assert_frame_equal(sort(train_df), sort(expected))
+        expected = sales[(sales.week >= test_start[i]) & (sales.week <= test_end[i])]
+        pd.testing.assert_frame_equal(sort(test_df), sort(expected))
+        assert "logmove" not in aux_df and aux_df.week.max() == test_end[i]
+
+    # Views of the same sorted data, unless copies are requested
+    assert np.shares_memory(splits[0][0].logmove.values, splits[2][0].logmove.values)
+    train_df, _, _ = next(iter_train_test_splits(sales, 3, 2, 1, 50, 60, copy=True))
+    assert not np.shares_memory(train_df.logmove.values, splits[0][0].logmove.values)
+
+
+def test_load_split(generate_ojdata, tmp_path):
+    shutil.copyfile(ojdata_csv, str(tmp_path / "yx.csv"))
+    # Columnar splits are sorted by week like the views of split_train_test
+    splits = list(zip(*split_train_test(str(tmp_path), 3, 2, 1, 50, 60, copy=False, write_columnar=True)))
+    assert not list(tmp_path.glob("*/*.csv"))
+
+    for i, (train_df, test_df, aux_df) in enumerate(splits):
+        loaded = load_split(str(tmp_path), i)
+        for df, expected in zip(loaded, [train_df, test_df, aux_df]):
+            pd.testing.assert_frame_equal(df, expected)
+
+    train_df, test_df, aux_df = load_split(str(tmp_path), 2, columns=["brand", "week", "logmove"])
+    assert list(train_df.columns) == ["brand", "week", "logmove"]
+    assert list(aux_df.columns) == ["brand", "week"]
+    assert (test_df.week.values == splits[2][1].week.values).all()
+
+
+def test_specify_retail_data_schema(generate_ojdata, tmp_path):
+    sales = pd.read_csv(ojdata_csv, index_col=False).iloc[1:]
+    sales.loc[sales.index[:2], "logmove"] = [-1, 0.5]
+    pd.DataFrame({"STORE": [1, 2], "AGE60": [0.1, 0.2]}).to_csv(str(tmp_path / "storedemo.csv"), index=False)
+
+    df_config, df = specify_retail_data_schema(str(tmp_path), sales=sales.copy())
+    assert df_config["time_col_name"] == "timestamp"
+    assert len(df) == sales.store.nunique() * sales.brand.nunique() * (sales.week.max() - sales.week.min() + 1)
+    assert list(df.columns[:3]) == ["store", "brand", "week"]
+    assert list(df.columns[-3:]) == ["move", "AGE60", "timestamp"]
+
+    # Rows are ordered by store, brand and week in order of first appearance, with missing values in new rows
+    first = df.iloc[0]
+    assert (first.store, first.brand, first.week) == (sales.store.iloc[0], sales.brand.iloc[0], sales.week.min())
+    merged = df.merge(sales, on=["store", "brand", "week"], suffixes=("", "_sales"))
+    assert len(merged) == len(sales) and np.allclose(merged.logmove, merged.logmove_sales)
+    assert df.logmove.isnull().sum() == len(df) - len(sales)
+    expected_move = [round(np.exp(x)) if x > 0 else 0 for x in merged.logmove_sales]
+    assert list(merged.move) == expected_move
+    assert (df.timestamp == FIRST_WEEK_START + pd.to_timedelta((df.week - 1) * 7, unit="D")).all()
+    assert (df.AGE60 == df.store.map({1: 0.1, 2: 0.2})).all()
+
+    # Store demographics are read once and get compact types planned from the frame
+    _, compact = specify_retail_data_schema(str(tmp_path), sales=sales.copy(), compact_dtypes=True)
+    assert compact.AGE60.dtype == np.float32 and np.allclose(compact.AGE60, df.AGE60)
+
+
+def test_specify_data_schema():
+    df = pd.DataFrame(
+        {
+            "timestamp": ["01/01/2001", "03/01/2001", "02/01/2001", "01/01/2001"],
+            "sales": [1234, 2345, 1324, 1000],
+            "store": ["1001", "1002", "1001", "1002"],
+            "income": [53000, 65000, 53000, 65000],
+            "price": [10, 12, 11, 10],
+        }
+    )
+    df_copy = df.copy()
+    df_config = specify_data_schema(df, "timestamp", "sales", "MS", "%m/%d/%Y", ["store"], ["income"], ["price"])
+    assert df_config["ts_id_col_names"] == ["store"] and df_config["static_feat_names"] == ["income"]
+    pd.testing.assert_frame_equal(df, df_copy)
+
+    with pytest.raises(ValueError, match="date format"):
+        specify_data_schema(df, "timestamp", "sales", "MS", "%Y-%m-%d")
+    with pytest.raises(ValueError, match="irregular"):
+        specify_data_schema(df, "timestamp", "sales", "2MS", "%m/%d/%Y")
+    with pytest.raises(ValueError, match="frequency is invalid"):
+        specify_data_schema(df, "timestamp", "sales", "fortnightly", "%m/%d/%Y")
+    with pytest.raises(ValueError, match="price"):
+        specify_data_schema(df, "timestamp", "sales", "MS", "%m/%d/%Y", ["store"], ["income", "price"])
+
+    # A sample of all the rows and series finds the same problems
+    with pytest.raises(ValueError, match="price"):
+        specify_data_schema(df, "timestamp", "sales", "MS", "%m/%d/%Y", ["store"], ["price"], sample_size=2)
+    # Rows with a missing series id are left out of the sample, like of the full check
+    missing_id = df.assign(store=["1001", None, "1002", None], income=[53000, 1, 65000, 2])
+    for sample_size in [None, 1]:
+        specify_data_schema(
+            missing_id, "timestamp", "sales", "MS", "%m/%d/%Y", ["store"], ["income"], sample_size=sample_size
+        )
+    # No series to sample when every id is missing
+    no_ids = missing_id.assign(store=None)
+    specify_data_schema(no_ids, "timestamp", "sales", "MS", "%m/%d/%Y", ["store"], ["income"], sample_size=1)
+    _check_static_feat(no_ids.iloc[:0], ["store"], ["income"], 1, np.random.RandomState(0))
+    irregular = pd.DataFrame({"timestamp": pd.date_range("2001-01-01", periods=1000, freq="H"), "sales": 0})
+    irregular.loc[1:999:2, "timestamp"] += pd.Timedelta("1min")
+    with pytest.raises(ValueError, match="irregular"):
+        specify_data_schema(irregular, "timestamp", "sales", "H", None, sample_size=100, random_state=0)
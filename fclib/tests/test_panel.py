@@ -0,0 +1,48 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fclib.common.panel import TimeSeriesPanel
+
+
+def test_time_series_panel():
+    df = pd.DataFrame(
+        {
+            "store": [2, 1, 1, 2, 1],
+            "brand": [1, 1, 2, 1, 1],
+            "week": [3, 3, 3, 4, 4],
+            "move": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "price": [0.1, 0.2, 0.3, 0.4, 0.5],
+        }
+    )
+    panel = TimeSeriesPanel.from_long(df, ["store", "brand"], "week")
+    assert panel.shape == (3, 2, 2)
+    assert list(panel.series_index) == [(1, 1), (1, 2), (2, 1)] and list(panel.time_index) == [3, 4]
+    assert panel.feature_names == ["move", "price"]
+    assert list(panel.series((2, 1))[:, 0]) == [1, 4]
+    assert np.isnan(panel.feature("move")[1, 1])
+
+    # Missing time steps are dropped when converting back
+    long_df = panel.to_long()
+    expected = df.sort_values(["store", "brand", "week"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(long_df, expected)
+    assert len(panel.to_long(dropna=False)) == 6
+
+    later = panel.time_slice(4)
+    assert later.shape == (3, 1, 2) and np.shares_memory(later.values, panel.values)
+    assert list(later.series((1, 1))[:, 1]) == [0.5]
+
+    single = TimeSeriesPanel.from_long(df[df.brand == 1], ["store"], "week", ["move"], sort=False)
+    assert list(single.series_index) == [2, 1] and list(single.series(1)[:, 0]) == [2, 5]
+
+    with pytest.raises(ValueError):
+        TimeSeriesPanel.from_long(pd.concat([df, df.iloc[:1]]), ["store", "brand"], "week")
+
+    # Only numeric columns are values by default
+    named = df.assign(name=["a", "b", "c", "d", "e"])
+    assert TimeSeriesPanel.from_long(named, ["store", "brand"], "week").feature_names == ["move", "price"]
+    with pytest.raises(ValueError, match="name"):
+        TimeSeriesPanel.from_long(named, ["store", "brand"], "week", ["move", "name"])
@@ -0,0 +1,104 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fclib.feature_engineering.feature_utils import (
+    week_of_month,
+    time_of_year,
+    day_of_week,
+    hour_of_day,
+    fourier_features,
+    lagged_features,
+    rolling_features,
+)
+from fclib.feature_engineering.pipeline import FeaturePipeline
+
+
+def _panel(n=30):
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {
+            "store": np.repeat([1, 2, 3], n),
+            "week": np.tile(np.arange(n), 3),
+            "week_start": np.tile(pd.date_range("2019-12-20", periods=n, freq="13H"), 3),
+            "move": rng.rand(3 * n),
+            "price": rng.rand(3 * n),
+            "unused": "x",
+        }
+    )
+    return df.sample(frac=1, random_state=0)
+
+
+def test_feature_pipeline():
+    df = _panel()
+    pipeline = FeaturePipeline(
+        datetime_col="week_start",
+        group_cols=["store"],
+        time_col="week",
+        calendar=["week_of_month", "time_of_year", "day_of_week", "hour_of_day"],
+        fourier={"periods": {"annual": 365.24, "daily": 24}, "n_harmonics": 2},
+        lags={"cols": ["move"], "lags": [1, 3]},
+        rolling={"cols": ["move", "price"], "windows": [3], "stats": ["mean", "std", "max"], "expanding": True},
+        normalize={"cols": ["price"], "method": "minmax"},
+    )
+    assert "unused" not in pipeline.used_columns
+    with pytest.raises(ValueError):
+        pipeline.transform(df)
+
+    fea = pipeline.fit_transform(df)
+    assert list(fea.columns) == pipeline.columns
+    assert fea.index.equals(df.index)
+    pipeline.dedup_timestamps = False
+    pd.testing.assert_frame_equal(pipeline.transform(df), fea)
+    assert list(pipeline.timings) == ["prepare", "calendar", "fourier", "lags", "rolling", "normalize"]
+
+    dt = df["week_start"]
+    assert np.array_equal(fea["week_of_month"], week_of_month(dt))
+    assert np.allclose(fea["time_of_year"], time_of_year(dt))
+    assert np.array_equal(fea["day_of_week"], day_of_week(dt))
+    assert np.array_equal(fea["hour_of_day"], hour_of_day(dt))
+    fourier, fourier_cols = fourier_features(dt, {"annual": 365.24, "daily": 24}, 2)
+    assert np.allclose(fea[fourier_cols].values, fourier)
+
+    for _, group in df.groupby("store"):
+        group = group.sort_values("week")
+        lagged = lagged_features(group[["move"]], [1, 3])
+        rolling = rolling_features(group[["move", "price"]], 2, [3], ["mean", "std", "max"], expanding=True)
+        for expected in [lagged, rolling]:
+            assert np.allclose(fea.loc[group.index, expected.columns].values, expected.values, equal_nan=True)
+        price = group["price"]
+        normalized = (price - price.min()) / (price.max() - price.min())
+        assert np.allclose(fea.loc[group.index, "price_normalized"], normalized)
+
+
+def test_feature_pipeline_single_series():
+    df = _panel().query("store == 1")
+    pipeline = FeaturePipeline(
+        rolling={"cols": ["move"], "windows": [4], "stats": ["ewm"], "start_step": 1},
+        normalize={"cols": ["move"], "method": "standard"},
+        dtype=np.float32,
+    )
+    fea = pipeline.fit_transform(df)
+    assert all(fea.dtypes == np.float32)
+    expected = rolling_features(df[["move"]], 1, [4], ["ewm"])
+    assert np.allclose(fea["move_ewm4"], expected["move_ewm4"], equal_nan=True)
+    assert np.isclose(fea["move_normalized"].mean(), 0, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        FeaturePipeline(calendar=["week_of_month"])
+
+
+def test_feature_pipeline_grouped_ewm():
+    df = _panel()
+    df.loc[df.index[::7], "move"] = np.nan
+    pipeline = FeaturePipeline(
+        group_cols=["store"], time_col="week", rolling={"cols": ["move"], "windows": [4], "stats": ["ewm"]}
+    )
+    fea = pipeline.transform(df)
+    for _, group in df.groupby("store"):
+        group = group.sort_values("week")
+        expected = group["move"].shift(2).ewm(span=4).mean()
+        assert np.allclose(fea.loc[group.index, "move_ewm4"], expected, equal_nan=True)
@@ -4,6 +4,7 @@
 import pandas as pd
 
 from fclib.common.plot import plot_predictions_with_history
+from fclib.common.panel import TimeSeriesPanel
 
 
 def test_plot_predictions_with_history(generate_ojdata, generate_data):
@@ -22,3 +23,17 @@ def test_plot_predictions_with_history(generate_ojdata, generate_data):
         min_timestep=min(data.week),
         num_samples=4,
     )
+
+    # Panels of the same data can be plotted too
+    plot_predictions_with_history(
+        TimeSeriesPanel.from_long(pred, ["store", "brand"], "week", ["logmove"]),
+        TimeSeriesPanel.from_long(data, ["store", "brand"], "week", ["logmove"]),
+        grain1_unique_vals=[1, 2],
+        grain2_unique_vals=[1, 2, 3],
+        time_col_name="week",
+        target_col_name="logmove",
+        grain1_name="store",
+        grain2_name="brand",
+        min_timestep=min(data.week),
+        num_samples=4,
+    )
@@ -0,0 +1,173 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import os
+import gzip
+import struct
+import numpy as np
+import pandas as pd
+import pytest
+
+from fclib.dataset.rdata import read_rdata, parse_rdata, NA_INTEGER
+from fclib.dataset.ojdata import download_ojdata, load_ojdata, DATA_FILE_LIST
+
+# R data files saved by R, see the README of the directory
+RDATA_DIR = "fclib/tests/resources/rdata"
+
+
+class _RDataWriter:
+    """Minimal XDR serializer of R data files, which writes repeated symbols as references
+    like R does. Objects are (type, values, attributes) tuples, serialized in one pass so
+    that references are numbered in the order of the file."""
+
+    def __init__(self):
+        self.symbols = []
+
+    @staticmethod
+    def int(i):
+        return struct.pack(">i", i)
+
+    def flags(self, sexp_type, is_object=False, has_attr=False, has_tag=False, levels=0):
+        return self.int(sexp_type | is_object << 8 | has_attr << 9 | has_tag << 10 | levels << 12)
+
+    def charsxp(self, s):
+        if s is None:
+            return self.int(9) + self.int(-1)
+        data = s.encode("utf-8")
+        return self.flags(9, levels=8) + self.int(len(data)) + data
+
+    def symbol(self, name):
+        if name in self.symbols:
+            return self.int(255 | (self.symbols.index(name) + 1) << 8)
+        self.symbols.append(name)
+        return self.int(1) + self.charsxp(name)
+
+    def pairlist(self, items):
+        data = b"".join(self.flags(2, has_tag=True) + self.symbol(tag) + self.serialize(value) for tag, value in items)
+        return data + self.int(254)
+
+    def serialize(self, obj):
+        sexp_type, values, attributes = obj
+        is_object = attributes is not None and "class" in dict(attributes)
+        data = self.flags(sexp_type, is_object, attributes is not None) + self.int(len(values))
+        if sexp_type == 13:
+            data += np.asarray(values, dtype=">i4").tobytes()
+        elif sexp_type == 14:
+            data += np.asarray(values, dtype=">f8").tobytes()
+        elif sexp_type == 16:
+            data += b"".join(self.charsxp(v) for v in values)
+        else:
+            data += b"".join(self.serialize(v) for v in values)
+        return data + (self.pairlist(attributes) if attributes is not None else b"")
+
+    def rdata(self, objects):
+        header = b"RDX3\nX\n" + self.int(3) + self.int(0x040000) + self.int(0x030500) + self.int(5) + b"UTF-8"
+        return gzip.compress(header + self.pairlist(objects))
+
+
+def _data_frame(columns):
+    attributes = [
+        ("names", (16, [name for name, _ in columns], None)),
+        ("row.names", (13, [NA_INTEGER, -len(columns[0][1][1])], None)),
+        ("class", (16, ["data.frame"], None)),
+    ]
+    return (19, [column for _, column in columns], attributes)
+
+
+def _write_ojdata(path):
+    brand = (13, [1, 2, NA_INTEGER], [("levels", (16, ["a", "b"], None)), ("class", (16, ["factor"], None))])
+    yx = _data_frame(
+        [
+            ("store", (13, [2, 2, 5], None)),
+            ("week", (13, [40, NA_INTEGER, 41], None)),
+            ("logmove", (14, [9.018695492141877, np.nan, 1 / 3], None)),
+            ("brand", brand),
+        ]
+    )
+    storedemo = _data_frame([("STORE", (13, [2, 5], None)), ("NAME", (16, ["x y", None], None))])
+    orange_juice = (19, [yx, storedemo], [("names", (16, ["yx", "storedemo"], None))])
+    with open(path, "wb") as f:
+        f.write(_RDataWriter().rdata([("orangeJuice", orange_juice)]))
+
+
+def test_read_rdata(tmp_path):
+    path = str(tmp_path / "orangeJuice.rda")
+    _write_ojdata(path)
+    objects = read_rdata(path)
+    assert list(objects) == ["orangeJuice"]
+
+    yx, storedemo = objects["orangeJuice"].values()
+    assert list(yx.columns) == ["store", "week", "logmove", "brand"]
+    assert yx.store.dtype == np.int32 and list(yx.store) == [2, 2, 5]
+    assert np.isnan(yx.week[1]) and yx.week[2] == 41
+    assert yx.logmove[0] == 9.018695492141877 and np.isnan(yx.logmove[1])
+    assert list(yx.brand.cat.categories) == ["a", "b"] and list(yx.brand.cat.codes) == [0, 1, -1]
+    assert list(storedemo.NAME) == ["x y", None]
+
+    with pytest.raises(ValueError):
+        parse_rdata(b"RDA2\nA\n")
+
+
+def test_read_rdata_saved_by_r():
+    def read(name):
+        objects = read_rdata(os.path.join(RDATA_DIR, name + ".rda"))
+        assert len(objects) == 1
+        return list(objects.values())[0]
+
+    for name in ["dataframe", "dataframe_v2", "dataframe_rownames"]:
+        df = read(name)
+        assert list(df.columns) == ["class", "value"]
+        assert list(df["class"].cat.categories) == ["a", "b"] and list(df["class"]) == ["a", "b", "b"]
+        assert df["value"].dtype == np.int32 and list(df["value"]) == [1, 2, 3]
+    # Automatic row names are stored in the compact form c(NA, -n)
+    assert isinstance(read("dataframe").index, pd.RangeIndex)
+    assert list(read("dataframe_rownames").index) == ["Madrid", "Frankfurt", "Herzberg am Harz"]
+    df = read("dataframe_range_rownames")
+    assert list(df.index) == [2, 3, 4] and list(df.col1) == [10.0, 20.0, 30.0]
+
+    factor = read("factor")
+    assert list(factor.categories) == ["a", "b"] and list(factor.codes) == [0, 1, 1]
+    intseq = read("altrep_compact_intseq")
+    assert intseq.dtype == np.int32
+    np.testing.assert_array_equal(intseq, np.arange(1000))
+    np.testing.assert_array_equal(read("altrep_wrap_real"), [3.0])
+    assert list(read("altrep_deferred_string")) == [
+        "1",
+        "2.3",
+        "10000",
+        "1e+05",
+        "-10000",
+        "-1e+05",
+        "0.001",
+        "1e-04",
+        "1e-05",
+    ]
+
+
+def test_load_ojdata(tmp_path):
+    data_dir = str(tmp_path)
+    _write_ojdata(os.path.join(data_dir, "orangeJuice.rda"))
+    download_ojdata(data_dir)
+    yx, storedemo = load_ojdata(data_dir)
+
+    yx_csv = pd.read_csv(os.path.join(data_dir, DATA_FILE_LIST[0]), na_values=" ")
+    assert np.allclose(yx_csv.logmove.values, yx.logmove.values, equal_nan=True)
+    assert list(yx_csv.brand.fillna("")) == ["a", "b", ""]
+    assert len(pd.read_csv(os.path.join(data_dir, DATA_FILE_LIST[1]))) == 2
+    # Same data types as the csv files, e.g. int64 instead of int32 ids
+    pd.testing.assert_series_equal(yx.dtypes, yx_csv.dtypes)
+    assert yx.store.dtype == np.int64
+
+    # Later loads read the snapshot
+    os.remove(os.path.join(data_dir, "orangeJuice.rda"))
+    pd.testing.assert_frame_equal(load_ojdata(data_dir)[0], yx)
+
+
+def test_load_ojdata_without_r(tmp_path, monkeypatch):
+    # Files that cannot be decoded in Python need Rscript
+    with open(str(tmp_path / "orangeJuice.rda"), "wb") as f:
+        f.write(gzip.compress(b"RDA3\nA\n"))
+    monkeypatch.setattr("shutil.which", lambda name: None)
+    with pytest.raises(ValueError):
+        load_ojdata(str(tmp_path))
+    assert not any(name.startswith("ojdata_snapshot") for name in os.listdir(str(tmp_path)))
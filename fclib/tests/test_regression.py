@@ -1,9 +1,11 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import numpy as np
 import pandas as pd
 
 from fclib.models.multiple_linear_regression import fit, predict
+from fclib.common.panel import TimeSeriesPanel
 
 
 def test_fit_and_predict(generate_ojdata, generate_data):
@@ -19,3 +21,32 @@ def test_fit_and_predict(generate_ojdata, generate_data):
     assert predint.prediction.dtype.name == "int64"
     predfloat = predict(newdata, mods, "week", keyvars, xvars, False, False)
     assert predfloat.prediction.dtype.name == "float64"
+
+    # Models trained on a panel of the same data give the same predictions
+    train = TimeSeriesPanel.from_long(data, keyvars, "week", xvars + [target])
+    test = TimeSeriesPanel.from_long(newdata, keyvars, "week", xvars)
+    predpanel = predict(test, fit(train, keyvars, xvars, target), "week", keyvars, xvars, False, False)
+    predfloat = predfloat.sort_values(keyvars + ["week"]).reset_index(drop=True)
+    assert np.allclose(predpanel.prediction.values, predfloat.prediction.values)
+    assert (predpanel[keyvars + ["week"]].values == predfloat[keyvars + ["week"]].values).all()
+
+
+def test_fit_and_predict_panel_empty_series():
+    # Store 2 has no rows in week 3
+    df = pd.DataFrame(
+        {
+            "store": [1, 1, 1, 2, 2],
+            "week": [1, 2, 3, 1, 2],
+            "price": [1.0, 2.0, 3.0, 1.0, 2.0],
+            "move": [2.0, 4.0, 6.0, 3.0, 5.0],
+        }
+    )
+    panel = TimeSeriesPanel.from_long(df, ["store"], "week")
+    mods = fit(panel, ["store"], ["price"], "move")
+    pred = predict(panel.time_slice(3), mods, "week", ["store"], ["price"], False, False)
+    assert list(pred.store) == [1] and np.allclose(pred.prediction.values, [6.0])
+
+    # Series without rows are skipped in training too, like groups of a dataframe
+    assert list(fit(panel.time_slice(3), ["store"], ["price"], "move")) == [1]
+    empty = predict(panel.time_slice(4), mods, "week", ["store"], ["price"], False, False)
+    assert len(empty) == 0 and list(empty.columns) == ["week", "prediction", "store"]
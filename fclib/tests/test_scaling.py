@@ -0,0 +1,83 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fclib.feature_engineering.scaling import GroupedScaler
+
+
+def _panel():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {
+            "store": np.repeat([2, 1, 2, 1], 25),
+            "brand": np.repeat(["a", "a", "b", "b"], 25),
+            "move": rng.rand(100) * np.repeat([1, 10, 100, 1000], 25),
+            "price": rng.rand(100),
+        }
+    )
+    df.loc[df["store"] == 1, "price"] = 3.0
+    return df.sample(frac=1, random_state=1)
+
+
+def test_grouped_scaler():
+    df = _panel()
+    with pytest.raises(ValueError):
+        GroupedScaler("robust")
+
+    scaler = GroupedScaler("minmax").fit(df, ["store", "brand"], ["move", "price"])
+    scaled = scaler.transform(df)
+    grouped = pd.DataFrame(scaled, columns=["move", "price"]).groupby([df["store"].values, df["brand"].values])
+    assert np.allclose(grouped["move"].min(), 0) and np.allclose(grouped["move"].max(), 1)
+    # constant series are only shifted
+    assert np.allclose(scaled[(df["store"] == 1).values, 1], 0)
+    assert np.allclose(scaler.inverse_transform(df.assign(move=scaled[:, 0]), ["move"])[:, 0], df["move"])
+
+    scaler = GroupedScaler("standard").fit(df, ["store", "brand"], ["move"])
+    grouped = pd.Series(scaler.transform(df)[:, 0]).groupby([df["store"].values, df["brand"].values])
+    assert np.allclose(grouped.mean(), 0) and np.allclose(grouped.std(ddof=0), 1)
+
+    # in place on a float32 buffer
+    buffer = df[["move"]].values.astype(np.float32)
+    result = scaler.transform(df, ["move"], out=buffer)
+    assert result is buffer and buffer.dtype == np.float32
+    assert np.allclose(buffer[:, 0], scaler.transform(df)[:, 0], atol=1e-5)
+
+    with pytest.raises(ValueError):
+        scaler.transform(pd.DataFrame({"store": [3], "brand": ["a"], "move": [1.0]}))
+
+
+def test_grouped_scaler_save_load(tmp_path):
+    df = _panel()
+    scaler = GroupedScaler("minmax").fit(df, ["store", "brand"], ["move", "price"])
+    path = str(tmp_path / "scaler.npz")
+    scaler.save(path)
+
+    loaded = GroupedScaler.load(path)
+    assert loaded.method == "minmax"
+    assert loaded.group_cols == ["store", "brand"] and loaded.value_cols == ["move", "price"]
+    assert np.array_equal(loaded.transform(df), scaler.transform(df))
+    scaled = df.assign(move=scaler.transform(df, ["move"])[:, 0])
+    assert np.allclose(loaded.inverse_transform(scaled, ["move"])[:, 0], df["move"])
+
+
+def test_grouped_scaler_save_load_keys(tmp_path):
+    # Integer keys, integers mixed with strings and tuples keep their types
+    df = pd.DataFrame(
+        {
+            "store": np.repeat([2, 1], 4),
+            "brand": pd.Series([1, "x"] * 4, dtype=object),
+            "pair": [(1, 2), (1, 2), (3, 4), (3, 4)] * 2,
+            "move": np.arange(8.0) ** 2,
+        }
+    )
+    scaler = GroupedScaler("standard").fit(df, ["store", "brand", "pair"], ["move"])
+    path = str(tmp_path / "scaler.npz")
+    scaler.save(path)
+
+    loaded = GroupedScaler.load(path)
+    assert loaded.series_keys.equals(scaler.series_keys)
+    assert set(loaded.series_keys.get_level_values("brand")) == {1, "x"}
+    assert np.array_equal(loaded.transform(df), scaler.transform(df))
@@ -0,0 +1,220 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+# This script benchmarks the vectorized feature engineering utilities in fclib and reports
+# the per-row cost of each function at several input sizes.
+#
+# Example:
+#   python tools/benchmark_features.py --suite calendar --sizes 1000000,10000000,50000000
+#   python tools/benchmark_features.py --suite retail --sizes 106139,10613900 --repeat 1
+
+import math
+import time
+import datetime
+import itertools
+import argparse
+import numpy as np
+import pandas as pd
+
+from fclib.feature_engineering.feature_utils import (
+    annual_fourier,
+    weekly_fourier,
+    daily_fourier,
+    fourier_features,
+    week_of_month,
+    month_of_year,
+    on_unique_timestamps,
+    time_of_year,
+    normalized_current_datehour,
+    grouped_lag_features,
+    add_datetime,
+    get_month_day_range,
+)
+from fclib.feature_engineering.pipeline import FeaturePipeline
+from fclib.dataset.ojdata import FIRST_WEEK_START, _prepare_retail_data
+
+
+def random_datetimes(n_rows, start="2000-01-01", end="2020-12-31", seed=0):
+    """Generate a Series of random hourly timestamps between start and end."""
+    rng = np.random.RandomState(seed)
+    start_hour = pd.Timestamp(start).value // 3600000000000
+    end_hour = pd.Timestamp(end).value // 3600000000000
+    hours = rng.randint(start_hour, end_hour, size=n_rows).astype("int64")
+    return pd.Series(hours.astype("datetime64[h]").astype("datetime64[ns]"))
+
+
+def time_call(func, *args, repeat=3):
+    """Return the best wall-clock time of calling func(*args) in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_calendar(n_rows, repeat):
+    """Benchmark the calendar feature kernels."""
+    datetime_col = random_datetimes(n_rows)
+    min_datehour, max_datehour = datetime_col.min(), datetime_col.max()
+    return {
+        "week_of_month": time_call(week_of_month, datetime_col, repeat=repeat),
+        "time_of_year": time_call(time_of_year, datetime_col, repeat=repeat),
+        "normalized_current_datehour": time_call(
+            normalized_current_datehour, datetime_col, min_datehour, max_datehour, repeat=repeat
+        ),
+    }
+
+
+def bench_fourier(n_rows, repeat, n_harmonics=20):
+    """Benchmark the Fourier feature matrix builder against the per-harmonic helpers."""
+    datetime_col = random_datetimes(n_rows)
+
+    def per_harmonic(datetime_col):
+        output = {}
+        for func in [annual_fourier, weekly_fourier, daily_fourier]:
+            output.update(func(datetime_col, n_harmonics))
+        return output
+
+    return {
+        "fourier helpers (dict of Series)": time_call(per_harmonic, datetime_col, repeat=repeat),
+        "fourier_features": time_call(fourier_features, datetime_col, None, n_harmonics, repeat=repeat),
+    }
+
+
+def bench_dedup(n_rows, repeat, n_timestamps=200):
+    """Benchmark calendar features of a panel whose series share n_timestamps weekly timestamps,
+    computed for every row and once per distinct timestamp."""
+    weeks = pd.date_range("2000-01-06", periods=n_timestamps, freq="7D").values
+    datetime_col = pd.Series(np.tile(weeks, -(-n_rows // n_timestamps))[:n_rows])
+    results = {}
+    for func in [week_of_month, month_of_year]:
+        results[func.__name__] = time_call(func, datetime_col, repeat=repeat)
+        results[func.__name__ + " (unique)"] = time_call(on_unique_timestamps, func, datetime_col, repeat=repeat)
+    return results
+
+
+def bench_datetime(n_rows, repeat):
+    """Benchmark the array paths of add_datetime and get_month_day_range against loops over
+    the scalar path, as used by backtest schedulers."""
+    datetime_col = pd.DatetimeIndex(random_datetimes(n_rows))
+    scalars = datetime_col.to_pydatetime()
+    return {
+        "add_datetime month (loop)": time_call(lambda: [add_datetime(x, "month", 1) for x in scalars], repeat=repeat),
+        "add_datetime month (array)": time_call(add_datetime, datetime_col, "month", 1, repeat=repeat),
+        "add_datetime week (loop)": time_call(lambda: [add_datetime(x, "week", 2) for x in scalars], repeat=repeat),
+        "add_datetime week (array)": time_call(add_datetime, datetime_col, "week", 2, repeat=repeat),
+        "get_month_day_range (loop)": time_call(lambda: [get_month_day_range(x) for x in scalars], repeat=repeat),
+        "get_month_day_range (array)": time_call(get_month_day_range, datetime_col, repeat=repeat),
+    }
+
+
+def bench_pipeline(n_rows, repeat, n_series=1000):
+    """Benchmark a FeaturePipeline against calling the feature functions one at a time."""
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {
+            "store": np.arange(n_rows) % n_series,
+            "week": np.arange(n_rows) // n_series,
+            "week_start": random_datetimes(n_rows).values,
+            "move": rng.rand(n_rows),
+        }
+    )
+    pipeline = FeaturePipeline(
+        datetime_col="week_start",
+        group_cols=["store"],
+        time_col="week",
+        calendar=["week_of_month", "time_of_year"],
+        fourier={"periods": {"annual": 365.24}, "n_harmonics": 3},
+        lags={"cols": ["move"], "lags": [2, 3, 4]},
+        rolling={"cols": ["move"], "windows": [4, 8], "stats": ["mean"]},
+    )
+
+    def one_at_a_time(df):
+        fea = [
+            week_of_month(df["week_start"]),
+            pd.Series(time_of_year(df["week_start"]), index=df.index),
+            pd.DataFrame(fourier_features(df["week_start"], {"annual": 365.24}, 3)[0], index=df.index),
+            grouped_lag_features(df, ["store"], "week", ["move"], [2, 3, 4], [4, 8]),
+        ]
+        return pd.concat(fea, axis=1)
+
+    return {
+        "feature functions + concat": time_call(one_at_a_time, df, repeat=repeat),
+        "FeaturePipeline": time_call(pipeline.transform, df, repeat=repeat),
+    }
+
+
+def synthetic_retail_data(n_rows, n_brands=11, n_weeks=121, seed=0):
+    """Generate sales and store demographic data shaped like the Orange Juice dataset, with about
+    n_rows rows, e.g. 10613900 rows for a 100 times enlargement of the 106139 rows of yx.csv."""
+    rng = np.random.RandomState(seed)
+    n_stores = max(1, n_rows // (n_brands * n_weeks))
+    keys = np.arange(n_stores * n_brands * n_weeks)
+    keys = keys[rng.rand(len(keys)) < n_rows / len(keys)]
+    n = len(keys)
+    sales = pd.DataFrame(
+        {
+            "store": keys // (n_brands * n_weeks) + 2,
+            "brand": keys // n_weeks % n_brands + 1,
+            "week": keys % n_weeks + 40,
+            "logmove": rng.normal(9, 1, n),
+            "constant": np.ones(n, dtype=np.int64),
+        }
+    )
+    for i in range(1, 12):
+        sales["price" + str(i)] = rng.rand(n)
+    sales["deal"] = rng.randint(0, 2, n)
+    sales["feat"] = rng.rand(n)
+    sales["profit"] = rng.normal(30, 10, n)
+    storedemo = pd.DataFrame(
+        {"STORE": np.arange(n_stores) + 2, "AGE60": rng.rand(n_stores), "INCOME": rng.rand(n_stores)}
+    )
+    return sales, storedemo
+
+
+def bench_retail(n_rows, repeat):
+    """Benchmark the preparation of the retail data in specify_retail_data_schema against the
+    row-wise apply and merge implementation it replaced."""
+    sales, storedemo = synthetic_retail_data(n_rows)
+
+    def apply_and_merge(sales, storedemo):
+        sales["move"] = sales["logmove"].apply(lambda x: round(math.exp(x)) if x > 0 else 0)
+        week_list = range(sales["week"].min(), sales["week"].max() + 1)
+        item_list = list(itertools.product(sales["store"].unique(), sales["brand"].unique(), week_list))
+        item_df = pd.DataFrame.from_records(item_list, columns=["store", "brand", "week"])
+        sales = item_df.merge(sales, how="left", on=["store", "brand", "week"])
+        df = sales.merge(storedemo, how="left", left_on="store", right_on="STORE")
+        df.drop("STORE", axis=1, inplace=True)
+        df["timestamp"] = df["week"].apply(lambda x: FIRST_WEEK_START + datetime.timedelta(days=(x - 1) * 7))
+        return df
+
+    return {
+        "apply + merge (legacy)": time_call(apply_and_merge, sales, storedemo, repeat=repeat),
+        "_prepare_retail_data": time_call(_prepare_retail_data, sales, storedemo, repeat=repeat),
+    }
+
+
+SUITES = {
+    "calendar": bench_calendar,
+    "fourier": bench_fourier,
+    "dedup": bench_dedup,
+    "datetime": bench_datetime,
+    "pipeline": bench_pipeline,
+    "retail": bench_retail,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--suite", choices=sorted(SUITES), default="calendar", help="benchmark suite to run")
+    parser.add_argument(
+        "--sizes", type=str, default="1000000,10000000,50000000", help="comma separated numbers of rows"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions per measurement")
+    args = parser.parse_args()
+
+    print("{:<32}{:>12}{:>12}{:>14}".format("function", "rows", "seconds", "ns per row"))
+    for n_rows in [int(x) for x in args.sizes.split(",")]:
+        for name, seconds in SUITES[args.suite](n_rows, args.repeat).items():
+            print("{:<32}{:>12}{:>12.3f}{:>14.2f}".format(name, n_rows, seconds, seconds / n_rows * 1e9))